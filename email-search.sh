@@ -16,6 +16,7 @@ if [[ $# -eq 0 ]]; then
     echo "  --limit=N          Maximum number of results (default: 10)"
     echo "  --no-html          Skip HTML output generation"
     echo "  --no-open          Don't automatically open HTML in browser"
+    echo "  --no-cache         Ask Claude again instead of reusing cached answers"
     echo ""
     echo "Examples:"
     echo "  $0 \"what did Sarah say about the budget?\""
@@ -35,7 +35,7 @@ while [[ $# -gt 0 ]]; do
             echo "Options:"
             echo "  --since <duration>   How far back to look (default: 1d)"
             echo "  --no-cache           Disable caching (re-classify everything)"
-            echo "  --concurrency N      Max concurrent Claude requests (default: 5)"
+            echo "  --concurrency N      Initial concurrent Claude requests (default: 5)"
             echo ""
             echo "Duration formats: 1h, 12h, 1d, 2d, 7d, 1w, 2w, 1mo"
             exit 0
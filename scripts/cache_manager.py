@@ -2,7 +2,12 @@
 # ABOUTME: SQLite cache for email classification results
 # ABOUTME: Avoids redundant Claude calls for previously processed emails
 
+import atexit
+import hashlib
+import queue
 import sqlite3
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import Optional
@@ -11,6 +16,16 @@ import json
 # Default cache location
 CACHE_DB_PATH = Path.home() / "MAIL" / "classification_cache.sqlite"
 
+# Per-connection tuning. WAL makes synchronous=NORMAL crash-safe and lets
+# readers proceed while a write is in progress.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+)
+
 
 def get_cache_key(item: dict) -> str:
     """Generate a cache key for an email item (single or thread).
@@ -31,30 +46,165 @@ def get_cache_key(item: dict) -> str:
         return f"msg:{messages[0].get('message_num', 0)}"
 
 
-def init_cache_db(db_path: Path = CACHE_DB_PATH) -> None:
-    """Initialize the cache database with required tables."""
-    db_path.parent.mkdir(parents=True, exist_ok=True)
+def get_content_cache_key(item: dict) -> str:
+    """Generate a content-based cache key for a single email.
+
+    Hashes sender, subject and the first 2000 body characters, so identical
+    emails (recurring notifications, resends) share a cached result across
+    runs even though their message_nums differ. Threads return "".
+    """
+    messages = item.get("messages", [])
+    if not messages or item.get("is_thread"):
+        return ""
+
+    email = messages[0]
+    content = "\0".join((
+        email.get("from_email", ""),
+        email.get("subject", ""),
+        email.get("body_preview", "")[:2000],
+    ))
+    return "content:" + hashlib.blake2b(content.encode(), digest_size=16).hexdigest()
+
+
+# Keys per IN (...) query; stays under SQLite's default 999-parameter limit
+LOOKUP_CHUNK_SIZE = 900
+
+
+def hash_cache_key(cache_key: str) -> int:
+    """Hash a cache key to the signed 64-bit integer used as the row id.
+
+    The row id is the table's primary key, so rows are looked up by a single
+    integer btree seek instead of a separate TEXT key index.
+    """
+    digest = hashlib.blake2b(cache_key.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little", signed=True)
+
+# Open connections, one per database file, reused across calls
+_connections: dict[Path, sqlite3.Connection] = {}
 
-    conn = sqlite3.connect(db_path)
+# Database files whose schema has been created/migrated by this process
+_initialized: set[Path] = set()
+
+# Serializes opening connections and every write on them. The shared
+# connection is autocommit, so without it one thread's statements could land
+# inside (or be rolled back with) another thread's BEGIN ... COMMIT.
+# Reentrant because schema setup opens the connection and may migrate.
+_lock = threading.RLock()
+
+
+def _configure(conn: sqlite3.Connection) -> sqlite3.Connection:
+    """Apply performance PRAGMAs to a freshly opened connection."""
+    for pragma in CONNECTION_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+def _get_conn(db_path: Path) -> sqlite3.Connection:
+    """Return the shared connection for db_path, opening it on first use.
+
+    The connection runs in autocommit mode; multi-statement writes issue
+    their own BEGIN/COMMIT.
+    """
+    conn = _connections.get(db_path)
+    if conn is None:
+        with _lock:
+            conn = _connections.get(db_path)
+            if conn is None:
+                conn = sqlite3.connect(
+                    db_path,
+                    isolation_level=None,
+                    check_same_thread=False,
+                    cached_statements=256,
+                )
+                conn.row_factory = sqlite3.Row
+                conn.create_function("hash_cache_key", 1, hash_cache_key, deterministic=True)
+                _configure(conn)
+                _connections[db_path] = conn
+    return conn
+
+
+def close_connections() -> None:
+    """Close all shared connections."""
+    with _lock:
+        _initialized.clear()
+        while _connections:
+            _, conn = _connections.popitem()
+            conn.close()
+
+
+atexit.register(close_connections)
+
+
+# Rows are keyed by hash_cache_key(cache_key); the text key is kept to detect
+# hash collisions on read. cost_microusd mirrors cost_usd as an integer so
+# stats can sum in integer arithmetic.
+_COST_MICROUSD_SQL = "cost_microusd INTEGER GENERATED ALWAYS AS (CAST(ROUND(cost_usd * 1000000) AS INTEGER)) VIRTUAL"
+
+_CREATE_TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS classification_cache (
+        key_hash INTEGER PRIMARY KEY,
+        cache_key TEXT NOT NULL,
+        category TEXT NOT NULL,
+        summary TEXT NOT NULL,
+        action_items TEXT,
+        cost_usd REAL DEFAULT 0.0,
+        model_version TEXT,
+        classified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        {_COST_MICROUSD_SQL}
+    )
+"""
+
+
+# Single upsert statement shared by every write path, so the connection's
+# statement cache prepares it once per process
+_INSERT_SQL = """
+    INSERT OR REPLACE INTO classification_cache
+    (key_hash, cache_key, category, summary, action_items, cost_usd, model_version, classified_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _migrate_text_key_table(conn: sqlite3.Connection) -> None:
+    """Rebuild a cache table keyed by TEXT cache_key into the hashed layout."""
+    conn.execute("BEGIN IMMEDIATE")
     try:
+        conn.execute("ALTER TABLE classification_cache RENAME TO classification_cache_old")
+        conn.execute(_CREATE_TABLE_SQL)
         conn.execute("""
-            CREATE TABLE IF NOT EXISTS classification_cache (
-                cache_key TEXT PRIMARY KEY,
-                category TEXT NOT NULL,
-                summary TEXT NOT NULL,
-                action_items TEXT,
-                cost_usd REAL DEFAULT 0.0,
-                model_version TEXT,
-                classified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_cache_date
-            ON classification_cache(classified_at)
+            INSERT OR REPLACE INTO classification_cache
+            (key_hash, cache_key, category, summary, action_items, cost_usd, model_version, classified_at)
+            SELECT hash_cache_key(cache_key), cache_key, category, summary, action_items,
+                   cost_usd, model_version, classified_at
+            FROM classification_cache_old
         """)
-        conn.commit()
-    finally:
-        conn.close()
+        # Drops the old table's indexes with it
+        conn.execute("DROP TABLE classification_cache_old")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def init_cache_db(db_path: Path = CACHE_DB_PATH) -> None:
+    """Initialize the cache database with required tables."""
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with _lock:
+        conn = _get_conn(db_path)
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(classification_cache)")}
+        if columns and "key_hash" not in columns:
+            _migrate_text_key_table(conn)
+        elif columns and "cost_microusd" not in columns:
+            conn.execute(f"ALTER TABLE classification_cache ADD COLUMN {_COST_MICROUSD_SQL}")
+        else:
+            conn.execute(_CREATE_TABLE_SQL)
+        _initialized.add(db_path)
+
+
+def _ensure_schema(db_path: Path) -> None:
+    """Run init_cache_db once per process (and per open connection) for db_path."""
+    if db_path not in _initialized:
+        init_cache_db(db_path)
 
 
 def lookup_cache(
@@ -68,25 +218,60 @@ def lookup_cache(
     if not cache_key or not db_path.exists():
         return None
 
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    try:
+    _ensure_schema(db_path)
+    cursor = _get_conn(db_path).execute(
+        "SELECT cache_key, category, summary, action_items, cost_usd "
+        "FROM classification_cache WHERE key_hash = ?",
+        (hash_cache_key(cache_key),)
+    )
+    row = cursor.fetchone()
+    if row and row["cache_key"] == cache_key:
+        return {
+            "category": row["category"],
+            "summary": row["summary"],
+            "action_items": row["action_items"],
+            "cost_usd": row["cost_usd"],
+            "from_cache": True
+        }
+    return None
+
+
+def lookup_cache_bulk(
+    cache_keys: list[str],
+    db_path: Path = CACHE_DB_PATH
+) -> dict[str, dict]:
+    """Look up many cached classification results at once.
+
+    Returns a dict mapping each found cache_key to the same shape lookup_cache()
+    returns. Missing keys are simply absent.
+    """
+    keys = list(dict.fromkeys(k for k in cache_keys if k))
+    if not keys or not db_path.exists():
+        return {}
+
+    _ensure_schema(db_path)
+    conn = _get_conn(db_path)
+    wanted = set(keys)
+    found = {}
+    for start in range(0, len(keys), LOOKUP_CHUNK_SIZE):
+        chunk = keys[start:start + LOOKUP_CHUNK_SIZE]
+        placeholders = ",".join("?" * len(chunk))
         cursor = conn.execute(
-            "SELECT category, summary, action_items, cost_usd FROM classification_cache WHERE cache_key = ?",
-            (cache_key,)
+            "SELECT cache_key, category, summary, action_items, cost_usd "
+            f"FROM classification_cache WHERE key_hash IN ({placeholders})",
+            [hash_cache_key(k) for k in chunk]
         )
-        row = cursor.fetchone()
-        if row:
-            return {
+        for row in cursor:
+            if row["cache_key"] not in wanted:
+                continue  # Hash collision with a different key
+            found[row["cache_key"]] = {
                 "category": row["category"],
                 "summary": row["summary"],
                 "action_items": row["action_items"],
                 "cost_usd": row["cost_usd"],
                 "from_cache": True
             }
-        return None
-    finally:
-        conn.close()
+    return found
 
 
 def save_to_cache(
@@ -102,21 +287,117 @@ def save_to_cache(
     if not cache_key:
         return
 
-    init_cache_db(db_path)
+    _ensure_schema(db_path)
 
-    conn = sqlite3.connect(db_path)
-    try:
+    conn = _get_conn(db_path)
+    with _lock:
         conn.execute(
-            """
-            INSERT OR REPLACE INTO classification_cache
-            (cache_key, category, summary, action_items, cost_usd, model_version, classified_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-            """,
-            (cache_key, category, summary, action_items, cost_usd, model_version, datetime.now().isoformat())
+            _INSERT_SQL,
+            (hash_cache_key(cache_key), cache_key, category, summary, action_items, cost_usd,
+             model_version, datetime.now().isoformat())
         )
-        conn.commit()
-    finally:
-        conn.close()
+
+
+def save_many_to_cache(
+    rows: list[tuple],
+    db_path: Path = CACHE_DB_PATH
+) -> int:
+    """Save many classification results in a single transaction.
+
+    Each row is (cache_key, category, summary, action_items, cost_usd,
+    model_version, classified_at). Rows with an empty cache_key are skipped.
+    Returns the number of rows written.
+    """
+    rows = [row for row in rows if row and row[0]]
+    if not rows:
+        return 0
+
+    _ensure_schema(db_path)
+
+    conn = _get_conn(db_path)
+    with _lock:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(_INSERT_SQL, ((hash_cache_key(row[0]), *row) for row in rows))
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+    return len(rows)
+
+
+class CacheWriter:
+    """Background thread that writes cache rows in batched transactions.
+
+    put() never blocks on disk I/O; the writer commits up to batch_size rows
+    at a time, or whatever has arrived after flush_interval seconds. close()
+    flushes the remaining rows, stops the thread, and re-raises any write error.
+    """
+
+    def __init__(
+        self,
+        db_path: Path = CACHE_DB_PATH,
+        batch_size: int = 32,
+        flush_interval: float = 0.25,
+    ):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.rows_written = 0
+        self.error: Exception | None = None
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="cache-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, row: tuple) -> None:
+        """Queue a (cache_key, category, summary, action_items, cost_usd,
+        model_version, classified_at) row for writing."""
+        self._queue.put(row)
+
+    def close(self) -> None:
+        """Flush pending rows and wait for the writer thread to finish."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        if self.error:
+            raise self.error
+
+    def __enter__(self) -> "CacheWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def _run(self) -> None:
+        done = False
+        while not done:
+            batch = []
+            row = self._queue.get()
+            if row is None:
+                break
+            batch.append(row)
+
+            # Gather more rows until the batch fills or the interval lapses
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    row = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if row is None:
+                    done = True
+                    break
+                batch.append(row)
+
+            if self.error:
+                continue  # Keep draining so close() doesn't hang
+            try:
+                self.rows_written += save_many_to_cache(batch, self.db_path)
+            except Exception as e:
+                self.error = e
 
 
 def get_cache_stats(db_path: Path = CACHE_DB_PATH) -> dict:
@@ -126,28 +407,28 @@ def get_cache_stats(db_path: Path = CACHE_DB_PATH) -> dict:
             "total_entries": 0,
             "total_cost_usd": 0.0,
             "oldest_entry": None,
-            "newest_entry": None
+            "newest_entry": None,
+            "by_category": {}
         }
 
-    conn = sqlite3.connect(db_path)
-    try:
-        cursor = conn.execute("SELECT COUNT(*) FROM classification_cache")
-        total = cursor.fetchone()[0]
-
-        cursor = conn.execute("SELECT SUM(cost_usd) FROM classification_cache")
-        cost = cursor.fetchone()[0] or 0.0
+    _ensure_schema(db_path)
+    conn = _get_conn(db_path)
+    total, cost_microusd, oldest, newest = conn.execute(
+        "SELECT COUNT(*), SUM(cost_microusd), MIN(classified_at), MAX(classified_at) "
+        "FROM classification_cache"
+    ).fetchone()
 
-        cursor = conn.execute("SELECT MIN(classified_at), MAX(classified_at) FROM classification_cache")
-        dates = cursor.fetchone()
+    by_category = dict(conn.execute(
+        "SELECT category, COUNT(*) FROM classification_cache GROUP BY category ORDER BY COUNT(*) DESC"
+    ).fetchall())
 
-        return {
-            "total_entries": total,
-            "total_cost_usd": cost,
-            "oldest_entry": dates[0],
-            "newest_entry": dates[1]
-        }
-    finally:
-        conn.close()
+    return {
+        "total_entries": total,
+        "total_cost_usd": (cost_microusd or 0) / 1_000_000,
+        "oldest_entry": oldest,
+        "newest_entry": newest,
+        "by_category": by_category
+    }
 
 
 def clear_cache(db_path: Path = CACHE_DB_PATH) -> int:
@@ -155,15 +436,12 @@ def clear_cache(db_path: Path = CACHE_DB_PATH) -> int:
     if not db_path.exists():
         return 0
 
-    conn = sqlite3.connect(db_path)
-    try:
-        cursor = conn.execute("SELECT COUNT(*) FROM classification_cache")
-        count = cursor.fetchone()[0]
+    _ensure_schema(db_path)
+    conn = _get_conn(db_path)
+    with _lock:
+        count = conn.execute("SELECT COUNT(*) FROM classification_cache").fetchone()[0]
         conn.execute("DELETE FROM classification_cache")
-        conn.commit()
-        return count
-    finally:
-        conn.close()
+    return count
 
 
 def main():
@@ -182,6 +460,8 @@ def main():
         print(f"  Total cost: ${stats['total_cost_usd']:.4f}")
         if stats['oldest_entry']:
             print(f"  Date range: {stats['oldest_entry']} to {stats['newest_entry']}")
+            for category, count in stats['by_category'].items():
+                print(f"  {category}: {count:,}")
         else:
             print(f"  Cache is empty")
 
@@ -3,12 +3,61 @@
 # ABOUTME: Usage: uv run scripts/classify_emails.py --input parsed.json --output classified.json
 
 import argparse
-import json
+import operator
 import os
+import re
 import subprocess
 import sys
+from collections.abc import Iterator, Mapping
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import orjson
 from anthropic import Anthropic
 
+from claude_client import parse_json_response
+from label_rules import category_from_labels, template_summary
+
+
+# Static instructions shared by every batch. Sent as its own content block
+# marked for prompt caching so repeat batches reuse the cached prefix.
+CLASSIFY_INSTRUCTIONS = """Analyze each email and provide classification and summary.
+
+For each email, respond with a JSON array where each element has:
+- "index": the email number (1-based)
+- "category": one of URGENT | NEEDS_RESPONSE | FYI
+- "summary": 1-2 sentences describing the actual content (NOT just the subject line)
+- "action_items": any requests, deadlines, or required actions (or null)
+
+Classification rules:
+- URGENT: Contains "urgent", "ASAP", "deadline", "by EOD", "action required", or time-sensitive requests
+- NEEDS_RESPONSE: Direct questions to recipient, "please respond", "let me know", "what do you think"
+- FYI: Everything else - informational, announcements, updates
+
+Respond with ONLY valid JSON array, no other text."""
+
+
+# Body characters sent to the LLM per email. Slicing a str copies at most this
+# many code points (and returns the string itself when it is shorter), so this
+# is cheaper than encoding the whole body to bytes and trimming those.
+MAX_BODY_CHARS = 2000
+
+# Per-email block in the batch prompt: index, from name, from email, subject, body
+EMAIL_TEMPLATE = "\n---EMAIL %d---\nFrom: %s <%s>\nSubject: %s\nBody:\n%s\n"
+
+# Shared read-only stand-in for emails missing from the raw file
+_EMPTY = MappingProxyType({})
+
+# Phrases from the classification rules that are unambiguous enough to skip the
+# LLM. One alternation with a named group per category, so a single scan over
+# the text finds every matching category.
+KEYWORD_PATTERN = re.compile(
+    r"\b(?:"
+    r"(?P<URGENT>urgent|asap|deadline|by eod|action required)"
+    r"|(?P<NEEDS_RESPONSE>please respond|let me know|what do you think)"
+    r")\b",
+    re.IGNORECASE,
+)
+
 
 def get_api_key() -> str:
     """Get Anthropic API key from environment or pass."""
@@ -36,90 +85,111 @@ def get_api_key() -> str:
     print("Set ANTHROPIC_API_KEY or store in: pass API_KEYS/anthropic", file=sys.stderr)
     sys.exit(1)
 
+def iter_parsed_emails(path: str) -> Iterator[dict]:
+    """Yield parsed emails from a JSONL file (one per line) or a JSON list.
+
+    JSONL input is streamed line by line so only one email is decoded at a time.
+    """
+    with open(path, "rb") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield orjson.loads(line)
+        else:
+            yield from orjson.loads(f.read())
+
+def merge_email(parsed: dict, raw_email: Mapping) -> dict:
+    """Combine a parsed email with its raw record (Gmail link, labels, date)."""
+    get = parsed.get
+    get_raw = raw_email.get
+    return {
+        "message_num": get("message_num"),
+        "uid": get_raw("uid", ""),
+        "gmail_link": get_raw("gmail_link", ""),
+        "from_name": get("from_name", ""),
+        "from_email": get("from_email", ""),
+        "subject": get("subject", ""),
+        "date": get_raw("date", get("date", "")) or "",
+        "labels": get_raw("labels", ""),
+        "body_preview": get("body_preview", ""),
+    }
+
 def classify_by_labels(email: dict) -> str | None:
     """Pre-classify emails based on Gmail labels."""
-    labels = email.get("labels", "")
-    if "CATEGORY_PROMOTIONS" in labels:
-        return "NEWSLETTER"
-    if "CATEGORY_UPDATES" in labels:
-        return "AUTOMATED"
+    return category_from_labels(email.get("labels", ""))
+
+def classify_by_keywords(email: dict) -> str | None:
+    """Pre-classify URGENT/NEEDS_RESPONSE emails from rule keywords.
+
+    Scans subject and body preview once. Returns None when nothing matches or
+    when phrases from both categories appear, leaving the call to the LLM.
+    """
+    text = f"{email.get('subject', '')}\n{email.get('body_preview', '')}"
+    categories = {m.lastgroup for m in KEYWORD_PATTERN.finditer(text)}
+    if len(categories) == 1:
+        return categories.pop()
     return None
 
 def generate_template_summary(email: dict, category: str) -> str:
-    """Generate template summary for NEWSLETTER/AUTOMATED emails."""
-    from_name = email.get("from_name", "Unknown")
-    subject = email.get("subject", "")
-
-    if category == "NEWSLETTER":
-        return f"Marketing email from {from_name} about {subject}"
-    else:  # AUTOMATED
-        return f"Notification from {from_name}: {subject}"
+    """Generate template summary for emails classified without the LLM."""
+    return template_summary(email, category)
 
 def summarize_with_llm(emails: list[dict], client: Anthropic) -> list[dict]:
-    """Use Claude Haiku to classify and summarize emails."""
+    """Use Claude Haiku to classify and summarize emails.
+
+    Emails that already carry a category (from keyword rules) keep it; only
+    their summary and action items come from the LLM.
+    """
     if not emails:
         return []
 
-    # Build prompt with all emails
-    email_texts = []
-    for i, email in enumerate(emails):
-        body = email.get("body_preview", "")[:2000]  # Truncate long bodies
-        email_texts.append(f"""
----EMAIL {i+1}---
-From: {email.get('from_name', 'Unknown')} <{email.get('from_email', '')}>
-Subject: {email.get('subject', '')}
-Body:
-{body}
-""")
-
-    prompt = f"""Analyze each email and provide classification and summary.
-
-For each email, respond with a JSON array where each element has:
-- "index": the email number (1-based)
-- "category": one of URGENT | NEEDS_RESPONSE | FYI
-- "summary": 1-2 sentences describing the actual content (NOT just the subject line)
-- "action_items": any requests, deadlines, or required actions (or null)
-
-Classification rules:
-- URGENT: Contains "urgent", "ASAP", "deadline", "by EOD", "action required", or time-sensitive requests
-- NEEDS_RESPONSE: Direct questions to recipient, "please respond", "let me know", "what do you think"
-- FYI: Everything else - informational, announcements, updates
-
-EMAILS:
-{''.join(email_texts)}
+    # Build prompt with all emails (bodies truncated)
+    emails_text = "".join(
+        EMAIL_TEMPLATE % (
+            i,
+            email.get("from_name", "Unknown"),
+            email.get("from_email", ""),
+            email.get("subject", ""),
+            email.get("body_preview", "")[:MAX_BODY_CHARS],
+        )
+        for i, email in enumerate(emails, 1)
+    )
 
-Respond with ONLY valid JSON array, no other text."""
+    content = [
+        {
+            "type": "text",
+            "text": CLASSIFY_INSTRUCTIONS,
+            "cache_control": {"type": "ephemeral"},
+        },
+        {
+            "type": "text",
+            "text": "EMAILS:\n" + emails_text,
+        },
+    ]
 
     response = client.messages.create(
         model="claude-haiku-4-20250514",
         max_tokens=4096,
-        messages=[{"role": "user", "content": prompt}]
+        messages=[{"role": "user", "content": content}]
     )
 
     # Parse response
     try:
-        text = response.content[0].text
-        # Handle potential markdown code blocks
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0]
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0]
-
-        results = json.loads(text)
+        results = parse_json_response(response.content[0].text)
 
         # Merge results back into emails
         result_map = {r["index"]: r for r in results}
         for i, email in enumerate(emails):
             r = result_map.get(i + 1, {})
-            email["category"] = r.get("category", "FYI")
+            email["category"] = email.get("category") or r.get("category", "FYI")
             email["summary"] = r.get("summary", f"{email.get('from_name', 'Unknown')}: {email.get('subject', '')}")
             email["action_items"] = r.get("action_items")
 
-    except (json.JSONDecodeError, KeyError, IndexError) as e:
+    except (ValueError, KeyError, IndexError) as e:
         print(f"Warning: Failed to parse LLM response: {e}", file=sys.stderr)
         # Fallback to template summaries
         for email in emails:
-            email["category"] = "FYI"
+            email["category"] = email.get("category") or "FYI"
             email["summary"] = f"{email.get('from_name', 'Unknown')}: {email.get('subject', '')}"
             email["action_items"] = None
 
@@ -127,38 +197,27 @@ Respond with ONLY valid JSON array, no other text."""
 
 def main():
     parser = argparse.ArgumentParser(description="Classify and summarize emails")
-    parser.add_argument("--input", required=True, help="Input JSON file with parsed emails")
+    parser.add_argument("--input", required=True, help="Input JSON or JSONL file with parsed emails")
     parser.add_argument("--output", required=True, help="Output JSON file for classified emails")
     parser.add_argument("--raw", required=True, help="Raw emails JSON with Gmail links and labels")
+    parser.add_argument("--concurrency", type=int, default=5, help="Max concurrent Haiku requests (default: 5)")
+    parser.add_argument("--rules-skip-claude", action="store_true",
+                        help="Give keyword-matched emails a template summary instead of sending them to Haiku")
     args = parser.parse_args()
 
-    # Load parsed emails
-    with open(args.input) as f:
-        parsed = json.load(f)
-
     # Load raw emails for labels and Gmail links
-    with open(args.raw) as f:
-        raw = json.load(f)
+    with open(args.raw, "rb") as f:
+        raw = orjson.loads(f.read())
 
     # Create lookup by message_num
     raw_lookup = {e["message_num"]: e for e in raw["emails"]}
 
-    # Merge parsed data with raw data
-    emails = []
-    for p in parsed:
-        msg_num = p.get("message_num")
-        raw_email = raw_lookup.get(msg_num, {})
-        emails.append({
-            "message_num": msg_num,
-            "uid": raw_email.get("uid", ""),
-            "gmail_link": raw_email.get("gmail_link", ""),
-            "from_name": p.get("from_name", ""),
-            "from_email": p.get("from_email", ""),
-            "subject": p.get("subject", ""),
-            "date": raw_email.get("date", p.get("date", "")),
-            "labels": raw_email.get("labels", ""),
-            "body_preview": p.get("body_preview", ""),
-        })
+    # Merge parsed data (streamed) with raw data
+    get_raw = raw_lookup.get
+    emails = [
+        merge_email(p, get_raw(p.get("message_num"), _EMPTY))
+        for p in iter_parsed_emails(args.input)
+    ]
 
     # Classify emails
     needs_llm = []
@@ -166,6 +225,14 @@ def main():
 
     for email in emails:
         category = classify_by_labels(email)
+        if category is None:
+            # Keyword matches fix the category, but Haiku still writes the
+            # summary and action items unless --rules-skip-claude is set
+            category = classify_by_keywords(email)
+            if category and not args.rules_skip_claude:
+                email["category"] = category
+                needs_llm.append(email)
+                continue
         if category:
             email["category"] = category
             email["summary"] = generate_template_summary(email, category)
@@ -180,17 +247,22 @@ def main():
         api_key = get_api_key()
         client = Anthropic(api_key=api_key)
 
-        # Process in batches of 10
+        # Process in batches of 10, several batches in flight at once
         batch_size = 10
-        for i in range(0, len(needs_llm), batch_size):
-            batch = needs_llm[i:i+batch_size]
-            summarize_with_llm(batch, client)
-            print(f"   Processed {min(i+batch_size, len(needs_llm))}/{len(needs_llm)}", file=sys.stderr)
+        batches = [needs_llm[i:i+batch_size] for i in range(0, len(needs_llm), batch_size)]
+        processed = 0
+
+        with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as executor:
+            futures = [executor.submit(summarize_with_llm, batch, client) for batch in batches]
+            for future in as_completed(futures):
+                processed += len(future.result())
+                print(f"   Processed {processed}/{len(needs_llm)}", file=sys.stderr)
 
         classified.extend(needs_llm)
 
     # Sort by date descending
-    classified.sort(key=lambda x: x.get("date", ""), reverse=True)
+    # merge_email always sets a string "date", so no .get() fallback is needed
+    classified.sort(key=operator.itemgetter("date"), reverse=True)
 
     # Remove body_preview and labels from output
     for email in classified:
@@ -198,8 +270,8 @@ def main():
         email.pop("labels", None)
 
     # Write output
-    with open(args.output, "w") as f:
-        json.dump({"emails": classified}, f, indent=2)
+    with open(args.output, "wb") as f:
+        f.write(orjson.dumps({"emails": classified}, option=orjson.OPT_INDENT_2))
 
     # Print stats
     categories = {}
@@ -4,17 +4,90 @@
 
 import argparse
 import asyncio
-import json
+import hashlib
+import re
 import sys
+import time
+from collections import Counter
+from datetime import datetime
 from pathlib import Path
 
+import orjson
+
 from claude_client import (
-    query_claude_batch,
+    query_claude_stream,
+    query_claude_message_batch,
     parse_json_response,
     ClaudeQueryError,
     DEFAULT_MODEL,
+    LOOP_FACTORY,
 )
-from cache_manager import get_cache_key, lookup_cache, save_to_cache, init_cache_db
+from label_rules import category_from_labels, template_summary
+from cache_manager import get_cache_key, get_content_cache_key, lookup_cache_bulk, init_cache_db, CacheWriter
+
+
+# Phrases the URGENT rule keys on; decisive only when Gmail labels give no
+# category, so promotional "urgent" mail stays a newsletter
+URGENT_RE = re.compile(r"\b(?:urgent|asap|by eod|action required|deadline)\b", re.IGNORECASE)
+
+# Sender domains (and their subdomains) that are always FINANCIAL
+FINANCIAL_SENDERS = frozenset({
+    "chase.com",
+    "ally.com",
+    "vanguard.com",
+    "fidelity.com",
+    "schwab.com",
+    "americanexpress.com",
+    "capitalone.com",
+    "bankofamerica.com",
+    "wellsfargo.com",
+    "citi.com",
+})
+
+# Google Calendar's notification sender and invitation subject prefixes
+CALENDAR_SENDER = "calendar-notification@google.com"
+CALENDAR_SUBJECT_PREFIXES = ("invitation:", "updated invitation:", "canceled event:", "cancelled event:")
+
+
+def classify_by_rules(item: dict) -> str | None:
+    """Pre-classify FINANCIAL/CALENDAR from the sender and subject.
+
+    Checks the most recent message only. Returns None when no rule is
+    decisive, leaving the category to Gmail labels or Claude.
+    """
+    messages = item.get("messages", [])
+    if not messages:
+        return None
+
+    msg = messages[-1]
+    from_email = (msg.get("from_email") or "").lower()
+    subject = msg.get("subject") or item.get("subject") or ""
+
+    if from_email == CALENDAR_SENDER or subject.lower().startswith(CALENDAR_SUBJECT_PREFIXES):
+        return "CALENDAR"
+
+    domain = from_email.rpartition("@")[2]
+    if domain in FINANCIAL_SENDERS or ".".join(domain.rsplit(".", 2)[-2:]) in FINANCIAL_SENDERS:
+        return "FINANCIAL"
+
+    return None
+
+
+def classify_by_keywords(item: dict) -> str | None:
+    """Pre-classify URGENT from keywords in the latest subject or body.
+
+    Only consulted when neither the sender rules nor Gmail labels decide.
+    """
+    messages = item.get("messages", [])
+    if not messages:
+        return None
+
+    msg = messages[-1]
+    subject = msg.get("subject") or item.get("subject") or ""
+    if URGENT_RE.search(subject) or URGENT_RE.search(msg.get("body_preview") or ""):
+        return "URGENT"
+
+    return None
 
 
 def classify_by_labels(item: dict) -> str | None:
@@ -28,125 +101,246 @@ def classify_by_labels(item: dict) -> str | None:
         return None
 
     # Use most recent message for label check
-    email = messages[-1]
-    labels = email.get("labels", "")
+    return category_from_labels(messages[-1].get("labels", ""))
 
-    if "CATEGORY_PROMOTIONS" in labels:
-        return "NEWSLETTER"
-    if "CATEGORY_UPDATES" in labels:
-        return "AUTOMATED"
-    return None
 
+# Minimum seconds between progress lines while a batch is running
+PROGRESS_INTERVAL = 0.25
 
-def build_summarize_prompt(item: dict) -> str:
-    """Build a summary-only prompt for an item (when category is known from labels)."""
-    is_thread = item.get("is_thread", False)
-    messages = item.get("messages", [])
+# truncate_text() may back off at most 1/N of the limit to end on a boundary
+TRUNCATE_MAX_BACKOFF = 4
 
-    if is_thread:
-        subject = item.get("subject", "")
-        participants = item.get("participants", [])
+# Per-message fields only needed for classification or threading, dropped
+# from the output. A drop list, so fields render_brief reads are never
+# stripped by accident.
+OUTPUT_DROP_KEYS = frozenset({
+    "body_preview", "labels", "references", "filepath", "body_length",
+    "to", "message_id", "in_reply_to", "uid",
+})
 
-        # Build thread content
-        thread_content = []
-        for msg in messages[-3:]:  # Last 3 messages for context
-            from_name = msg.get("from_name", "Unknown")
-            body = msg.get("body_preview", "")[:500]
-            thread_content.append(f"[{from_name}]: {body}")
+# Static instructions, sent as the system prompt ahead of the per-item content
+# so repeated calls share a cacheable prefix
+CLASSIFICATION_RULES = """CLASSIFICATION RULES:
+- URGENT: Contains "urgent", "ASAP", "deadline", "by EOD", "action required", time-sensitive
+- NEEDS_RESPONSE: Direct questions to recipient, "please respond", "let me know", "what do you think"
+- CALENDAR: Calendar invitations, event updates, meeting requests, from Google Calendar
+- FINANCIAL: From banks/brokerages (Chase, Ally, Vanguard, Fidelity, etc.), bills, statements, balance alerts
+- FYI: Everything else - informational, no action needed"""
 
-        combined = "\n---\n".join(thread_content)
-        if len(combined) > 2000:
-            combined = combined[:2000] + "..."
+CLASSIFY_SYSTEM_PROMPT = f"""Classify the email or email thread in the user message and provide a JSON response.
 
-        return f"""Summarize this email thread in ONE sentence. Focus on the key topic and outcome.
+{CLASSIFICATION_RULES}
 
-Subject: {subject}
-Participants: {', '.join(participants)}
+For a thread, summarize the ENTIRE conversation (not just the last message). What is this thread about?
 
-{combined}
+Respond with ONLY this JSON (no markdown, no explanation):
+{{"category": "CATEGORY", "summary": "1-2 sentence summary of the actual content", "action_items": "any actions needed or null"}}"""
 
-Respond with ONLY the summary sentence, no quotes or prefix."""
-    else:
-        email = messages[0]
-        from_name = email.get("from_name", "Unknown")
-        subject = email.get("subject", "")
-        body = email.get("body_preview", "")[:1500]
+# Shape of a CLASSIFY_SYSTEM_PROMPT reply. With an API key the model must
+# answer through a tool with this input schema, so replies always parse.
+CLASSIFICATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "category": {"type": "string", "enum": ["URGENT", "NEEDS_RESPONSE", "CALENDAR", "FINANCIAL", "FYI"]},
+        "summary": {"type": "string", "description": "1-2 sentence summary of the actual content"},
+        "action_items": {"type": ["string", "null"], "description": "any actions needed or null"},
+    },
+    "required": ["category", "summary", "action_items"],
+}
+
+# Several single emails classified in one request (see group_prompts)
+GROUP_CLASSIFY_SYSTEM_PROMPT = f"""Classify each numbered email in the user message and provide a JSON response.
 
-        return f"""Summarize this email in ONE sentence. Focus on the key information or action.
+{CLASSIFICATION_RULES}
 
-From: {from_name}
-Subject: {subject}
-Body:
-{body}
+Respond with ONLY a JSON array with one object per email, in order (no markdown, no explanation):
+[{{"id": 1, "category": "CATEGORY", "summary": "1-2 sentence summary of the actual content", "action_items": "any actions needed or null"}}, ...]"""
+
+SUMMARY_SYSTEM_PROMPT = """Summarize the email or email thread in the user message in ONE sentence.
+For a single email, focus on the key information or action. For a thread, focus on the key topic and outcome.
 
 Respond with ONLY the summary sentence, no quotes or prefix."""
 
+# Per-item user content, filled with %-formatting. Thread templates take the
+# subject, participants (and message count) and the joined message blocks.
+SUMMARY_THREAD_TEMPLATE = 'EMAIL THREAD: "%s"\nParticipants: %s\n\n%s'
+SUMMARY_EMAIL_TEMPLATE = "EMAIL:\nFrom: %s\nSubject: %s\nBody:\n%s"
+SUMMARY_MESSAGE_TEMPLATE = "[%s]: %s"
+CLASSIFY_THREAD_TEMPLATE = 'EMAIL THREAD: "%s"\nParticipants: %s\nMessages: %d\n\n%s'
+CLASSIFY_EMAIL_TEMPLATE = "EMAIL:\nFrom: %s <%s>\nSubject: %s\nBody:\n%s"
+CLASSIFY_MESSAGE_TEMPLATE = "[Message %d - From: %s, Date: %s]\n%s"
+GROUP_EMAIL_TEMPLATE = "--- EMAIL %d ---\nFrom: %s <%s>\nSubject: %s\nBody:\n%s"
+
 
-def build_classify_prompt(item: dict) -> str:
-    """Build a full classification prompt for an item."""
+def truncate_text(text: str, limit: int) -> str:
+    """Cut text to at most `limit` characters, ending on a paragraph or sentence.
+
+    Falls back to a hard cut when the last boundary would drop more than a
+    quarter of the allowance.
+    """
+    if len(text) <= limit:
+        return text
+
+    cut = text[:limit]
+    floor = limit - limit // TRUNCATE_MAX_BACKOFF
+    for boundary, keep in (("\n\n", 0), (". ", 1), ("\n", 0)):
+        end = cut.rfind(boundary)
+        if end >= floor:
+            return cut[:end + keep]
+    return cut
+
+
+def build_summarize_prompt(item: dict) -> tuple[str, str]:
+    """Build a summary-only prompt for an item (when category is known from labels).
+
+    Returns:
+        Tuple of (system prompt, item-specific user content)
+    """
     is_thread = item.get("is_thread", False)
     messages = item.get("messages", [])
 
     if is_thread:
-        subject = item.get("subject", "")
-        participants = item.get("participants", [])
-        message_count = len(messages)
+        # Build thread content from the last 3 messages for context
+        combined = "\n---\n".join(
+            SUMMARY_MESSAGE_TEMPLATE % (msg.get("from_name", "Unknown"), truncate_text(msg.get("body_preview", ""), 500))
+            for msg in messages[-3:]
+        )
+        if len(combined) > 2000:
+            combined = combined[:2000] + "..."
+
+        return SUMMARY_SYSTEM_PROMPT, SUMMARY_THREAD_TEMPLATE % (
+            item.get("subject", ""),
+            ", ".join(item.get("participants", [])),
+            combined,
+        )
+    else:
+        email = messages[0]
+        return SUMMARY_SYSTEM_PROMPT, SUMMARY_EMAIL_TEMPLATE % (
+            email.get("from_name", "Unknown"),
+            email.get("subject", ""),
+            truncate_text(email.get("body_preview", ""), 1500),
+        )
+
+
+def build_classify_prompt(item: dict) -> tuple[str, str]:
+    """Build a full classification prompt for an item.
+
+    Returns:
+        Tuple of (system prompt, item-specific user content)
+    """
+    is_thread = item.get("is_thread", False)
+    messages = item.get("messages", [])
 
+    if is_thread:
         # Build thread content (chronological order, truncate each message)
-        thread_content = []
-        for i, msg in enumerate(messages):
-            from_name = msg.get("from_name", "Unknown")
-            date = msg.get("date", "")[:20]
-            body = msg.get("body_preview", "")[:800]
-            thread_content.append(f"[Message {i+1} - From: {from_name}, Date: {date}]\n{body}")
-
-        combined = "\n\n---\n\n".join(thread_content)
+        combined = "\n\n---\n\n".join(
+            CLASSIFY_MESSAGE_TEMPLATE % (
+                i,
+                msg.get("from_name", "Unknown"),
+                msg.get("date", "")[:20],
+                truncate_text(msg.get("body_preview", ""), 800),
+            )
+            for i, msg in enumerate(messages, 1)
+        )
         if len(combined) > 4000:
             combined = combined[:4000] + "\n...[truncated]"
 
-        return f"""Classify this email thread and provide a JSON response.
+        return CLASSIFY_SYSTEM_PROMPT, CLASSIFY_THREAD_TEMPLATE % (
+            item.get("subject", ""),
+            ", ".join(item.get("participants", [])),
+            len(messages),
+            combined,
+        )
+    else:
+        return CLASSIFY_SYSTEM_PROMPT, CLASSIFY_EMAIL_TEMPLATE % _classify_email_fields(messages[0])
 
-EMAIL THREAD: "{subject}"
-Participants: {', '.join(participants)}
-Messages: {message_count}
 
-{combined}
+def _classify_email_fields(email: dict) -> tuple[str, str, str, str]:
+    """From name, from email, subject and truncated body for a classify prompt."""
+    return (
+        email.get("from_name", "Unknown"),
+        email.get("from_email", ""),
+        email.get("subject", ""),
+        truncate_text(email.get("body_preview", ""), 2000),
+    )
 
-CLASSIFICATION RULES:
-- URGENT: Contains "urgent", "ASAP", "deadline", "by EOD", "action required", time-sensitive
-- NEEDS_RESPONSE: Direct questions to recipient, "please respond", "let me know", "what do you think"
-- CALENDAR: Calendar invitations, event updates, meeting requests, from Google Calendar
-- FINANCIAL: From banks/brokerages (Chase, Ally, Vanguard, Fidelity, etc.), bills, statements, balance alerts
-- FYI: Everything else - informational, no action needed
 
-Summarize the ENTIRE conversation (not just the last message). What is this thread about?
+def build_group_classify_prompt(items: list[dict]) -> tuple[str, str]:
+    """Build one classification prompt covering several single-email items.
 
-Respond with ONLY this JSON (no markdown, no explanation):
-{{"category": "CATEGORY", "summary": "1-2 sentence summary of the conversation", "action_items": "any actions needed or null"}}"""
-    else:
-        email = messages[0]
-        from_name = email.get("from_name", "Unknown")
-        from_email = email.get("from_email", "")
-        subject = email.get("subject", "")
-        body = email.get("body_preview", "")[:2000]
+    Emails are numbered from 1; the response is a JSON array keyed by "id".
+    """
+    return GROUP_CLASSIFY_SYSTEM_PROMPT, "\n\n".join(
+        GROUP_EMAIL_TEMPLATE % ((i,) + _classify_email_fields(item["messages"][0]))
+        for i, item in enumerate(items, 1)
+    )
 
-        return f"""Classify this email and provide a JSON response.
 
-EMAIL:
-From: {from_name} <{from_email}>
-Subject: {subject}
-Body:
-{body}
+def group_prompts(prompts: list[tuple], group_size: int) -> list[tuple]:
+    """Pack single-email full classifications into multi-email prompts.
 
-CLASSIFICATION RULES:
-- URGENT: Contains "urgent", "ASAP", "deadline", "by EOD", "action required", time-sensitive
-- NEEDS_RESPONSE: Direct questions to recipient, "please respond", "let me know", "what do you think"
-- CALENDAR: Calendar invitations, event updates, meeting requests, from Google Calendar
-- FINANCIAL: From banks/brokerages (Chase, Ally, Vanguard, Fidelity, etc.), bills, statements, balance alerts
-- FYI: Everything else - informational, no action needed
+    Threads and summary-only prompts are left as they are; prompts are told
+    apart by their metadata "kind". Each group's metadata keeps its members'
+    original (prompt, metadata) pairs under "members" so
+    split_group_results() can map the answers back.
+    """
+    grouped = []
+    pending = []
+    for prompt, metadata in prompts:
+        if metadata["kind"] == "classify" and not metadata["item"].get("is_thread"):
+            pending.append((prompt, metadata))
+        else:
+            grouped.append((prompt, metadata))
 
-Respond with ONLY this JSON (no markdown, no explanation):
-{{"category": "CATEGORY", "summary": "1-2 sentence summary of actual content", "action_items": "any actions needed or null"}}"""
+    for start in range(0, len(pending), group_size):
+        members = pending[start:start + group_size]
+        if len(members) == 1:
+            grouped.append(members[0])
+            continue
+        first = members[0][1]
+        grouped.append((
+            build_group_classify_prompt([metadata["item"] for _, metadata in members]),
+            {"kind": "group", "index": first["index"], "pre_category": None, "item": first["item"],
+             "members": members},
+        ))
+    return grouped
+
+
+def split_group_results(results: list[tuple]) -> tuple[list[tuple], list[tuple], float]:
+    """Expand grouped responses into one result per member.
+
+    Returns:
+        Tuple of (per-item results, member prompts to retry one by one, cost
+        of the groups being retried). A group is retried when its request
+        failed or its JSON array does not have exactly one entry per email.
+    """
+    flat = []
+    retry = []
+    retry_cost = 0.0
+    for response_text, cost, metadata, error in results:
+        members = metadata.get("members")
+        if members is None:
+            flat.append((response_text, cost, metadata, error))
+            continue
+
+        by_id = {}
+        if not error:
+            try:
+                parsed = parse_json_response(response_text)
+                by_id = {int(entry["id"]): entry for entry in parsed}
+            except (ValueError, TypeError, KeyError):
+                pass
+
+        if sorted(by_id) != list(range(1, len(members) + 1)):
+            retry.extend(members)
+            retry_cost += cost
+            continue
+
+        # Each member gets its own entry as JSON, as if it had been asked alone
+        share = cost / len(members)
+        for i, (_, member_metadata) in enumerate(members, 1):
+            flat.append((orjson.dumps(by_id[i]).decode(), share, member_metadata, None))
+    return flat, retry, retry_cost
 
 
 def get_fallback_info(item: dict) -> tuple[str, str]:
@@ -191,7 +385,7 @@ def parse_classification_response(
                 "summary": parsed.get("summary", f"{fallback_name}: {subject}"),
                 "action_items": parsed.get("action_items")
             }
-        except ValueError:
+        except (ValueError, AttributeError):  # AttributeError: not a JSON object
             return {
                 "category": "FYI",
                 "summary": f"{fallback_name}: {subject}",
@@ -199,13 +393,27 @@ def parse_classification_response(
             }
 
 
+def prefetch_cache(cache_keys: list[str]) -> dict[str, dict]:
+    """Initialize the cache and fetch every cached result for the given keys."""
+    init_cache_db()
+    return lookup_cache_bulk(cache_keys)
+
+
 async def classify_items_parallel(
     items: list[dict],
     use_cache: bool = True,
     max_concurrent: int = 5,
+    max_concurrency: int | None = None,
+    use_batch_api: bool = False,
+    group_size: int = 1,
+    summarize_rule_matches: bool = True,
 ) -> tuple[list[dict], dict]:
     """Classify items using cache and parallel processing.
 
+    With summarize_rule_matches=False, items whose category comes from
+    classify_by_rules() or classify_by_keywords() get a template summary and
+    no Claude call at all.
+
     Returns:
         Tuple of (classified_items, stats_dict)
     """
@@ -215,26 +423,32 @@ async def classify_items_parallel(
         "claude_calls": 0,
         "total_cost": 0.0,
         "pre_classified": 0,
+        "rule_classified": 0,
+        "dedup_saved": 0,
     }
 
-    # Initialize cache if using it
+    # Initialize cache and prefetch every hit in one pass, in a worker thread
+    # so the event loop is never blocked on SQLite
+    # Single emails also get a content key, so an identical email seen under
+    # another message_num reuses its result
+    cache_keys = [get_cache_key(item) for item in items]
+    content_keys = [get_content_cache_key(item) for item in items]
+    cached_results = {}
     if use_cache:
-        init_cache_db()
+        cached_results = await asyncio.to_thread(prefetch_cache, cache_keys + content_keys)
 
     # Phase 1: Check cache and prepare items
     cache_hits = []  # Items with cached results
     needs_processing = []  # Items that need Claude
 
-    for item in items:
+    for idx, (item, cache_key, content_key) in enumerate(zip(items, cache_keys, content_keys)):
         messages = item.get("messages", [])
         if not messages:
             continue
 
-        cache_key = get_cache_key(item)
-
         # Check cache first
-        if use_cache and cache_key:
-            cached = lookup_cache(cache_key)
+        if cache_key:
+            cached = cached_results.get(cache_key) or cached_results.get(content_key)
             if cached:
                 item["category"] = cached["category"]
                 item["summary"] = cached["summary"]
@@ -243,20 +457,37 @@ async def classify_items_parallel(
                 cache_hits.append(item)
                 continue
 
-        # Not in cache - check if we can pre-classify category
-        pre_category = classify_by_labels(item)
-        if pre_category:
+        # Not in cache - check if we can pre-classify category from sender
+        # rules, then Gmail labels, then urgent keywords
+        stats["cache_misses"] += 1
+        rule_category = classify_by_rules(item)
+        label_category = None if rule_category else classify_by_labels(item)
+        if label_category:
             stats["pre_classified"] += 1
+        elif not rule_category:
+            rule_category = classify_by_keywords(item)
+        if rule_category:
+            stats["rule_classified"] += 1
+            if not summarize_rule_matches:
+                fallback_name, subject = get_fallback_info(item)
+                item["category"] = rule_category
+                item["summary"] = template_summary({"from_name": fallback_name, "subject": subject}, rule_category)
+                item["action_items"] = None
+                continue
+        pre_category = rule_category or label_category
 
         needs_processing.append({
+            "index": idx,
             "item": item,
             "cache_key": cache_key,
+            "content_key": content_key,
             "pre_category": pre_category,
         })
-        stats["cache_misses"] += 1
 
-    # Phase 2: Build prompts for items needing processing
+    # Phase 2: Build prompts for items needing processing. Items that produce
+    # an identical prompt (templated notifications, newsletters) share one call.
     prompts = []
+    prompt_groups = {}
     for entry in needs_processing:
         item = entry["item"]
         pre_category = entry["pre_category"]
@@ -265,23 +496,50 @@ async def classify_items_parallel(
             # Only need summary
             prompt = build_summarize_prompt(item)
         else:
-            # Need full classification
-            prompt = build_classify_prompt(item)
+            # Need full classification, answered in CLASSIFICATION_SCHEMA's shape
+            prompt = build_classify_prompt(item) + (CLASSIFICATION_SCHEMA,)
+
+        # The system prompt follows from pre_category, so hash the user content only
+        prompt_key = (pre_category, hashlib.blake2b(prompt[1].encode(), digest_size=16).digest())
+        group = prompt_groups.get(prompt_key)
+        if group is not None:
+            group.append(entry)
+            stats["dedup_saved"] += 1
+            continue
 
+        group = prompt_groups[prompt_key] = [entry]
         metadata = {
-            "index": items.index(item),
+            "kind": "summary" if pre_category else "classify",
+            "index": entry["index"],
             "cache_key": entry["cache_key"],
             "pre_category": pre_category,
             "item": item,
+            "entries": group,
         }
         prompts.append((prompt, metadata))
 
-    # Phase 3: Process in parallel
+    if group_size > 1:
+        prompts = group_prompts(prompts, group_size)
+
+    # Send prompts that share a system prompt back to back, so the cached
+    # prefix written by the first request is still warm for the rest
+    prompts.sort(key=lambda p: p[0][0])
+
+    # Phase 3: Process in parallel, applying each response as it completes
     if prompts:
         total_prompts = len(prompts)
         print(f"🏷️  Processing {total_prompts} items ({stats['cache_hits']} from cache)...", file=sys.stderr, flush=True)
 
+        last_progress = float("-inf")
+
         def progress_callback(completed: int, total: int, metadata: dict):
+            # Throttle to one line per PROGRESS_INTERVAL; always show the last
+            nonlocal last_progress
+            now = time.monotonic()
+            if completed < total and now - last_progress < PROGRESS_INTERVAL:
+                return
+            last_progress = now
+
             item = metadata["item"]
             is_thread = item.get("is_thread", False)
             if is_thread:
@@ -293,31 +551,32 @@ async def classify_items_parallel(
                 subject = email.get("subject", "")[:30]
                 from_name = email.get("from_name", "Unknown")[:15]
                 display = f"{from_name}: {subject}..."
-            print(f"  [{completed}/{total}] {display}", file=sys.stderr, flush=True)
+            print(f"  [{completed}/{total}] {display}", file=sys.stderr)
 
-        results = await query_claude_batch(
-            prompts,
-            max_concurrent=max_concurrent,
-            timeout_seconds=90,
-            progress_callback=progress_callback,
-        )
-        stats["claude_calls"] = len(prompts)
+        # Responses are applied as they arrive, and their cache rows go to a
+        # background writer, so an interrupted run keeps everything already
+        # answered and parsing never waits on SQLite commits
+        cache_writer = CacheWriter() if use_cache else None
+        retry = []
 
-        # Phase 4: Parse responses and update items
-        for response_text, cost, metadata, error in results:
-            item = metadata["item"]
-            cache_key = metadata["cache_key"]
+        def apply_result(response_text: str, cost: float, metadata: dict, error: Exception | None):
             pre_category = metadata["pre_category"]
-            fallback_name, subject = get_fallback_info(item)
-
             stats["total_cost"] += cost
 
-            if error:
-                print(f"  Warning: error for '{subject[:30]}...': {error}", file=sys.stderr)
-                item["category"] = pre_category or "FYI"
-                item["summary"] = f"{fallback_name}: {subject}"
-                item["action_items"] = None
-            else:
+            # Apply the response to every item that shared this prompt; the
+            # call's cost is recorded against the first one only
+            for entry in metadata["entries"]:
+                item = entry["item"]
+                cache_key = entry["cache_key"]
+                fallback_name, subject = get_fallback_info(item)
+
+                if error:
+                    print(f"  Warning: error for '{subject[:30]}...': {error}", file=sys.stderr)
+                    item["category"] = pre_category or "FYI"
+                    item["summary"] = f"{fallback_name}: {subject}"
+                    item["action_items"] = None
+                    continue
+
                 result = parse_classification_response(
                     response_text,
                     fallback_name,
@@ -329,49 +588,125 @@ async def classify_items_parallel(
                 item["summary"] = result["summary"]
                 item["action_items"] = result["action_items"]
 
-                # Save to cache
-                if use_cache and cache_key:
-                    save_to_cache(
-                        cache_key=cache_key,
-                        category=item["category"],
-                        summary=item["summary"],
-                        action_items=item["action_items"],
-                        cost_usd=cost,
-                    )
+                # Queue for the background cache writer, under the message key
+                # and (with zero cost, so totals aren't doubled) the content key
+                if cache_writer:
+                    classified_at = datetime.now().isoformat()
+                    for key, key_cost in ((cache_key, cost), (entry["content_key"], 0.0)):
+                        if key:
+                            cache_writer.put((
+                                key,
+                                item["category"],
+                                item["summary"],
+                                item["action_items"],
+                                key_cost,
+                                DEFAULT_MODEL,
+                                classified_at,
+                            ))
+                cost = 0.0
+
+        def handle_results(results: list[tuple]):
+            # Unpack grouped answers; groups that came back malformed are
+            # queued to be classified again one email per request
+            flat, group_retry, retry_cost = split_group_results(results)
+            stats["total_cost"] += retry_cost
+            retry.extend(group_retry)
+            for result in flat:
+                apply_result(*result)
+
+        try:
+            results = None
+            if use_batch_api:
+                # Half-price offline batch; direct requests are the fallback
+                print("  Submitting as a Message Batch (may take a few minutes)...", file=sys.stderr, flush=True)
+                try:
+                    results = await query_claude_message_batch(prompts)
+                except ClaudeQueryError as e:
+                    print(f"  Warning: {e}; sending requests directly", file=sys.stderr)
+
+            if results is not None:
+                handle_results(results)
+            else:
+                async for result in query_claude_stream(
+                    prompts,
+                    max_concurrent=max_concurrent,
+                    concurrency_ceiling=max_concurrency,
+                    timeout_seconds=90,
+                    progress_callback=progress_callback,
+                ):
+                    handle_results([result])
+            stats["claude_calls"] = len(prompts)
+
+            if retry:
+                print(f"  Retrying {len(retry)} emails from malformed group responses...", file=sys.stderr)
+                async for result in query_claude_stream(
+                    retry,
+                    max_concurrent=max_concurrent,
+                    concurrency_ceiling=max_concurrency,
+                    timeout_seconds=90,
+                ):
+                    apply_result(*result)
+                stats["claude_calls"] += len(retry)
+        finally:
+            if cache_writer:
+                # Joining the writer thread waits on SQLite; keep it off the loop
+                await asyncio.to_thread(cache_writer.close)
     else:
         print(f"🏷️  All {stats['cache_hits']} items found in cache!", file=sys.stderr, flush=True)
 
-    # Phase 5: Combine results (cache hits + processed)
+    # Phase 4: Combine results (cache hits + processed)
     classified_items = []
     for item in items:
         messages = item.get("messages", [])
         if not messages:
             continue
 
-        # Clean up messages (remove body_preview, labels from output)
-        for msg in messages:
-            msg.pop("body_preview", None)
-            msg.pop("labels", None)
-            msg.pop("references", None)
-            msg.pop("filepath", None)
-            msg.pop("body_length", None)
+        # Drop working fields not used downstream
+        messages[:] = [
+            {k: v for k, v in msg.items() if k not in OUTPUT_DROP_KEYS}
+            for msg in messages
+        ]
 
         classified_items.append(item)
 
     return classified_items, stats
 
 
+def write_items(path: str | Path, items: list[dict]) -> None:
+    """Write {"items": [...]} with one serialized item per line.
+
+    Items are encoded one at a time, so the whole output is never held in
+    memory as a single serialized blob.
+    """
+    with open(path, "wb") as f:
+        f.write(b'{"items": [\n')
+        for i, item in enumerate(items):
+            if i:
+                f.write(b",\n")
+            f.write(orjson.dumps(item))
+        f.write(b"\n]}\n")
+
+
 def main():
     parser = argparse.ArgumentParser(description="Classify emails/threads using Claude Agent SDK")
     parser.add_argument("--grouped", required=True, help="Grouped emails JSON file (from group_threads.py)")
     parser.add_argument("--output", required=True, help="Output classified JSON file")
     parser.add_argument("--no-cache", action="store_true", help="Disable caching (re-classify everything)")
-    parser.add_argument("--concurrency", type=int, default=5, help="Max concurrent Claude requests (default: 5)")
+    parser.add_argument("--concurrency", type=int, default=5, help="Initial concurrent Claude requests (default: 5)")
+    parser.add_argument("--max-concurrency", type=int, default=50,
+                        help="Ceiling for concurrency growth; halved on rate limits (default: 50)")
+    parser.add_argument("--group-size", type=int, default=1,
+                        help="Single emails classified per request (default: 1, no grouping). "
+                             "Grouped replies are not schema-constrained")
+    parser.add_argument("--rules-skip-claude", action="store_true",
+                        help="Use template summaries for URGENT/FINANCIAL/CALENDAR rule matches instead of Claude")
+    parser.add_argument("--batch-api", action="store_true",
+                        help="Use the Message Batches API (half price, slower; needs ANTHROPIC_API_KEY)")
     args = parser.parse_args()
 
     # Load grouped items
-    with open(args.grouped) as f:
-        grouped_data = json.load(f)
+    with open(args.grouped, "rb") as f:
+        grouped_data = orjson.loads(f.read())
 
     items = grouped_data.get("items", [])
     total = len(items)
@@ -384,26 +719,33 @@ def main():
             items,
             use_cache=not args.no_cache,
             max_concurrent=args.concurrency,
-        )
+            max_concurrency=args.max_concurrency,
+            use_batch_api=args.batch_api,
+            group_size=args.group_size,
+            summarize_rule_matches=not args.rules_skip_claude,
+        ),
+        loop_factory=LOOP_FACTORY,
     )
 
     # Write output
-    with open(args.output, "w") as f:
-        json.dump({"items": classified_items}, f, indent=2)
+    write_items(args.output, classified_items)
 
-    # Print stats
-    categories = {}
+    # Print stats (one pass over the items)
+    categories = Counter()
+    thread_count = 0
     for item in classified_items:
-        cat = item.get("category", "FYI")
-        categories[cat] = categories.get(cat, 0) + 1
-
-    thread_count = sum(1 for i in classified_items if i.get("is_thread"))
-    single_count = sum(1 for i in classified_items if not i.get("is_thread"))
+        categories[item.get("category", "FYI")] += 1
+        if item.get("is_thread"):
+            thread_count += 1
+    single_count = len(classified_items) - thread_count
 
     print(f"\n📊 Classified {total} items ({thread_count} threads, {single_count} singles):", file=sys.stderr)
     print(f"   Cache hits: {stats['cache_hits']}, Cache misses: {stats['cache_misses']}", file=sys.stderr)
     print(f"   Category from labels: {stats['pre_classified']}", file=sys.stderr)
-    print(f"   Claude SDK calls: {stats['claude_calls']} (concurrency: {args.concurrency})", file=sys.stderr)
+    print(f"   Category from rules: {stats['rule_classified']}", file=sys.stderr)
+    if stats["dedup_saved"]:
+        print(f"   Duplicate prompts skipped: {stats['dedup_saved']}", file=sys.stderr)
+    print(f"   Claude SDK calls: {stats['claude_calls']} (concurrency: {args.concurrency}-{max(args.concurrency, args.max_concurrency)})", file=sys.stderr)
     if stats["total_cost"] > 0:
         print(f"   💰 Total cost: ${stats['total_cost']:.4f}", file=sys.stderr)
     for cat in ["URGENT", "NEEDS_RESPONSE", "CALENDAR", "FINANCIAL", "FYI", "NEWSLETTER", "AUTOMATED"]:
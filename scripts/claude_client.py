@@ -3,8 +3,21 @@
 # ABOUTME: Provides async query functions with cost tracking and error handling
 
 import asyncio
+import atexit
+import json
+import os
+import re
+from collections.abc import AsyncIterator
 from typing import Any
 
+import orjson
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None  # Optional: faster event loop, falls back to asyncio's default
+
+from anthropic import APIError, AsyncAnthropic, RateLimitError
 from claude_agent_sdk import (
     query,
     ClaudeAgentOptions,
@@ -17,6 +30,53 @@ from claude_agent_sdk import (
 # Claude Haiku 4.5 - latest as of Oct 2025
 DEFAULT_MODEL = "claude-haiku-4-5"
 
+# Max output tokens for direct API requests
+DEFAULT_MAX_TOKENS = 4096
+
+# Tool the model is forced to call when a request carries a response schema
+RESPONSE_TOOL_NAME = "respond"
+
+# USD per million tokens: (input, output, cache write, cache read)
+MODEL_PRICING = {
+    "claude-haiku-4-5": (1.00, 5.00, 1.25, 0.10),
+}
+
+# First markdown code block (```json or bare ```); a missing closing fence
+# takes the rest of the text
+CODE_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)(?:```|\Z)", re.DOTALL)
+
+# Start of the first JSON object/array, for responses wrapped in prose
+JSON_START_RE = re.compile(r"[{\[]")
+_json_decoder = json.JSONDecoder()
+
+# Message Batches API: half-price requests, polled until the batch ends
+BATCH_PRICE_FACTOR = 0.5
+BATCH_POLL_SECONDS = 10
+BATCH_TIMEOUT_SECONDS = 3600
+
+# Successful requests needed before an adaptive batch allows one more in flight
+CONCURRENCY_INCREASE_EVERY = 30
+
+# Rate-limit wording in Agent SDK errors, which carry only the CLI's message
+# text. A bare "429" is not enough: request IDs, byte counts and ports contain it.
+RATE_LIMIT_TEXT_RE = re.compile(r"\brate[ _]limit", re.IGNORECASE)
+
+# Extra attempts for a rate-limited request, and the pause used when the
+# 429 carries no Retry-After header
+RATE_LIMIT_RETRIES = 2
+RATE_LIMIT_DEFAULT_PAUSE = 5.0
+
+# Loop factory for asyncio.run()/Runner: uvloop when installed, else the default
+LOOP_FACTORY = uvloop.new_event_loop if uvloop else None
+
+# In-process API client, reused for every request on the same event loop
+_api_client: AsyncAnthropic | None = None
+_api_client_loop: asyncio.AbstractEventLoop | None = None
+
+# Event loop shared by query_claude_sync() calls, so consecutive sync queries
+# reuse the same API client and its open connections
+_sync_runner: asyncio.Runner | None = None
+
 
 class ClaudeQueryError(Exception):
     """Error during Claude query."""
@@ -24,23 +84,140 @@ class ClaudeQueryError(Exception):
     pass
 
 
+def compute_cost(usage: Any, model: str = DEFAULT_MODEL) -> float:
+    """
+    Compute the USD cost of an API response from its token usage.
+
+    Args:
+        usage: Usage object (or anything with the same token count attributes)
+        model: Model the request was sent to
+
+    Returns:
+        Cost in USD, or 0.0 if the model's pricing is unknown
+    """
+    pricing = MODEL_PRICING.get(model)
+    if not pricing or usage is None:
+        return 0.0
+
+    input_price, output_price, cache_write_price, cache_read_price = pricing
+    tokens = (
+        (getattr(usage, "input_tokens", 0) or 0) * input_price
+        + (getattr(usage, "output_tokens", 0) or 0) * output_price
+        + (getattr(usage, "cache_creation_input_tokens", 0) or 0) * cache_write_price
+        + (getattr(usage, "cache_read_input_tokens", 0) or 0) * cache_read_price
+    )
+    return tokens / 1_000_000
+
+
+def get_api_client() -> AsyncAnthropic | None:
+    """
+    Return the shared in-process API client, or None if no API key is set.
+
+    The client (and its HTTP connection pool) is reused across requests on
+    the same event loop and recreated when called from a new loop.
+    """
+    global _api_client, _api_client_loop
+
+    if not os.environ.get("ANTHROPIC_API_KEY"):
+        return None
+
+    loop = asyncio.get_running_loop()
+    if _api_client is None or _api_client_loop is not loop:
+        # No SDK retries: a 429 must reach _query_limited's limiter, which
+        # owns the backoff and Retry-After pause
+        _api_client = AsyncAnthropic(max_retries=0)
+        _api_client_loop = loop
+    return _api_client
+
+
+def _split_prompt(prompt: str | tuple) -> tuple[str | None, str, dict | None]:
+    """Unpack a prompt, (system, prompt) or (system, prompt, schema) into all three."""
+    if isinstance(prompt, str):
+        return None, prompt, None
+    system, text, *rest = prompt
+    return system, text, rest[0] if rest else None
+
+
+def _message_params(
+    prompt: str, model: str, system: str | None = None, schema: dict | None = None
+) -> dict:
+    """Build Messages API parameters for a single-turn request.
+
+    The system prompt is marked for prompt caching so calls sharing it reuse
+    the cached prefix. With a JSON schema, the model is made to answer by
+    calling a tool with that input schema, so the reply is always a
+    well-formed object.
+    """
+    params = {
+        "model": model,
+        "max_tokens": DEFAULT_MAX_TOKENS,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    if system:
+        params["system"] = [
+            {"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}
+        ]
+    if schema:
+        params["tools"] = [{
+            "name": RESPONSE_TOOL_NAME,
+            "description": "Record the response.",
+            "input_schema": schema,
+        }]
+        params["tool_choice"] = {"type": "tool", "name": RESPONSE_TOOL_NAME}
+    return params
+
+
+def _response_text(message: Any) -> str:
+    """Concatenate the text blocks of a Messages API response.
+
+    A forced tool call is returned as its input serialized to JSON, so
+    callers parse structured and free-text JSON replies the same way.
+    """
+    parts = []
+    for block in message.content:
+        if block.type == "text":
+            parts.append(block.text)
+        elif block.type == "tool_use":
+            parts.append(orjson.dumps(block.input).decode())
+    return "".join(parts)
+
+
+async def _query_api(
+    client: AsyncAnthropic,
+    prompt: str,
+    model: str,
+    system: str | None = None,
+    schema: dict | None = None,
+) -> tuple[str, float]:
+    """Send a single-turn request straight to the Messages API."""
+    response = await client.messages.create(**_message_params(prompt, model, system, schema))
+    return _response_text(response), compute_cost(response.usage, model)
+
+
 async def query_claude(
     prompt: str,
     model: str = DEFAULT_MODEL,
     timeout_seconds: int = 90,
+    system: str | None = None,
+    schema: dict | None = None,
 ) -> tuple[str, float]:
     """
     Query Claude and return (response_text, cost_usd).
 
-    Uses the Claude Agent SDK which respects authentication precedence:
-    ANTHROPIC_API_KEY > OAuth token > Max subscription
+    Authentication precedence: ANTHROPIC_API_KEY > OAuth token > Max subscription
 
-    If no API key is set, falls back to your Claude Max subscription.
+    With ANTHROPIC_API_KEY set, requests go straight to the Messages API
+    through a shared in-process client. Otherwise the Claude Agent SDK is
+    used, which falls back to your Claude Max subscription.
 
     Args:
         prompt: The prompt to send to Claude
         model: Model to use (default: claude-haiku-4-5)
         timeout_seconds: Timeout for the query
+        system: Optional static system prompt, sent ahead of the prompt
+        schema: Optional JSON schema for the reply. The Messages API path
+            enforces it through a forced tool call and returns the result as
+            JSON text; the Agent SDK path relies on the prompt alone.
 
     Returns:
         Tuple of (response text, cost in USD)
@@ -49,20 +226,31 @@ async def query_claude(
         ClaudeQueryError: If the query fails
         TimeoutError: If the query times out
     """
+    api_client = get_api_client()
+    if api_client is not None:
+        try:
+            async with asyncio.timeout(timeout_seconds):
+                return await _query_api(api_client, prompt, model, system, schema)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Claude query timed out after {timeout_seconds}s")
+        except Exception as e:
+            raise ClaudeQueryError(f"Claude query failed: {e}") from e
+
     options = ClaudeAgentOptions(
         model=model,
+        system_prompt=system,
     )
 
-    response_text = ""
+    parts: list[str] = []
     cost = 0.0
 
     try:
         async with asyncio.timeout(timeout_seconds):
             async for message in query(prompt=prompt, options=options):
                 if isinstance(message, AssistantMessage):
-                    for block in message.content:
-                        if isinstance(block, TextBlock):
-                            response_text += block.text
+                    parts.extend(
+                        block.text for block in message.content if isinstance(block, TextBlock)
+                    )
                 elif isinstance(message, ResultMessage):
                     cost = message.total_cost_usd or 0.0
     except asyncio.TimeoutError:
@@ -70,64 +258,250 @@ async def query_claude(
     except Exception as e:
         raise ClaudeQueryError(f"Claude query failed: {e}") from e
 
-    return response_text, cost
+    return "".join(parts), cost
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Return True if an error (or anything in its cause chain) is a 429.
+
+    Messages API errors are judged by their status code alone. Errors from
+    the Agent SDK path have no status, so their text must mention a rate limit.
+    """
+    chain = []
+    while error is not None:
+        chain.append(error)
+        error = error.__cause__
+
+    if any(isinstance(e, RateLimitError) or getattr(e, "status_code", None) == 429 for e in chain):
+        return True
+    if any(isinstance(e, APIError) for e in chain):
+        return False
+    return any(RATE_LIMIT_TEXT_RE.search(str(e)) for e in chain)
+
+
+def retry_after_seconds(error: BaseException) -> float | None:
+    """Return the Retry-After delay from a rate-limit error's response, if any."""
+    while error is not None:
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if headers:
+            try:
+                return max(0.0, float(headers.get("retry-after")))
+            except (TypeError, ValueError):
+                pass
+        error = error.__cause__
+    return None
+
+
+class AdaptiveLimiter:
+    """Concurrency limit tuned by additive increase / multiplicative decrease.
+
+    Starts at `initial` requests in flight. Every `increase_every` successes
+    raise the limit by one, up to `ceiling`; a rate-limit error halves it and
+    holds back new requests for the server's Retry-After delay.
+    """
+
+    def __init__(self, initial: int, ceiling: int, increase_every: int = CONCURRENCY_INCREASE_EVERY):
+        self.limit = max(1, initial)
+        self.ceiling = max(self.limit, ceiling)
+        self.increase_every = increase_every
+        self.in_flight = 0
+        self._successes = 0
+        self._resume_at = 0.0
+        self._changed = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        """Wait out any rate-limit pause and until a slot is free, then take it."""
+        loop = asyncio.get_running_loop()
+        while (delay := self._resume_at - loop.time()) > 0:
+            await asyncio.sleep(delay)
+        async with self._changed:
+            await self._changed.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, rate_limited: bool = False, pause: float = 0.0) -> None:
+        """Free a slot and adjust the limit from the request's outcome."""
+        async with self._changed:
+            self.in_flight -= 1
+            if rate_limited:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+                if pause > 0:
+                    resume_at = asyncio.get_running_loop().time() + pause
+                    self._resume_at = max(self._resume_at, resume_at)
+            else:
+                self._successes += 1
+                if self._successes >= self.increase_every and self.limit < self.ceiling:
+                    self.limit += 1
+                    self._successes = 0
+            self._changed.notify_all()
+
+
+async def _query_limited(
+    prompt: str | tuple,
+    metadata: dict,
+    limiter: AdaptiveLimiter,
+    model: str,
+    timeout_seconds: int,
+) -> tuple[str, float, dict, Exception | None]:
+    """Run one prompt under the limiter, returning (text, cost, metadata, error).
+
+    A rate-limited request is retried up to RATE_LIMIT_RETRIES times, after
+    the limiter's Retry-After pause.
+    """
+    system, prompt, schema = _split_prompt(prompt)
+    for attempt in range(RATE_LIMIT_RETRIES + 1):
+        await limiter.acquire()
+        try:
+            response_text, cost = await query_claude(prompt, model, timeout_seconds, system, schema)
+        except Exception as e:
+            if not is_rate_limit_error(e):
+                await limiter.release()
+                return ("", 0.0, metadata, e)
+            pause = retry_after_seconds(e)
+            await limiter.release(rate_limited=True, pause=RATE_LIMIT_DEFAULT_PAUSE if pause is None else pause)
+            if attempt == RATE_LIMIT_RETRIES:
+                return ("", 0.0, metadata, e)
+        else:
+            await limiter.release()
+            return (response_text, cost, metadata, None)
 
 
-async def query_claude_batch(
-    prompts: list[tuple[str, dict]],
+async def query_claude_stream(
+    prompts: list[tuple[str | tuple, dict]],
     model: str = DEFAULT_MODEL,
     max_concurrent: int = 5,
     timeout_seconds: int = 90,
     progress_callback: callable = None,
-) -> list[tuple[str, float, dict, Exception | None]]:
+    concurrency_ceiling: int | None = None,
+) -> AsyncIterator[tuple[str, float, dict, Exception | None]]:
     """
-    Process multiple prompts concurrently with rate limiting.
+    Process multiple prompts concurrently, yielding each result as it completes.
+
+    Results arrive in completion order, so callers can act on (and persist)
+    early answers while slower requests are still in flight. Requests still
+    pending when the consumer stops iterating are cancelled.
 
     Args:
-        prompts: List of (prompt_text, metadata) tuples
+        prompts: List of (prompt, metadata) tuples, where prompt is either the
+            prompt text or a (system_prompt, prompt_text[, response_schema])
+            tuple
         model: Model to use for all queries
-        max_concurrent: Maximum concurrent requests (default: 5)
+        max_concurrent: Concurrent requests to start with (default: 5)
         timeout_seconds: Timeout per query
         progress_callback: Optional callback(completed, total, metadata) for progress
+        concurrency_ceiling: If set, concurrency grows after sustained success
+            up to this limit and halves on rate-limit errors (AIMD)
+
+    Yields:
+        (response_text, cost_usd, metadata, error) tuples. error is None on
+        success, Exception on failure.
+    """
+    limiter = AdaptiveLimiter(max_concurrent, concurrency_ceiling or max_concurrent)
+    tasks = [
+        asyncio.ensure_future(_query_limited(prompt, meta, limiter, model, timeout_seconds))
+        for prompt, meta in prompts
+    ]
+    try:
+        for completed, next_done in enumerate(asyncio.as_completed(tasks), 1):
+            result = await next_done
+            if progress_callback:
+                progress_callback(completed, len(prompts), result[2])
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Wait for the cancellations to land so no request outlives the stream
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def query_claude_message_batch(
+    prompts: list[tuple[str | tuple, dict]],
+    model: str = DEFAULT_MODEL,
+    timeout_seconds: int = BATCH_TIMEOUT_SECONDS,
+    poll_seconds: float = BATCH_POLL_SECONDS,
+) -> list[tuple[str, float, dict, Exception | None]]:
+    """
+    Process prompts offline through the Message Batches API.
+
+    Submits every prompt as one batch, polls until it has ended, then reads
+    the results back by custom_id. Batched requests cost half the standard
+    price but may take minutes to complete. Requires ANTHROPIC_API_KEY.
+
+    Args:
+        prompts: Same shape as query_claude_stream()
+        model: Model to use for all queries
+        timeout_seconds: Give up (and cancel the batch) after this long
+        poll_seconds: Delay between status checks
 
     Returns:
-        List of (response_text, cost_usd, metadata, error) tuples.
-        error is None on success, Exception on failure.
+        One (response_text, cost_usd, metadata, error) tuple per prompt, as
+        yielded by query_claude_stream(), but in input order.
+
+    Raises:
+        ClaudeQueryError: If no API key is set, or the batch could not be
+            submitted or did not finish in time
     """
-    semaphore = asyncio.Semaphore(max_concurrent)
-    completed = 0
+    client = get_api_client()
+    if client is None:
+        raise ClaudeQueryError("Message Batches API requires ANTHROPIC_API_KEY")
 
-    async def process_one(prompt: str, metadata: dict) -> tuple[str, float, dict, Exception | None]:
-        nonlocal completed
-        async with semaphore:
-            try:
-                response_text, cost = await query_claude(prompt, model, timeout_seconds)
-                completed += 1
-                if progress_callback:
-                    progress_callback(completed, len(prompts), metadata)
-                return (response_text, cost, metadata, None)
-            except Exception as e:
-                completed += 1
-                if progress_callback:
-                    progress_callback(completed, len(prompts), metadata)
-                return ("", 0.0, metadata, e)
+    requests = []
+    for i, (prompt, _) in enumerate(prompts):
+        system, prompt, schema = _split_prompt(prompt)
+        requests.append({"custom_id": str(i), "params": _message_params(prompt, model, system, schema)})
 
-    tasks = [process_one(prompt, meta) for prompt, meta in prompts]
-    return await asyncio.gather(*tasks)
+    try:
+        batch = await client.messages.batches.create(requests=requests)
+        async with asyncio.timeout(timeout_seconds):
+            while batch.processing_status != "ended":
+                await asyncio.sleep(poll_seconds)
+                batch = await client.messages.batches.retrieve(batch.id)
+
+        results: list[tuple | None] = [None] * len(prompts)
+        async for entry in await client.messages.batches.results(batch.id):
+            i = int(entry.custom_id)
+            metadata = prompts[i][1]
+            if entry.result.type == "succeeded":
+                message = entry.result.message
+                cost = compute_cost(message.usage, model) * BATCH_PRICE_FACTOR
+                results[i] = (_response_text(message), cost, metadata, None)
+            else:
+                error = ClaudeQueryError(f"Batch request {entry.result.type}")
+                results[i] = ("", 0.0, metadata, error)
+    except asyncio.TimeoutError:
+        try:
+            await client.messages.batches.cancel(batch.id)
+        except Exception:
+            pass  # Unfinished batches expire on their own after 24h
+        raise ClaudeQueryError(f"Message batch did not finish within {timeout_seconds}s")
+    except Exception as e:
+        raise ClaudeQueryError(f"Message batch failed: {e}") from e
+
+    missing = ClaudeQueryError("No result returned for batch request")
+    return [
+        result or ("", 0.0, metadata, missing)
+        for result, (_, metadata) in zip(results, prompts)
+    ]
 
 
 def query_claude_sync(
     prompt: str,
     model: str = DEFAULT_MODEL,
     timeout_seconds: int = 90,
+    system: str | None = None,
 ) -> tuple[str, float]:
     """
     Synchronous wrapper for query_claude().
 
+    Every call runs on one long-lived event loop rather than a fresh
+    asyncio.run() loop, so the API client and its connections are reused.
+
     Args:
         prompt: The prompt to send to Claude
         model: Model to use (default: claude-haiku-4-5)
         timeout_seconds: Timeout for the query
+        system: Optional static system prompt, sent ahead of the prompt
 
     Returns:
         Tuple of (response text, cost in USD)
@@ -136,10 +510,14 @@ def query_claude_sync(
         ClaudeQueryError: If the query fails
         TimeoutError: If the query times out
     """
-    return asyncio.run(query_claude(prompt, model, timeout_seconds))
+    global _sync_runner
+    if _sync_runner is None:
+        _sync_runner = asyncio.Runner(loop_factory=LOOP_FACTORY)
+        atexit.register(_sync_runner.close)
+    return _sync_runner.run(query_claude(prompt, model, timeout_seconds, system))
 
 
-def parse_json_response(response_text: str) -> dict[str, Any]:
+def parse_json_response(response_text: str) -> dict[str, Any] | list[Any]:
     """
     Parse JSON from Claude response, handling markdown code blocks.
 
@@ -147,24 +525,21 @@ def parse_json_response(response_text: str) -> dict[str, Any]:
         response_text: Raw response text from Claude
 
     Returns:
-        Parsed JSON as dictionary
+        Parsed JSON: a dictionary, or a list for multi-item prompts
 
     Raises:
         ValueError: If JSON parsing fails or response is empty
     """
-    import json
-
     text = response_text.strip()
 
     # Handle empty responses
     if not text:
         raise ValueError("Empty response from Claude")
 
-    # Handle markdown code blocks
-    if "```json" in text:
-        text = text.split("```json")[1].split("```")[0]
-    elif "```" in text:
-        text = text.split("```")[1].split("```")[0]
+    # Handle markdown code blocks; tool-use responses are bare JSON, so only
+    # run the fence regex when a fence is present
+    if "```" in text:
+        text = CODE_FENCE_RE.search(text).group(1)
 
     text = text.strip()
 
@@ -173,6 +548,13 @@ def parse_json_response(response_text: str) -> dict[str, Any]:
         raise ValueError("Empty JSON content in response")
 
     try:
-        return json.loads(text)
-    except json.JSONDecodeError as e:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError as e:
+        # Fall back to the first JSON value, ignoring any text around it
+        start = JSON_START_RE.search(text)
+        if start:
+            try:
+                return _json_decoder.raw_decode(text, start.start())[0]
+            except json.JSONDecodeError:
+                pass
         raise ValueError(f"Failed to parse JSON: {e}") from e
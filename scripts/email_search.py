@@ -3,60 +3,105 @@
 # ABOUTME: Usage: uv run scripts/email_search.py "find emails about a google interview"
 
 import argparse
-import json
+import email
+import email.policy
+import hashlib
+import heapq
 import os
 import re
 import sqlite3
 import sys
 import webbrowser
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
+from email.parser import BytesHeaderParser
 from pathlib import Path
 
-from jinja2 import Environment, FileSystemLoader
-
-from claude_client import query_claude_sync, parse_json_response, ClaudeQueryError
+from claude_client import query_claude_sync, parse_json_response, ClaudeQueryError, DEFAULT_MODEL
+from fetch_emails import open_archive, parse_duration, query_messages
+from parse_eml import decode_mime_header, extract_name_and_email, get_body_text
+from render_brief import TEMPLATE_CACHE_DIR, template_env
+from search_index import HEADER_COLUMNS, open_index, index_messages, indexed_fields, match_counts
 
 # Paths
 DB_PATH = Path.home() / "MAIL" / "gmail" / "msg-db.sqlite"
 GMAIL_DIR = Path.home() / "MAIL" / "gmail"
-GMAIL_BASE_URL = "https://mail.google.com/mail/u/0/#all"
 TEMPLATES_DIR = Path.home() / "MAIL" / "templates"
 SEARCHES_DIR = Path.home() / "MAIL" / "searches"
+LLM_CACHE_PATH = Path.home() / "MAIL" / "search_llm_cache.sqlite"
 
 # Limits
 MAX_CANDIDATES = 100
 MAX_RESULTS = 10
 MAX_BODY_CHARS = 1000
 
+HTML_TAG_RE = re.compile(r"<[^>]+>")
+
+# format_answer_html() patterns; applied in this order, so references
+# inside bold or italic text are still linked
+BOLD_RE = re.compile(r"\*\*([^*]+)\*\*")
+ITALIC_RE = re.compile(r"(?<![:/])\*([^*]+)\*")
+EMAIL_REF_RE = re.compile(r"Emails?\s*\d+(?:\s*[,\-]\s*\d+)*")
+DIGITS_RE = re.compile(r"\d+")
 
-def parse_duration(duration_str: str) -> timedelta:
-    """Parse duration string like '1d', '12h', '1w', '1mo' into timedelta."""
-    match = re.match(r"^(\d+)(h|d|w|mo|y)$", duration_str.lower())
-    if not match:
-        raise ValueError(f"Invalid duration format: {duration_str}. Use: 1d, 12h, 1w, 1mo, 1y")
+# Static instructions go in the system prompt; only the query and emails
+# are filled into the per-call user message
+PARSE_QUERY_SYSTEM_PROMPT = """Extract search parameters from the email search query in the user message. Be generous with keywords - include all relevant terms.
+
+Return ONLY this JSON (no markdown, no explanation):
+{"people": ["names to search in From/To"], "keywords": ["topic keywords to search"], "date_hint": "time hint like 'last year' or null"}
 
-    value = int(match.group(1))
-    unit = match.group(2)
+Examples:
+- "what did Sarah say about the budget" -> {"people": ["Sarah"], "keywords": ["budget"], "date_hint": null}
+- "find emails about google interview" -> {"people": [], "keywords": ["google", "interview"], "date_hint": null}
+- "tax documents from last year" -> {"people": [], "keywords": ["tax", "documents"], "date_hint": "last year"}"""
 
-    if unit == "h":
-        return timedelta(hours=value)
-    elif unit == "d":
-        return timedelta(days=value)
-    elif unit == "w":
-        return timedelta(weeks=value)
-    elif unit == "mo":
-        return timedelta(days=value * 30)
-    elif unit == "y":
-        return timedelta(days=value * 365)
-    else:
-        raise ValueError(f"Unknown unit: {unit}")
+ANSWER_SYSTEM_PROMPT = """Based on the emails in the user message, answer the user's question. Be concise and specific.
 
+Provide:
+1. A direct answer to the question (2-4 sentences)
+2. Cite specific emails by number when referencing information (e.g., "In Email 2, ...")
+
+If the emails don't contain enough information to fully answer the question, say so."""
+
+PARSE_QUERY_TEMPLATE = 'Query: "%s"'
+ANSWER_TEMPLATE = "QUESTION: %s\n\nEMAILS:\n%s"
+ANSWER_EMAIL_TEMPLATE = "\n--- Email %d ---\nFrom: %s <%s>\nDate: %s\nSubject: %s\nBody excerpt:\n%s\n"
+
+
+def llm_cache_key(prompt: str, system: str | None = None, model: str = DEFAULT_MODEL) -> str:
+    """Hash everything that determines a response into a cache key."""
+    return hashlib.sha256("\0".join((model, system or "", prompt)).encode()).hexdigest()
+
+
+def _open_llm_cache() -> sqlite3.Connection:
+    """Open (creating if needed) the on-disk cache of Claude responses."""
+    LLM_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(LLM_CACHE_PATH)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at TEXT NOT NULL)"
+    )
+    return conn
+
+
+def call_claude(prompt: str, timeout: int = 90, system: str | None = None, use_cache: bool = True) -> str:
+    """Call Claude Agent SDK and return response text.
+
+    Responses are cached on disk by prompt, so repeating a search skips the
+    model round trip. Failed calls (empty responses) are not cached.
+    """
+    key = llm_cache_key(prompt, system)
+    if use_cache:
+        conn = _open_llm_cache()
+        try:
+            row = conn.execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        if row:
+            return row[0]
 
-def call_claude(prompt: str, timeout: int = 90) -> str:
-    """Call Claude Agent SDK and return response text."""
     try:
-        response_text, _ = query_claude_sync(prompt, timeout_seconds=timeout)
-        return response_text
+        response_text, _ = query_claude_sync(prompt, timeout_seconds=timeout, system=system)
     except TimeoutError:
         print("Warning: claude timed out", file=sys.stderr)
         return ""
@@ -64,33 +109,26 @@ def call_claude(prompt: str, timeout: int = 90) -> str:
         print(f"Warning: claude error: {e}", file=sys.stderr)
         return ""
 
+    if use_cache and response_text:
+        conn = _open_llm_cache()
+        try:
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response_text, datetime.now().isoformat()),
+                )
+        finally:
+            conn.close()
+    return response_text
 
-def parse_query(query: str) -> dict:
-    """Use LLM to extract search parameters from natural language query."""
-    prompt = f"""Extract search parameters from this email search query. Be generous with keywords - include all relevant terms.
-
-Query: "{query}"
-
-Return ONLY this JSON (no markdown, no explanation):
-{{"people": ["names to search in From/To"], "keywords": ["topic keywords to search"], "date_hint": "time hint like 'last year' or null"}}
-
-Examples:
-- "what did Sarah say about the budget" -> {{"people": ["Sarah"], "keywords": ["budget"], "date_hint": null}}
-- "find emails about google interview" -> {{"people": [], "keywords": ["google", "interview"], "date_hint": null}}
-- "tax documents from last year" -> {{"people": [], "keywords": ["tax", "documents"], "date_hint": "last year"}}"""
 
-    response = call_claude(prompt)
+def parse_query(query: str, use_cache: bool = True) -> dict:
+    """Use LLM to extract search parameters from natural language query."""
+    response = call_claude(PARSE_QUERY_TEMPLATE % query, system=PARSE_QUERY_SYSTEM_PROMPT, use_cache=use_cache)
 
-    # Parse JSON from response
     try:
-        # Handle markdown code blocks
-        if "```json" in response:
-            response = response.split("```json")[1].split("```")[0]
-        elif "```" in response:
-            response = response.split("```")[1].split("```")[0]
-
-        return json.loads(response.strip())
-    except json.JSONDecodeError:
+        return parse_json_response(response)
+    except ValueError:
         # Fallback: use query words as keywords
         words = [w for w in query.split() if len(w) > 2]
         return {"people": [], "keywords": words, "date_hint": None}
@@ -119,178 +157,155 @@ def date_hint_to_range(hint: str) -> tuple[datetime, datetime] | None:
     return None
 
 
-def search_candidates(keywords: list[str], people: list[str], since: datetime | None, until: datetime | None) -> list[dict]:
-    """Search for candidate emails using SQLite + grep."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    # Build date filter
-    date_conditions = []
+def fetch_candidates(since: datetime | None, until: datetime | None) -> list[dict]:
+    """Fetch recent non-promotional messages in the date range from the archive database."""
+    # Skip promotional/automated unless explicitly searching for them; done
+    # in SQL so the LIMIT counts only messages that can match
+    conditions = [
+        "NOT EXISTS (SELECT 1 FROM labels l WHERE l.message_num = m.message_num"
+        " AND l.label IN ('CATEGORY_PROMOTIONS', 'CATEGORY_UPDATES'))"
+    ]
     params = []
 
     if since:
-        date_conditions.append("m.message_internaldate >= ?")
+        conditions.append("m.message_internaldate >= ?")
         params.append(since.strftime("%Y-%m-%d %H:%M:%S"))
     if until:
-        date_conditions.append("m.message_internaldate <= ?")
+        conditions.append("m.message_internaldate <= ?")
         params.append(until.strftime("%Y-%m-%d %H:%M:%S"))
 
-    where_clause = " AND ".join(date_conditions) if date_conditions else "1=1"
-
-    # Get candidate messages by date
-    query = f"""
-    SELECT
-        m.message_num,
-        m.message_filename,
-        m.message_internaldate,
-        u.uid,
-        GROUP_CONCAT(l.label, '|') as labels
-    FROM messages m
-    LEFT JOIN uids u ON m.message_num = u.message_num
-    LEFT JOIN labels l ON m.message_num = l.message_num
-    WHERE {where_clause}
-    GROUP BY m.message_num
-    ORDER BY m.message_internaldate DESC
-    LIMIT 10000
-    """
+    conn = open_archive(DB_PATH)
+    try:
+        return query_messages(conn, " AND ".join(conditions), params, limit=10000)
+    finally:
+        conn.close()
 
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    conn.close()
 
-    # Convert to list of dicts
-    candidates = []
-    for row in rows:
-        labels = row["labels"].split("|") if row["labels"] else []
-        # Skip promotional/automated unless explicitly searching for them
-        if "CATEGORY_PROMOTIONS" in labels or "CATEGORY_UPDATES" in labels:
-            continue
+def index_candidates(candidates: list[dict]) -> None:
+    """Add candidates not yet in the keyword index, parsing each file once."""
+    conn = open_index()
+    try:
+        index_messages(conn, ((c["message_num"], GMAIL_DIR / c["filename"]) for c in candidates))
+    finally:
+        conn.close()
 
-        uid = row["uid"] or ""
-        candidates.append({
-            "message_num": row["message_num"],
-            "uid": uid,
-            "gmail_link": f"{GMAIL_BASE_URL}/{uid}" if uid else "",
-            "filename": row["message_filename"],
-            "date": row["message_internaldate"],
-            "labels": labels
-        })
 
+def prefetch_candidates(since: datetime | None, until: datetime | None) -> list[dict]:
+    """Fetch and index candidates; needs no search terms, so it can run during query parsing."""
+    candidates = fetch_candidates(since, until)
+    index_candidates(candidates)
+    return candidates
+
+
+def filter_candidates(candidates: list[dict], keywords: list[str], people: list[str]) -> list[dict]:
+    """Keep candidates matching any search term, best matches first."""
     if not keywords and not people:
         return candidates[:MAX_CANDIDATES]
 
-    # Filter by keywords using grep on EML files
-    matched = []
-    search_terms = keywords + people
+    # Match through the FTS5 index; candidates not indexed yet are added first
+    index_candidates(candidates)
+    conn = open_index()
+    try:
+        # Names and addresses live in the headers, so people-only searches
+        # skip the body text
+        columns = None if keywords else HEADER_COLUMNS
+        counts = match_counts(conn, keywords + people, columns)
+    finally:
+        conn.close()
 
+    matched = []
     for candidate in candidates:
-        if len(matched) >= MAX_CANDIDATES:
-            break
+        matches = counts.get(candidate["message_num"])
+        if matches:
+            candidate["match_score"] = matches
+            matched.append(candidate)
 
-        filepath = GMAIL_DIR / candidate["filename"]
-        if not filepath.exists():
-            continue
+    # Most matching terms first, then newest
+    return heapq.nlargest(MAX_CANDIDATES, matched, key=lambda x: (x["match_score"], x["date"]))
 
-        try:
-            content = filepath.read_text(errors="replace").lower()
-
-            # Check if any search term matches
-            matches = sum(1 for term in search_terms if term.lower() in content)
-            if matches > 0:
-                candidate["match_score"] = matches
-                matched.append(candidate)
-        except Exception:
-            continue
 
-    # Sort by match score, then by date
-    matched.sort(key=lambda x: (-x.get("match_score", 0), x["date"]), reverse=True)
+def search_candidates(keywords: list[str], people: list[str], since: datetime | None, until: datetime | None) -> list[dict]:
+    """Search for candidate emails using the archive database and keyword index."""
+    return filter_candidates(fetch_candidates(since, until), keywords, people)
 
-    return matched[:MAX_CANDIDATES]
 
+def body_preview(body: str) -> str:
+    """Cut a message body to MAX_BODY_CHARS, marking the cut with '...'."""
+    return body[:MAX_BODY_CHARS] + ("..." if len(body) > MAX_BODY_CHARS else "")
+
+
+def fields_from_index(subject: str, sender: str, body: str) -> dict:
+    """Build parse_eml_file()-style fields from a message's indexed text."""
+    from_name, from_email = extract_name_and_email(sender)
+    return {
+        "from_name": from_name,
+        "from_email": from_email,
+        "subject": subject or "(no subject)",
+        "body_preview": body_preview(body),
+    }
+
+
+def header_fields(msg: email.message.Message) -> dict:
+    """Extract sender, subject and date from a parsed message's headers."""
+    from_name, from_email = extract_name_and_email(msg.get("From", ""))
+    return {
+        "from_name": from_name,
+        "from_email": from_email,
+        "subject": decode_mime_header(msg.get("Subject", "(no subject)")),
+        "date": msg.get("Date", ""),
+    }
 
-def parse_eml_file(filepath: Path) -> dict:
-    """Parse EML file and extract key fields."""
-    import email
-    import email.policy
-    from email.header import decode_header
-
-    def decode_mime_header(header_value: str) -> str:
-        if not header_value:
-            return ""
-        decoded_parts = []
-        for part, charset in decode_header(header_value):
-            if isinstance(part, bytes):
-                charset = charset or "utf-8"
-                try:
-                    decoded_parts.append(part.decode(charset, errors="replace"))
-                except (LookupError, UnicodeDecodeError):
-                    decoded_parts.append(part.decode("utf-8", errors="replace"))
-            else:
-                decoded_parts.append(part)
-        return "".join(decoded_parts)
-
-    def get_body_text(msg) -> str:
-        body_parts = []
-        if msg.is_multipart():
-            for part in msg.walk():
-                if part.get_content_type() == "text/plain":
-                    try:
-                        payload = part.get_payload(decode=True)
-                        charset = part.get_content_charset() or "utf-8"
-                        body_parts.append(payload.decode(charset, errors="replace"))
-                    except Exception:
-                        pass
-        else:
-            try:
-                payload = msg.get_payload(decode=True)
-                charset = msg.get_content_charset() or "utf-8"
-                body_parts.append(payload.decode(charset, errors="replace"))
-            except Exception:
-                pass
-        return "\n".join(body_parts).strip()
 
+def parse_eml_headers(filepath: Path) -> dict:
+    """Parse only the headers of an EML file; the body is left undecoded."""
     try:
         with open(filepath, "rb") as f:
-            msg = email.message_from_binary_file(f, policy=email.policy.default)
+            msg = BytesHeaderParser(policy=email.policy.default).parse(f)
     except Exception as e:
         return {"error": str(e)}
+    return header_fields(msg)
 
-    from_header = decode_mime_header(msg.get("From", ""))
-    # Extract name and email from From header
-    match = re.match(r'^"?([^"<]*)"?\s*<?([^>]+@[^>]+)>?$', from_header.strip())
-    if match:
-        from_name = match.group(1).strip() or match.group(2).split("@")[0]
-        from_email = match.group(2).strip()
-    else:
-        from_name = from_header
-        from_email = from_header
 
-    subject = decode_mime_header(msg.get("Subject", "(no subject)"))
-    date = msg.get("Date", "")
-    body = get_body_text(msg)
+def parse_eml_file(filepath: Path) -> dict:
+    """Parse EML file and extract key fields."""
+    try:
+        with open(filepath, "rb") as f:
+            msg = email.message_from_binary_file(f, policy=email.policy.default)
+    except Exception as e:
+        return {"error": str(e)}
 
-    return {
-        "from_name": from_name,
-        "from_email": from_email,
-        "subject": subject,
-        "date": date,
-        "body_preview": body[:MAX_BODY_CHARS] + ("..." if len(body) > MAX_BODY_CHARS else "")
-    }
+    # One character past the cut-off is enough for body_preview() to add '...'
+    body = get_body_text(msg, max_chars=MAX_BODY_CHARS + 1)
+    return {**header_fields(msg), "body_preview": body_preview(body)}
 
 
 def rank_and_parse_results(candidates: list[dict], keywords: list[str], people: list[str], limit: int = MAX_RESULTS) -> list[dict]:
-    """Parse EML files and rank results."""
+    """Rank candidates by sender and subject, then fetch body previews for the winners.
+
+    Scoring needs headers only, so unindexed candidates are header-parsed
+    and just the top `limit` are fully parsed for their previews.
+    """
     results = []
     search_terms = [t.lower() for t in keywords + people]
+    people_terms = [p.lower() for p in people]
 
-    for candidate in candidates[:MAX_CANDIDATES]:
-        filepath = GMAIL_DIR / candidate["filename"]
-        if not filepath.exists():
-            continue
+    # Messages already in the keyword index are read back from it; only the
+    # rest are parsed from their EML files. Missing files come back as
+    # errors from the parse itself, so no separate exists() check is needed.
+    candidates = candidates[:MAX_CANDIDATES]
+    conn = open_index()
+    try:
+        indexed = indexed_fields(conn, [c["message_num"] for c in candidates])
+    finally:
+        conn.close()
+    to_parse = [c for c in candidates if c["message_num"] not in indexed]
+    parsed_by_num = {c["message_num"]: parse_eml_headers(GMAIL_DIR / c["filename"]) for c in to_parse}
+    for message_num, fields in indexed.items():
+        parsed_by_num[message_num] = fields_from_index(*fields)
 
-        parsed = parse_eml_file(filepath)
-        if "error" in parsed:
+    for candidate in candidates:
+        parsed = parsed_by_num.get(candidate["message_num"])
+        if parsed is None or "error" in parsed:
             continue
 
         # Calculate relevance score
@@ -304,8 +319,8 @@ def rank_and_parse_results(candidates: list[dict], keywords: list[str], people:
 
         # Boost for matches in sender
         sender_lower = (parsed["from_name"] + " " + parsed["from_email"]).lower()
-        for person in people:
-            if person.lower() in sender_lower:
+        for person in people_terms:
+            if person in sender_lower:
                 score += 5
 
         results.append({
@@ -315,47 +330,37 @@ def rank_and_parse_results(candidates: list[dict], keywords: list[str], people:
             "from_email": parsed["from_email"],
             "subject": parsed["subject"],
             "date": candidate["date"],
-            "body_preview": parsed["body_preview"],
+            "body_preview": parsed.get("body_preview"),
+            "filename": candidate["filename"],
             "score": score
         })
 
-    # Sort by score descending
-    results.sort(key=lambda x: -x["score"])
+    # Highest scores first; ties keep candidate order
+    top = heapq.nlargest(limit, results, key=lambda x: x["score"])
 
-    return results[:limit]
+    # At most `limit` winners still need a body, too few to be worth a
+    # process pool, so they are parsed in turn
+    for r in top:
+        if r["body_preview"] is None:
+            r["body_preview"] = parse_eml_file(GMAIL_DIR / r["filename"]).get("body_preview", "")
+        del r["filename"]
+    return top
 
 
-def generate_answer(query: str, results: list[dict]) -> str:
+def generate_answer(query: str, results: list[dict], use_cache: bool = True) -> str:
     """Use LLM to synthesize an answer from search results."""
     if not results:
         return "No relevant emails found for your query."
 
-    # Build context from results
-    email_context = []
-    for i, r in enumerate(results[:7], 1):  # Limit to top 7 for prompt size
-        email_context.append(f"""
---- Email {i} ---
-From: {r['from_name']} <{r['from_email']}>
-Date: {r['date']}
-Subject: {r['subject']}
-Body excerpt:
-{r['body_preview']}
-""")
-
-    prompt = f"""Based on these emails, answer the user's question. Be concise and specific.
-
-QUESTION: {query}
-
-EMAILS:
-{"".join(email_context)}
-
-Provide:
-1. A direct answer to the question (2-4 sentences)
-2. Cite specific emails by number when referencing information (e.g., "In Email 2, ...")
-
-If the emails don't contain enough information to fully answer the question, say so."""
+    # Build context from results; limit to top 7 for prompt size
+    email_context = "".join(
+        ANSWER_EMAIL_TEMPLATE % (i, r["from_name"], r["from_email"], r["date"], r["subject"], r["body_preview"])
+        for i, r in enumerate(results[:7], 1)
+    )
 
-    return call_claude(prompt, timeout=120)
+    return call_claude(
+        ANSWER_TEMPLATE % (query, email_context), timeout=120, system=ANSWER_SYSTEM_PROMPT, use_cache=use_cache
+    )
 
 
 def format_date(date_str: str) -> str:
@@ -386,9 +391,7 @@ def print_results(query: str, results: list[dict], answer: str, list_only: bool)
         print(f"   {r['subject']}")
         date_formatted = format_date(r['date'])
         # Strip HTML tags from snippet for cleaner CLI output
-        clean_preview = re.sub(r"<[^>]+>", " ", r['body_preview'])
-        clean_preview = re.sub(r"\s+", " ", clean_preview).strip()
-        snippet = clean_preview[:80]
+        snippet = strip_html_tags(r['body_preview'])[:80]
         if snippet:
             print(f"   {date_formatted} · \"{snippet}...\"")
         else:
@@ -400,34 +403,31 @@ def print_results(query: str, results: list[dict], answer: str, list_only: bool)
 
 def strip_html_tags(text: str) -> str:
     """Remove HTML tags from text."""
-    clean = re.sub(r"<[^>]+>", " ", text)
-    clean = re.sub(r"\s+", " ", clean)
-    return clean.strip()
+    # str.split() with no separator collapses the same whitespace as \s+
+    return " ".join(HTML_TAG_RE.sub(" ", text).split())
+
+
+def _link_email_ref(match: re.Match) -> str:
+    """Replace an "Email N" / "Emails N, M" reference with source links."""
+    text = match.group(0)
+    nums = DIGITS_RE.findall(text)
+    # Handle ranges like "Emails 2, 3" or "Emails 2-3"
+    if "Emails" in text:
+        links = [f'<a href="#source-{n}" class="email-ref">Email {n}</a>' for n in nums]
+        return "Emails " + ", ".join(links).replace("Email ", "")
+    return f'<a href="#source-{nums[0]}" class="email-ref">Email {nums[0]}</a>'
 
 
 def format_answer_html(answer: str) -> str:
     """Convert markdown in answer to HTML and linkify email references."""
     # Convert markdown bold **text** to <strong>text</strong>
-    html = re.sub(r"\*\*([^*]+)\*\*", r"<strong>\1</strong>", answer)
+    html = BOLD_RE.sub(r"<strong>\1</strong>", answer)
 
     # Convert markdown italic *text* to <em>text</em> (but not inside URLs)
-    html = re.sub(r"(?<![:/])\*([^*]+)\*", r"<em>\1</em>", html)
+    html = ITALIC_RE.sub(r"<em>\1</em>", html)
 
     # Linkify email references like "Email 1", "(Email 5)", "Emails 2, 3"
-    def linkify_email_ref(match):
-        text = match.group(0)
-        # Handle ranges like "Emails 2, 3" or "Emails 2-3"
-        if "Emails" in text:
-            nums = re.findall(r"\d+", text)
-            links = [f'<a href="#source-{n}" class="email-ref">Email {n}</a>' for n in nums]
-            return "Emails " + ", ".join(links).replace("Email ", "")
-        else:
-            num = re.search(r"\d+", text).group()
-            return f'<a href="#source-{num}" class="email-ref">Email {num}</a>'
-
-    html = re.sub(r"Emails?\s*\d+(?:\s*[,\-]\s*\d+)*", linkify_email_ref, html)
-
-    return html
+    return EMAIL_REF_RE.sub(_link_email_ref, html)
 
 
 def render_html_results(query: str, results: list[dict], answer: str) -> Path:
@@ -435,9 +435,7 @@ def render_html_results(query: str, results: list[dict], answer: str) -> Path:
     # Ensure output directory exists
     SEARCHES_DIR.mkdir(parents=True, exist_ok=True)
 
-    # Set up Jinja2
-    env = Environment(loader=FileSystemLoader(TEMPLATES_DIR))
-    template = env.get_template("search-results.html")
+    template = template_env(TEMPLATES_DIR, TEMPLATE_CACHE_DIR).get_template("search-results.html")
 
     # Format results for template
     formatted_results = []
@@ -456,22 +454,20 @@ def render_html_results(query: str, results: list[dict], answer: str) -> Path:
     # Format answer with HTML (bold, links to emails)
     answer_html = format_answer_html(answer) if answer else ""
 
-    # Generate HTML
-    html = template.render(
-        query=query,
-        answer=answer_html,
-        results=formatted_results,
-        result_count=len(results),
-        generated_at=datetime.now().strftime("%B %d, %Y at %I:%M %p")
-    )
-
     # Save to file with timestamp
     timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
     safe_query = re.sub(r"[^\w\s-]", "", query)[:30].strip().replace(" ", "-")
     filename = f"search-{timestamp}-{safe_query}.html"
     output_path = SEARCHES_DIR / filename
 
-    output_path.write_text(html)
+    # Generate HTML, streamed straight to the file
+    template.stream(
+        query=query,
+        answer=answer_html,
+        results=formatted_results,
+        result_count=len(results),
+        generated_at=datetime.now().strftime("%B %d, %Y at %I:%M %p")
+    ).dump(str(output_path), encoding="utf-8")
     return output_path
 
 
@@ -522,6 +518,11 @@ Examples:
         action="store_true",
         help="Don't automatically open HTML in browser"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always ask Claude instead of reusing cached answers for identical prompts"
+    )
     args = parser.parse_args()
 
     if not args.query:
@@ -536,36 +537,42 @@ Examples:
     query = args.query
     result_limit = args.limit
 
-    # Step 1: Parse query with LLM
-    print("🔎 Analyzing query...", file=sys.stderr)
-    parsed = parse_query(query)
-    keywords = parsed.get("keywords", [])
-    people = parsed.get("people", [])
-    date_hint = parsed.get("date_hint")
-
-    # Add --from filter to people if provided
-    if args.from_filter:
-        people.append(args.from_filter)
-
-    # Determine date range
     since = None
     until = None
-
     if args.since:
         try:
-            delta = parse_duration(args.since)
-            since = datetime.now() - delta
+            since = datetime.now() - parse_duration(args.since)
         except ValueError as e:
             print(f"Error: {e}", file=sys.stderr)
             sys.exit(1)
-    elif date_hint:
-        date_range = date_hint_to_range(date_hint)
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # The date-ranged fetch and indexing don't need the parsed query, so
+        # they run while Claude parses it. Unless --since pins the range, a
+        # date hint from the query can still narrow it, and the fetch is redone.
+        prefetch = executor.submit(prefetch_candidates, since, until)
+
+        # Step 1: Parse query with LLM
+        print("🔎 Analyzing query...", file=sys.stderr)
+        parsed = parse_query(query, use_cache=not args.no_cache)
+        keywords = parsed.get("keywords", [])
+        people = parsed.get("people", [])
+        date_hint = parsed.get("date_hint")
+
+        # Add --from filter to people if provided
+        if args.from_filter:
+            people.append(args.from_filter)
+
+        date_range = date_hint_to_range(date_hint) if date_hint and not args.since else None
+
+        # Step 2: Search for candidates. Wait for the prefetch even when the
+        # range changes, so only one thread writes to the index at a time.
+        print(f"🔍 Searching for: {keywords + people}...", file=sys.stderr)
+        candidates = prefetch.result()
         if date_range:
             since, until = date_range
-
-    # Step 2: Search for candidates
-    print(f"🔍 Searching for: {keywords + people}...", file=sys.stderr)
-    candidates = search_candidates(keywords, people, since, until)
+            candidates = fetch_candidates(since, until)
+        candidates = filter_candidates(candidates, keywords, people)
 
     if not candidates:
         print("\n❌ No emails found matching your query.")
@@ -583,7 +590,7 @@ Examples:
     answer = ""
     if not args.list_only:
         print("💭 Generating answer...", file=sys.stderr)
-        answer = generate_answer(query, results)
+        answer = generate_answer(query, results, use_cache=not args.no_cache)
 
     # Step 5: Print results
     print_results(query, results, answer, args.list_only)
@@ -7,6 +7,7 @@ import json
 import re
 import sqlite3
 import sys
+from collections import defaultdict
 from datetime import datetime, timedelta
 from pathlib import Path
 
@@ -17,70 +18,109 @@ GMAIL_BASE_URL = "https://mail.google.com/mail/u/0/#all"
 DB_PATH = Path.home() / "MAIL" / "gmail" / "msg-db.sqlite"
 
 
+# Duration strings like '12h' or '1mo', and the timedelta each unit maps to
+DURATION_RE = re.compile(r"^(\d+)(h|d|w|mo|y)$")
+DURATION_UNITS = {
+    "h": lambda value: timedelta(hours=value),
+    "d": lambda value: timedelta(days=value),
+    "w": lambda value: timedelta(weeks=value),
+    "mo": lambda value: timedelta(days=value * 30),  # Approximate
+    "y": lambda value: timedelta(days=value * 365),
+}
+
+
 def parse_duration(duration_str: str) -> timedelta:
-    """Parse duration string like '1d', '12h', '1w', '1mo' into timedelta."""
-    match = re.match(r"^(\d+)(h|d|w|mo)$", duration_str.lower())
+    """Parse duration string like '1d', '12h', '1w', '1mo', '1y' into timedelta."""
+    match = DURATION_RE.match(duration_str.lower())
     if not match:
-        raise ValueError(f"Invalid duration format: {duration_str}. Use: 1d, 12h, 1w, 1mo")
-
-    value = int(match.group(1))
-    unit = match.group(2)
-
-    if unit == "h":
-        return timedelta(hours=value)
-    elif unit == "d":
-        return timedelta(days=value)
-    elif unit == "w":
-        return timedelta(weeks=value)
-    elif unit == "mo":
-        return timedelta(days=value * 30)  # Approximate
-    else:
-        raise ValueError(f"Unknown unit: {unit}")
+        raise ValueError(f"Invalid duration format: {duration_str}. Use: 1d, 12h, 1w, 1mo, 1y")
+    return DURATION_UNITS[match.group(2)](int(match.group(1)))
 
 
-def fetch_emails(since: datetime) -> list[dict]:
-    """Fetch emails from SQLite database since the given datetime."""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    # Query messages with their labels and UIDs
-    query = """
-    SELECT
-        m.message_num,
-        m.message_filename,
-        m.message_internaldate,
-        u.uid,
-        GROUP_CONCAT(l.label, '|') as labels
+# Per-connection read tuning; the archive belongs to GYB, so nothing here
+# changes the database file (no journal_mode switch)
+READ_PRAGMAS = (
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-65536",
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+def open_archive(db_path: Path = DB_PATH) -> sqlite3.Connection:
+    """Open the GYB archive database read-only, tuned for large scans."""
+    conn = sqlite3.connect(f"{db_path.as_uri()}?mode=ro", uri=True)
+    for pragma in READ_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+LOOKUP_CHUNK = 900
+
+
+def _rows_by_message_num(conn: sqlite3.Connection, sql: str, message_nums: list[int]) -> list[tuple]:
+    """Run `sql` (with a {placeholders} slot) over message_nums in chunks."""
+    rows = []
+    for start in range(0, len(message_nums), LOOKUP_CHUNK):
+        chunk = message_nums[start:start + LOOKUP_CHUNK]
+        rows.extend(conn.execute(sql.format(placeholders=",".join("?" * len(chunk))), chunk))
+    return rows
+
+
+def query_messages(
+    conn: sqlite3.Connection, where_clause: str, params: list, limit: int | None = None
+) -> list[dict]:
+    """Select messages newest first, then attach their labels and UIDs.
+
+    Labels and UIDs are looked up for the selected messages only, instead of
+    joining and grouping the whole labels table before ORDER BY/LIMIT apply.
+    """
+    sql = f"""
+    SELECT m.message_num, m.message_filename, m.message_internaldate
     FROM messages m
-    LEFT JOIN uids u ON m.message_num = u.message_num
-    LEFT JOIN labels l ON m.message_num = l.message_num
-    WHERE m.message_internaldate >= ?
-    GROUP BY m.message_num
+    WHERE {where_clause}
     ORDER BY m.message_internaldate DESC
     """
-
-    cursor.execute(query, (since.strftime("%Y-%m-%d %H:%M:%S"),))
-    rows = cursor.fetchall()
-    conn.close()
+    if limit is not None:
+        sql += f"LIMIT {int(limit)}"
+    rows = conn.execute(sql, params).fetchall()
+    message_nums = [row[0] for row in rows]
+
+    labels = defaultdict(list)
+    for message_num, label in _rows_by_message_num(
+        conn, "SELECT message_num, label FROM labels WHERE message_num IN ({placeholders})", message_nums
+    ):
+        labels[message_num].append(label)
+
+    uids = {}
+    for message_num, uid in _rows_by_message_num(
+        conn, "SELECT message_num, uid FROM uids WHERE message_num IN ({placeholders})", message_nums
+    ):
+        uids.setdefault(message_num, uid)
 
     emails = []
-    for row in rows:
-        labels = row["labels"].split("|") if row["labels"] else []
-        uid = row["uid"] or ""
-
+    for message_num, filename, date in rows:
+        uid = uids.get(message_num) or ""
         emails.append({
-            "message_num": row["message_num"],
+            "message_num": message_num,
             "uid": uid,
             "gmail_link": f"{GMAIL_BASE_URL}/{uid}" if uid else "",
-            "filename": row["message_filename"],
-            "date": row["message_internaldate"],
-            "labels": labels
+            "filename": filename,
+            "date": date,
+            "labels": labels.get(message_num, [])
         })
-
     return emails
 
 
+def fetch_emails(since: datetime) -> list[dict]:
+    """Fetch emails from SQLite database since the given datetime."""
+    conn = open_archive(DB_PATH)
+    try:
+        return query_messages(conn, "m.message_internaldate >= ?", [since.strftime("%Y-%m-%d %H:%M:%S")])
+    finally:
+        conn.close()
+
+
 def main():
     parser = argparse.ArgumentParser(description="Fetch recent emails from GYB database")
     parser.add_argument(
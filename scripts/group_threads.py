@@ -3,72 +3,95 @@
 # ABOUTME: Usage: uv run scripts/group_threads.py --input parsed.json --raw raw.json --output grouped.json
 
 import argparse
-import json
 import re
 import sys
 from collections import defaultdict
-from datetime import datetime
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 
+import orjson
 
+
+# Per-message fields only used while grouping; nothing downstream reads them
+GROUPING_ONLY_KEYS = frozenset({"references", "filepath", "body_length"})
+
+# One or more leading Re:/Fwd:/Fw: prefixes (case-insensitive)
+SUBJECT_PREFIX_RE = re.compile(r'^(?:(?:re|fwd|fw):\s*)+', re.IGNORECASE)
+
+# Trailing timezone name in parentheses like "(PST)"
+TZ_NAME_RE = re.compile(r'\s*\([A-Z]{3,4}\)\s*$')
+
+
+@lru_cache(maxsize=4096)
 def normalize_subject(subject: str) -> str:
-    """Remove Re:, Fwd:, etc. prefixes to get base subject for fallback matching."""
-    # Remove common prefixes (case-insensitive)
-    normalized = re.sub(r'^(re|fwd|fw):\s*', '', subject.strip(), flags=re.IGNORECASE)
-    # Remove multiple prefixes
-    while re.match(r'^(re|fwd|fw):\s*', normalized, flags=re.IGNORECASE):
-        normalized = re.sub(r'^(re|fwd|fw):\s*', '', normalized, flags=re.IGNORECASE)
-    return normalized.strip()
+    """Remove Re:, Fwd:, etc. prefixes to get base subject for fallback matching.
+
+    Memoized: a thread's subject is normalized for the orphan merge and
+    again for its base subject, and orphans often share one subject.
+    """
+    return SUBJECT_PREFIX_RE.sub('', subject.strip()).strip()
 
 
+@lru_cache(maxsize=None)
 def parse_date(date_str: str) -> datetime:
-    """Parse email date string to datetime for sorting."""
+    """Parse email date string to a naive UTC datetime for sorting.
+
+    ISO dates (as stored by GYB) start with a four-digit year and go
+    straight to fromisoformat; everything else is RFC 2822 and goes through
+    email.utils, so neither format pays for a failed parse of the other.
+    Aware results are converted to naive UTC, so dates with and without
+    offsets, and datetime.min, still compare.
+    Memoized: each thread's newest date is parsed again for the final sort.
+    """
     if not date_str:
         return datetime.min
 
-    # Common email date formats
-    formats = [
-        "%a, %d %b %Y %H:%M:%S %z",
-        "%a, %d %b %Y %H:%M:%S %Z",
-        "%d %b %Y %H:%M:%S %z",
-        "%Y-%m-%d %H:%M:%S",
-    ]
-
-    # Remove timezone name in parentheses like "(PST)"
-    date_str = re.sub(r'\s*\([A-Z]{3,4}\)\s*$', '', date_str)
-
-    for fmt in formats:
-        try:
-            return datetime.strptime(date_str.strip(), fmt)
-        except ValueError:
-            continue
-
-    return datetime.min
+    date_str = date_str.strip()
+    if date_str.endswith(')'):
+        # Remove timezone name in parentheses like "(PST)"
+        date_str = TZ_NAME_RE.sub('', date_str)
 
+    try:
+        if date_str[:4].isdigit():
+            dt = datetime.fromisoformat(date_str)
+        else:
+            dt = parsedate_to_datetime(date_str)
+    except (TypeError, ValueError):
+        return datetime.min
 
-def find_thread_root(email: dict, message_id_map: dict) -> str:
-    """Find the root message ID of a thread by walking up In-Reply-To chain."""
-    visited = set()
-    current_id = email.get("message_id", "")
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
 
-    if not current_id:
-        return ""
 
-    while current_id and current_id not in visited:
-        visited.add(current_id)
+def thread_roots(message_id_map: dict) -> dict[str, str]:
+    """Map every Message-ID in the set to the ID of its thread's root message.
 
-        current_email = message_id_map.get(current_id)
-        if not current_email:
-            # This message ID is not in our set, it's the root (or external)
-            break
+    A union-find pass: each email is joined to its In-Reply-To parent, or,
+    when that parent is not in the set, to the first References ancestor
+    that is. Path halving keeps long reply chains near-linear, and cycles
+    in the headers cannot loop.
+    """
+    parent = {msg_id: msg_id for msg_id in message_id_map}
 
-        parent_id = current_email.get("in_reply_to", "")
-        if not parent_id:
-            # No parent, this is the root
-            break
+    def find(msg_id: str) -> str:
+        while parent[msg_id] != msg_id:
+            parent[msg_id] = parent[parent[msg_id]]
+            msg_id = parent[msg_id]
+        return msg_id
 
-        current_id = parent_id
+    for msg_id, email in message_id_map.items():
+        ancestor = email.get("in_reply_to") or ""
+        if ancestor not in message_id_map:
+            ref_ids = (r.strip().strip("<>") for r in (email.get("references") or "").split())
+            ancestor = next((ref_id for ref_id in ref_ids if ref_id in message_id_map), "")
+        if ancestor:
+            root, ancestor_root = find(msg_id), find(ancestor)
+            if root != ancestor_root:
+                parent[root] = ancestor_root
 
-    return current_id
+    return {msg_id: find(msg_id) for msg_id in message_id_map}
 
 
 def group_emails_by_thread(parsed_emails: list, raw_emails: list) -> list:
@@ -76,23 +99,22 @@ def group_emails_by_thread(parsed_emails: list, raw_emails: list) -> list:
     # Create lookup by message_num for raw emails (contains labels, gmail_link)
     raw_lookup = {e["message_num"]: e for e in raw_emails}
 
-    # Merge raw data into parsed emails
+    # Merge raw data into parsed emails and build the message_id → email map
+    message_id_map = {}
     for email in parsed_emails:
         msg_num = email.get("message_num")
-        if msg_num and msg_num in raw_lookup:
-            raw = raw_lookup[msg_num]
+        raw = raw_lookup.get(msg_num) if msg_num else None
+        if raw is not None:
             email["uid"] = raw.get("uid", "")
             email["gmail_link"] = raw.get("gmail_link", "")
             email["labels"] = raw.get("labels", "")
 
-    # Build message_id → email map
-    message_id_map = {}
-    for email in parsed_emails:
         msg_id = email.get("message_id", "")
         if msg_id:
             message_id_map[msg_id] = email
 
     # Group by thread root
+    roots = thread_roots(message_id_map)
     thread_groups = defaultdict(list)
     orphans = []  # Emails without message_id
 
@@ -104,24 +126,7 @@ def group_emails_by_thread(parsed_emails: list, raw_emails: list) -> list:
             orphans.append(email)
             continue
 
-        # Find thread root
-        root_id = find_thread_root(email, message_id_map)
-
-        # If root_id is not in our set, use references to find earliest known ancestor
-        if root_id not in message_id_map:
-            references = email.get("references", "")
-            if references:
-                ref_ids = [r.strip().strip("<>") for r in references.split()]
-                for ref_id in ref_ids:
-                    if ref_id in message_id_map:
-                        root_id = ref_id
-                        break
-
-        # If still not found, use own message_id as root
-        if root_id not in message_id_map:
-            root_id = msg_id
-
-        thread_groups[root_id].append(email)
+        thread_groups[roots[msg_id]].append(email)
 
     # Fallback: group orphans by normalized subject
     subject_groups = defaultdict(list)
@@ -133,16 +138,17 @@ def group_emails_by_thread(parsed_emails: list, raw_emails: list) -> list:
             # Can't group, treat as single
             subject_groups[f"_orphan_{id(email)}"] = [email]
 
-    # Merge subject groups into thread groups if they match existing threads
+    # Merge subject groups into thread groups if they match existing threads;
+    # each thread's subject is normalized once, and the first thread wins
+    thread_by_subject = {}
+    for root_id, thread_emails in thread_groups.items():
+        thread_by_subject.setdefault(normalize_subject(thread_emails[0].get("subject", "")), root_id)
+
     for norm_subj, emails in subject_groups.items():
-        matched = False
-        for root_id, thread_emails in thread_groups.items():
-            thread_norm_subj = normalize_subject(thread_emails[0].get("subject", ""))
-            if thread_norm_subj == norm_subj:
-                thread_groups[root_id].extend(emails)
-                matched = True
-                break
-        if not matched:
+        root_id = thread_by_subject.get(norm_subj)
+        if root_id is not None:
+            thread_groups[root_id].extend(emails)
+        else:
             # Create new group with fake root ID
             thread_groups[f"_subject_{norm_subj}"] = emails
 
@@ -150,9 +156,6 @@ def group_emails_by_thread(parsed_emails: list, raw_emails: list) -> list:
     items = []
 
     for root_id, messages in thread_groups.items():
-        # Sort messages chronologically
-        messages.sort(key=lambda e: parse_date(e.get("date", "")))
-
         if len(messages) == 1:
             # Single email - not a thread
             items.append({
@@ -160,7 +163,8 @@ def group_emails_by_thread(parsed_emails: list, raw_emails: list) -> list:
                 "messages": messages
             })
         else:
-            # Multi-message thread
+            # Multi-message thread, sorted chronologically
+            messages.sort(key=lambda e: parse_date(e.get("date", "")))
             participants = list(dict.fromkeys(m.get("from_name", "") for m in messages))
             # Use subject from first message (oldest)
             base_subject = normalize_subject(messages[0].get("subject", ""))
@@ -188,6 +192,16 @@ def group_emails_by_thread(parsed_emails: list, raw_emails: list) -> list:
     return items
 
 
+def strip_grouping_fields(items: list) -> list:
+    """Drop grouping-only fields from every message, in place."""
+    for item in items:
+        item["messages"] = [
+            {k: v for k, v in msg.items() if k not in GROUPING_ONLY_KEYS}
+            for msg in item["messages"]
+        ]
+    return items
+
+
 def main():
     parser = argparse.ArgumentParser(description="Group emails by thread")
     parser.add_argument("--input", required=True, help="Parsed emails JSON file")
@@ -196,8 +210,8 @@ def main():
     args = parser.parse_args()
 
     # Load parsed emails
-    with open(args.input) as f:
-        parsed_data = json.load(f)
+    with open(args.input, "rb") as f:
+        parsed_data = orjson.loads(f.read())
 
     # Handle list or dict format
     if isinstance(parsed_data, list):
@@ -206,8 +220,8 @@ def main():
         parsed_emails = parsed_data.get("emails", [])
 
     # Load raw emails
-    with open(args.raw) as f:
-        raw_data = json.load(f)
+    with open(args.raw, "rb") as f:
+        raw_data = orjson.loads(f.read())
 
     if isinstance(raw_data, list):
         raw_emails = raw_data
@@ -215,7 +229,7 @@ def main():
         raw_emails = raw_data.get("emails", raw_data)
 
     # Group into threads
-    items = group_emails_by_thread(parsed_emails, raw_emails)
+    items = strip_grouping_fields(group_emails_by_thread(parsed_emails, raw_emails))
 
     # Count stats
     thread_count = sum(1 for i in items if i["is_thread"])
@@ -226,9 +240,9 @@ def main():
     print(f"   {thread_count} threads (2+ messages)", file=sys.stderr)
     print(f"   {single_count} single emails", file=sys.stderr)
 
-    # Write output
-    with open(args.output, "w") as f:
-        json.dump({"items": items}, f, indent=2)
+    # Write output compactly; it is only read back by the classifier
+    with open(args.output, "wb") as f:
+        f.write(orjson.dumps({"items": items}))
 
     print(f"✅ Output written to {args.output}", file=sys.stderr)
 
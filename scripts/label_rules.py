@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# ABOUTME: Gmail label rules and template summaries shared by both classifiers
+# ABOUTME: Maps category labels (CATEGORY_PROMOTIONS, ...) to brief categories
+
+from collections.abc import Iterable
+from functools import lru_cache
+
+# Checked in order; the first label present decides the category
+LABEL_RULES = (
+    ("CATEGORY_PROMOTIONS", "NEWSLETTER"),
+    ("CATEGORY_UPDATES", "AUTOMATED"),
+)
+
+# Summaries for emails classified without the LLM, keyed by category
+SUMMARY_TEMPLATES = {
+    "NEWSLETTER": "Marketing email from {from_name} about {subject}",
+    "URGENT": "Urgent email from {from_name}: {subject}",
+    "NEEDS_RESPONSE": "{from_name} is asking for a reply: {subject}",
+    "AUTOMATED": "Notification from {from_name}: {subject}",
+    "FINANCIAL": "Account notice from {from_name}: {subject}",
+    "CALENDAR": "Calendar update from {from_name}: {subject}",
+}
+
+
+def label_set(labels: str | Iterable[str] | None) -> frozenset[str]:
+    """Normalize labels to a set. Accepts a list or a '|'-joined string."""
+    if not labels:
+        return frozenset()
+    if isinstance(labels, str):
+        return frozenset(labels.split("|"))
+    return frozenset(labels)
+
+
+def category_from_labels(labels: str | Iterable[str] | None) -> str | None:
+    """Return the category implied by Gmail labels, or None."""
+    if isinstance(labels, str):
+        return _category_from_label_string(labels)
+    return _category_from_label_set(label_set(labels))
+
+
+@lru_cache(maxsize=1024)
+def _category_from_label_string(labels: str) -> str | None:
+    """category_from_labels() for '|'-joined strings, memoized.
+
+    An inbox only has a handful of distinct label combinations, so most
+    lookups skip the split entirely.
+    """
+    return _category_from_label_set(label_set(labels))
+
+
+def _category_from_label_set(labels: frozenset[str]) -> str | None:
+    """Return the category of the first LABEL_RULES label present."""
+    for label, category in LABEL_RULES:
+        if label in labels:
+            return category
+    return None
+
+
+def template_summary(email: dict, category: str) -> str:
+    """Generate a template summary for an email classified without the LLM."""
+    template = SUMMARY_TEMPLATES.get(category, SUMMARY_TEMPLATES["AUTOMATED"])
+    return template.format(
+        from_name=email.get("from_name", "Unknown"),
+        subject=email.get("subject", ""),
+    )
@@ -5,24 +5,48 @@
 import argparse
 import email
 import email.policy
-import json
 import re
 import sys
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
 from email.header import decode_header
 from html import unescape
 from pathlib import Path
 
+import orjson
+
 # Base path for email files
 GMAIL_DIR = Path.home() / "MAIL" / "gmail"
 
 # Maximum body preview length
 MAX_BODY_PREVIEW = 1500
 
+# Batches are parsed in a process pool once they have this many emails;
+# workers take chunks of PARALLEL_PARSE_CHUNK to amortize the IPC
+PARALLEL_PARSE_MIN = 16
+PARALLEL_PARSE_CHUNK = 32
+
+# strip_html() patterns, compiled once for every HTML body parsed
+STYLE_SCRIPT_RE = re.compile(r'<(style|script)[^>]*>.*?</\1>', re.DOTALL | re.IGNORECASE)
+LINE_BREAK_TAG_RE = re.compile(r'<br\s*/?>|</p>|</div>', re.IGNORECASE)
+TAG_RE = re.compile(r'<[^>]+>')
+BLANK_LINES_RE = re.compile(r'\n\s*\n')
+SPACES_RE = re.compile(r' {2,}')
+
+# From header: "Name" <email> or Name <email>; the name may be empty
+NAMED_ADDRESS_RE = re.compile(r'^"?([^"<]*)"?\s*<\s*([^<>@\s]+@[^<>\s]+)\s*>$')
+
+# From header that is just an email address
+BARE_ADDRESS_RE = re.compile(r'^([^<>@\s]+@[^<>\s]+)$')
+
 
 def decode_mime_header(header_value: str) -> str:
     """Decode MIME-encoded header (e.g., =?utf-8?Q?...?=)."""
     if not header_value:
         return ""
+    # Most headers carry no encoded words; decode_header() would return them unchanged
+    if "=?" not in header_value:
+        return str(header_value)
 
     decoded_parts = []
     for part, charset in decode_header(header_value):
@@ -42,49 +66,55 @@ def extract_name_and_email(from_header: str) -> tuple[str, str]:
     """Extract display name and email from From header."""
     from_header = decode_mime_header(from_header)
 
-    # Pattern: "Name" <email> or Name <email> or just email
-    match = re.match(r'^"?([^"<]*)"?\s*<?([^>]+@[^>]+)>?$', from_header.strip())
-    if match:
-        name = match.group(1).strip()
-        email_addr = match.group(2).strip()
-        if not name:
-            name = email_addr.split("@")[0]
-        return name, email_addr
+    stripped = from_header.strip()
+    if match := NAMED_ADDRESS_RE.match(stripped):
+        name, email_addr = match.group(1).strip(), match.group(2)
+    elif match := BARE_ADDRESS_RE.match(stripped):
+        name, email_addr = "", match.group(1)
+    else:
+        # Fallback: just return as-is
+        return from_header, from_header
 
-    # Fallback: just return as-is
-    return from_header, from_header
+    # An empty name falls back to the email username
+    return name or email_addr.split("@")[0], email_addr
 
 
 def strip_html(html: str) -> str:
     """Convert HTML to plain text."""
     # Remove style and script tags with content
-    html = re.sub(r'<style[^>]*>.*?</style>', '', html, flags=re.DOTALL | re.IGNORECASE)
-    html = re.sub(r'<script[^>]*>.*?</script>', '', html, flags=re.DOTALL | re.IGNORECASE)
+    html = STYLE_SCRIPT_RE.sub('', html)
 
-    # Replace <br> and <p> with newlines
-    html = re.sub(r'<br\s*/?>', '\n', html, flags=re.IGNORECASE)
-    html = re.sub(r'</p>', '\n', html, flags=re.IGNORECASE)
-    html = re.sub(r'</div>', '\n', html, flags=re.IGNORECASE)
+    # Replace <br>, </p> and </div> with newlines
+    html = LINE_BREAK_TAG_RE.sub('\n', html)
 
     # Remove all other tags
-    html = re.sub(r'<[^>]+>', '', html)
+    html = TAG_RE.sub('', html)
 
     # Decode HTML entities
     text = unescape(html)
 
-    # Normalize whitespace
-    text = re.sub(r'\n\s*\n', '\n\n', text)
-    text = re.sub(r' +', ' ', text)
+    # Normalize whitespace; most bodies need neither pass, so check first
+    if text.count('\n') > 1:
+        text = BLANK_LINES_RE.sub('\n\n', text)
+    if '  ' in text:
+        text = SPACES_RE.sub(' ', text)
 
     return text.strip()
 
 
-def get_body_text(msg: email.message.Message) -> str:
-    """Extract plain text body from email message."""
+def get_body_text(msg: email.message.Message, max_chars: int | None = None) -> str:
+    """Extract plain text body from email message.
+
+    With max_chars, stops decoding further parts once that much text has
+    been collected; callers that only keep a preview pass their cut-off.
+    """
     body_parts = []
 
     if msg.is_multipart():
+        collected = 0
         for part in msg.walk():
+            if max_chars is not None and collected >= max_chars:
+                break
             content_type = part.get_content_type()
             content_disposition = str(part.get("Content-Disposition", ""))
 
@@ -97,6 +127,7 @@ def get_body_text(msg: email.message.Message) -> str:
                     payload = part.get_payload(decode=True)
                     charset = part.get_content_charset() or "utf-8"
                     body_parts.append(payload.decode(charset, errors="replace"))
+                    collected += len(body_parts[-1])
                 except Exception:
                     pass
             elif content_type == "text/html" and not body_parts:
@@ -106,6 +137,7 @@ def get_body_text(msg: email.message.Message) -> str:
                     charset = part.get_content_charset() or "utf-8"
                     html = payload.decode(charset, errors="replace")
                     body_parts.append(strip_html(html))
+                    collected += len(body_parts[-1])
                 except Exception:
                     pass
     else:
@@ -170,6 +202,30 @@ def parse_eml(filepath: Path) -> dict:
     }
 
 
+def parse_batch_item(item: str | dict) -> dict:
+    """Parse one batch entry: a filename, or a fetch_emails.py email with 'filename'."""
+    if isinstance(item, str):
+        filename = item
+        message_num = None
+    else:
+        filename = item.get("filename", "")
+        message_num = item.get("message_num")
+
+    result = parse_eml(GMAIL_DIR / filename)
+    if message_num is not None:
+        result["message_num"] = message_num
+    return result
+
+
+def parse_batch(emails: list) -> Iterator[dict]:
+    """Parse batch entries in input order, across processes for larger batches."""
+    if len(emails) < PARALLEL_PARSE_MIN:
+        yield from map(parse_batch_item, emails)
+        return
+    with ProcessPoolExecutor() as executor:
+        yield from executor.map(parse_batch_item, emails, chunksize=PARALLEL_PARSE_CHUNK)
+
+
 def main():
     parser = argparse.ArgumentParser(description="Parse EML file(s) and output JSON")
     parser.add_argument(
@@ -183,14 +239,14 @@ def main():
     )
     parser.add_argument(
         "--output",
-        help="Output file for batch results (default: stdout)"
+        help="Output file for batch results; a .jsonl path writes one email per line (default: stdout)"
     )
     args = parser.parse_args()
 
     if args.batch:
         # Read JSON from file
-        with open(args.batch) as f:
-            input_data = json.load(f)
+        with open(args.batch, "rb") as f:
+            input_data = orjson.loads(f.read())
 
         # Handle both formats: list of filenames or {emails: [...]} from fetch_emails.py
         if isinstance(input_data, list):
@@ -200,29 +256,24 @@ def main():
         else:
             emails = input_data.get("filenames", [])
 
-        results = []
-        for item in emails:
-            # Support both string filenames and email objects with 'filename' key
-            if isinstance(item, str):
-                filename = item
-                message_num = None
-            else:
-                filename = item.get("filename", "")
-                message_num = item.get("message_num")
-
-            filepath = GMAIL_DIR / filename
-            result = parse_eml(filepath)
-            if message_num is not None:
-                result["message_num"] = message_num
-            results.append(result)
-
-        output_json = json.dumps(results, indent=2)
+        if args.output and args.output.endswith(".jsonl"):
+            # JSONL: write each email as soon as it is parsed
+            count = 0
+            with open(args.output, "wb") as f:
+                for result in parse_batch(emails):
+                    f.write(orjson.dumps(result, option=orjson.OPT_APPEND_NEWLINE))
+                    count += 1
+            print(f"Parsed {count} emails to {args.output}", file=sys.stderr)
+            return
+
+        results = list(parse_batch(emails))
         if args.output:
-            with open(args.output, "w") as f:
-                f.write(output_json)
+            # Written compactly; the file is only read back by group_threads.py
+            with open(args.output, "wb") as f:
+                f.write(orjson.dumps(results))
             print(f"Parsed {len(results)} emails to {args.output}", file=sys.stderr)
         else:
-            print(output_json)
+            print(orjson.dumps(results, option=orjson.OPT_INDENT_2).decode())
 
     elif args.eml_file:
         # Parse single file
@@ -231,7 +282,7 @@ def main():
             filepath = GMAIL_DIR / filepath
 
         result = parse_eml(filepath)
-        print(json.dumps(result, indent=2))
+        print(orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
     else:
         parser.print_help()
         sys.exit(1)
@@ -3,13 +3,16 @@
 # ABOUTME: Usage: uv run scripts/render_brief.py --input classified.json --output brief.html
 
 import argparse
-import json
 import sys
 from datetime import datetime
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
 from pathlib import Path
 
+import orjson
+
 try:
-    from jinja2 import Environment, FileSystemLoader
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 except ImportError:
     print("Error: jinja2 not installed. Run: uv pip install jinja2", file=sys.stderr)
     sys.exit(1)
@@ -17,69 +20,61 @@ except ImportError:
 # Paths
 TEMPLATE_DIR = Path.home() / "MAIL" / "templates"
 BRIEFS_DIR = Path.home() / "MAIL" / "briefs"
+TEMPLATE_CACHE_DIR = Path.home() / "MAIL" / "template_cache"
+
+# Brief sections by category; organize_by_category() adds each one's emails
+SECTION_META = (
+    ("URGENT", {"name": "Urgent", "icon": "🔴", "css_class": "urgent"}),
+    ("NEEDS_RESPONSE", {"name": "Needs Response", "icon": "🟡", "css_class": "needs-response"}),
+    ("CALENDAR", {"name": "Calendar & Events", "icon": "📅", "css_class": "calendar"}),
+    ("FINANCIAL", {"name": "Financial", "icon": "💰", "css_class": "financial"}),
+    ("FYI", {"name": "FYI", "icon": "🔵", "css_class": "fyi"}),
+    ("NEWSLETTER", {"name": "Newsletters & Promotions", "icon": "📰", "css_class": "newsletter"}),
+    ("AUTOMATED", {"name": "Automated & Updates", "icon": "⚙️", "css_class": "automated"}),
+)
+
+# Order the sections appear in the brief
+SECTION_ORDER = ("URGENT", "NEEDS_RESPONSE", "CALENDAR", "FINANCIAL", "FYI", "AUTOMATED", "NEWSLETTER")
+
+
+@lru_cache(maxsize=None)
+def template_env(template_dir: Path, cache_dir: Path) -> Environment:
+    """Jinja2 environment for template_dir, shared per process.
+
+    Compiled templates are kept in cache_dir, so later runs skip parsing
+    and compiling; entries are keyed on the template source, so edited
+    templates are still picked up.
+    """
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    return Environment(
+        loader=FileSystemLoader(template_dir),
+        auto_reload=False,
+        bytecode_cache=FileSystemBytecodeCache(str(cache_dir)),
+    )
 
 
+@lru_cache(maxsize=4096)
 def format_date_short(date_str: str) -> str:
-    """Format date for display in email card."""
+    """Format date for display in email card, in the sender's local time.
+
+    Dispatches on the format like group_threads.parse_date: ISO dates start
+    with a four-digit year, anything else is RFC 2822.
+    """
+    if not date_str:
+        return ""
     try:
-        # Try parsing various formats
-        for fmt in ["%Y-%m-%d %H:%M:%S", "%a, %d %b %Y %H:%M:%S %z", "%a, %d %b %Y %H:%M:%S %Z"]:
-            try:
-                dt = datetime.strptime(date_str.split(" +")[0].split(" -")[0], fmt.split(" %z")[0].split(" %Z")[0])
-                return dt.strftime("%b %d, %I:%M %p")
-            except ValueError:
-                continue
+        if date_str[:4].isdigit():
+            dt = datetime.fromisoformat(date_str)
+        else:
+            dt = parsedate_to_datetime(date_str)
+    except ValueError:
         return date_str[:16]
-    except Exception:
-        return date_str[:16] if date_str else ""
+    return dt.strftime("%b %d, %I:%M %p")
 
 
 def organize_by_category(items: list[dict]) -> list[dict]:
     """Organize items (threads and single emails) into sections by category."""
-    sections = {
-        "URGENT": {
-            "name": "Urgent",
-            "icon": "🔴",
-            "css_class": "urgent",
-            "emails": []
-        },
-        "NEEDS_RESPONSE": {
-            "name": "Needs Response",
-            "icon": "🟡",
-            "css_class": "needs-response",
-            "emails": []
-        },
-        "CALENDAR": {
-            "name": "Calendar & Events",
-            "icon": "📅",
-            "css_class": "calendar",
-            "emails": []
-        },
-        "FINANCIAL": {
-            "name": "Financial",
-            "icon": "💰",
-            "css_class": "financial",
-            "emails": []
-        },
-        "FYI": {
-            "name": "FYI",
-            "icon": "🔵",
-            "css_class": "fyi",
-            "emails": []
-        },
-        "NEWSLETTER": {
-            "name": "Newsletters & Promotions",
-            "icon": "📰",
-            "css_class": "newsletter",
-            "emails": []
-        },
-        "AUTOMATED": {
-            "name": "Automated & Updates",
-            "icon": "⚙️",
-            "css_class": "automated",
-            "emails": []
-        }
-    }
+    sections = {key: {**meta, "emails": []} for key, meta in SECTION_META}
 
     for item in items:
         category = item.get("category", "FYI").upper()
@@ -89,8 +84,7 @@ def organize_by_category(items: list[dict]) -> list[dict]:
             sections["FYI"]["emails"].append(item)
 
     # Return as list, ordered
-    order = ["URGENT", "NEEDS_RESPONSE", "CALENDAR", "FINANCIAL", "FYI", "AUTOMATED", "NEWSLETTER"]
-    return [sections[cat] for cat in order]
+    return [sections[cat] for cat in SECTION_ORDER]
 
 
 def prepare_item_for_template(item: dict) -> dict:
@@ -130,9 +124,7 @@ def prepare_item_for_template(item: dict) -> dict:
 
 def render_brief(classified_items: list[dict], since: str, output_path: Path) -> None:
     """Render the brief HTML from classified items."""
-    # Set up Jinja2
-    env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
-    template = env.get_template("brief.html")
+    template = template_env(TEMPLATE_DIR, TEMPLATE_CACHE_DIR).get_template("brief.html")
 
     # Prepare each item for template
     for item in classified_items:
@@ -141,14 +133,23 @@ def render_brief(classified_items: list[dict], since: str, output_path: Path) ->
     # Organize into sections
     sections = organize_by_category(classified_items)
 
-    # Count stats
+    # Count stats in one pass
     total_count = len(classified_items)
-    urgent_count = len([i for i in classified_items if i.get("category", "").upper() == "URGENT"])
-    needs_response_count = len([i for i in classified_items if i.get("category", "").upper() == "NEEDS_RESPONSE"])
-    thread_count = len([i for i in classified_items if i.get("is_thread")])
+    urgent_count = needs_response_count = thread_count = 0
+    for item in classified_items:
+        category = item.get("category", "").upper()
+        if category == "URGENT":
+            urgent_count += 1
+        elif category == "NEEDS_RESPONSE":
+            needs_response_count += 1
+        if item.get("is_thread"):
+            thread_count += 1
 
-    # Render
-    html = template.render(
+    # Ensure output directory exists
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Render, streaming the HTML straight to the output file
+    template.stream(
         date=datetime.now().strftime("%A, %B %d, %Y"),
         since=since,
         total_count=total_count,
@@ -157,13 +158,7 @@ def render_brief(classified_items: list[dict], since: str, output_path: Path) ->
         needs_response_count=needs_response_count,
         sections=sections,
         generated_at=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    )
-
-    # Ensure output directory exists
-    output_path.parent.mkdir(parents=True, exist_ok=True)
-
-    # Write output
-    output_path.write_text(html)
+    ).dump(str(output_path), encoding="utf-8")
     # Print path to stdout (for shell capture) and message to stderr (for display)
     print(output_path)
     print(f"Brief written to: {output_path}", file=sys.stderr)
@@ -198,8 +193,8 @@ def main():
         print(f"Error: Input file not found: {input_path}", file=sys.stderr)
         sys.exit(1)
 
-    with open(input_path) as f:
-        data = json.load(f)
+    with open(input_path, "rb") as f:
+        data = orjson.loads(f.read())
 
     # Handle both formats: list or {"items": [...]}
     if isinstance(data, list):
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# ABOUTME: SQLite FTS5 keyword index over the EML archive, used by email_search.py
+# ABOUTME: Each message is parsed and indexed once; keyword matching becomes an index probe
+
+import email
+import email.policy
+import sqlite3
+from collections import Counter
+from collections.abc import Iterable
+from pathlib import Path
+
+from parse_eml import decode_mime_header, get_body_text
+
+# Default index location, next to the classification cache
+INDEX_DB_PATH = Path.home() / "MAIL" / "search_index.sqlite"
+
+# rowid is the archive's message_num. unicode61 folds case and (with
+# remove_diacritics 2) accents, so "Zoë" matches "zoe".
+_CREATE_TABLE_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    subject, sender, recipients, body,
+    tokenize='unicode61 remove_diacritics 2'
+)
+"""
+
+# Columns holding header text; people-only searches match just these
+HEADER_COLUMNS = ("sender", "recipients")
+
+# Keep IN (...) lists well under SQLite's bound-parameter limit
+_LOOKUP_CHUNK = 500
+
+
+def open_index(db_path: Path = INDEX_DB_PATH) -> sqlite3.Connection:
+    """Open (creating if needed) the search index database."""
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(_CREATE_TABLE_SQL)
+    return conn
+
+
+def extract_index_text(filepath: Path) -> tuple[str, str, str, str] | None:
+    """Return (subject, sender, recipients, body) for an EML file, or None if unreadable."""
+    try:
+        with open(filepath, "rb") as f:
+            msg = email.message_from_binary_file(f, policy=email.policy.default)
+    except OSError:
+        return None
+
+    return (
+        decode_mime_header(msg.get("Subject", "")),
+        decode_mime_header(msg.get("From", "")),
+        " ".join(decode_mime_header(msg.get(h, "")) for h in ("To", "Cc")).strip(),
+        get_body_text(msg),
+    )
+
+
+def _select_by_rowid(conn: sqlite3.Connection, columns: str, message_nums: list[int]) -> list[tuple]:
+    """Select `columns` for the given message_nums, in chunks."""
+    rows = []
+    for start in range(0, len(message_nums), _LOOKUP_CHUNK):
+        chunk = message_nums[start:start + _LOOKUP_CHUNK]
+        placeholders = ",".join("?" * len(chunk))
+        rows.extend(conn.execute(f"SELECT {columns} FROM messages_fts WHERE rowid IN ({placeholders})", chunk))
+    return rows
+
+
+def indexed_message_nums(conn: sqlite3.Connection, message_nums: list[int]) -> set[int]:
+    """Return which of the given message_nums are already in the index."""
+    return {row[0] for row in _select_by_rowid(conn, "rowid", message_nums)}
+
+
+def indexed_fields(conn: sqlite3.Connection, message_nums: list[int]) -> dict[int, tuple[str, str, str]]:
+    """Return {message_num: (subject, sender, body)} for the indexed messages.
+
+    The index keeps each message's decoded text, so callers can use it
+    instead of parsing the EML file again.
+    """
+    return {row[0]: row[1:] for row in _select_by_rowid(conn, "rowid, subject, sender, body", message_nums)}
+
+
+def index_messages(conn: sqlite3.Connection, messages: Iterable[tuple[int, Path]]) -> int:
+    """Index (message_num, filepath) pairs not yet in the index.
+
+    Missing or unreadable files are skipped and retried on a later call.
+    Returns the number of messages added.
+    """
+    messages = list(messages)
+    known = indexed_message_nums(conn, [num for num, _ in messages])
+
+    rows = []
+    for message_num, filepath in messages:
+        if message_num in known:
+            continue
+        fields = extract_index_text(filepath)
+        if fields is not None:
+            rows.append((message_num, *fields))
+
+    with conn:
+        conn.executemany(
+            "INSERT INTO messages_fts (rowid, subject, sender, recipients, body) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+    return len(rows)
+
+
+def term_query(term: str, columns: tuple[str, ...] | None = None) -> str:
+    """Build an FTS5 query matching a search term as a phrase prefix.
+
+    "interview" also matches "interviews", close to the substring match
+    this replaces; quotes keep FTS5 syntax characters literal. With
+    columns, only those columns are searched.
+    """
+    query = '"' + term.replace('"', '""') + '"*'
+    if columns:
+        query = "{" + " ".join(columns) + "} : " + query
+    return query
+
+
+def match_counts(conn: sqlite3.Connection, terms: list[str], columns: tuple[str, ...] | None = None) -> Counter:
+    """Count, per message_num, how many of the terms the message contains."""
+    counts = Counter()
+    for term in dict.fromkeys(t.strip() for t in terms):
+        if not term:
+            continue
+        rows = conn.execute("SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?", (term_query(term, columns),))
+        counts.update(row[0] for row in rows)
+    return counts
@@ -1,8 +1,14 @@
 # ABOUTME: Shared pytest fixtures for email agent tests
-# ABOUTME: Contains common test data and helper functions
+# ABOUTME: Contains common test data, helper functions, and the scripts/ import path
 
 import pytest
+import sqlite3
+import sys
 from datetime import datetime
+from pathlib import Path
+
+# Make the scripts directory importable once for every test module
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
 
 
 @pytest.fixture
@@ -79,3 +85,41 @@ def classified_emails():
             "summary": "Weekly tech news roundup.",
         },
     ]
+
+
+@pytest.fixture
+def gyb_db(tmp_path):
+    """A GYB-style msg-db.sqlite with three messages."""
+    path = tmp_path / "msg-db.sqlite"
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE messages (message_num INTEGER PRIMARY KEY, message_filename TEXT, message_internaldate TIMESTAMP);
+        CREATE TABLE labels (message_num INTEGER, label TEXT);
+        CREATE TABLE uids (message_num INTEGER, uid TEXT PRIMARY KEY);
+        INSERT INTO messages VALUES (1, '1.eml', '2025-01-01 09:00:00'), (2, '2.eml', '2025-01-02 09:00:00'),
+                                    (3, '3.eml', '2025-01-03 09:00:00');
+        INSERT INTO labels VALUES (1, 'INBOX'), (1, 'UNREAD'), (3, 'CATEGORY_UPDATES');
+        INSERT INTO uids VALUES (1, 'abc'), (3, 'def');
+    """)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def write_eml():
+    """Factory that writes a minimal plain-text EML file and returns its path.
+
+    The body defaults to "Body of <subject>".
+    """
+    def write(path: Path, subject: str, body: str | None = None,
+              sender: str = "Sarah Lee <sarah@example.com>") -> Path:
+        if body is None:
+            body = f"Body of {subject}"
+        path.write_text(
+            f"From: {sender}\nTo: me@example.com\nSubject: {subject}\n"
+            f"Content-Type: text/plain; charset=utf-8\n\n{body}\n"
+        )
+        return path
+
+    return write
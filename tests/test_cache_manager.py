@@ -2,22 +2,50 @@
 # ABOUTME: Tests cache key generation, storage, lookup, and stats
 
 import pytest
-import tempfile
+import sqlite3
+import threading
 from pathlib import Path
-import sys
-
-sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
 
+import cache_manager
 from cache_manager import (
     get_cache_key,
+    get_content_cache_key,
     init_cache_db,
     lookup_cache,
+    lookup_cache_bulk,
     save_to_cache,
+    save_many_to_cache,
     get_cache_stats,
     clear_cache,
+    close_connections,
+    hash_cache_key,
+    CacheWriter,
+    _get_conn,
 )
 
 
+# Cache rows for the stats and clear tests, saved in one transaction
+STATS_ROWS = [
+    ("msg:1", "FYI", "Sum1", None, 0.001, "claude-haiku-4-5", "2025-12-13T10:00:00"),
+    ("msg:2", "URGENT", "Sum2", None, 0.002, "claude-haiku-4-5", "2025-12-13T10:00:00"),
+    ("msg:3", "FYI", "Sum3", None, 0.003, "claude-haiku-4-5", "2025-12-13T10:00:00"),
+]
+
+
+@pytest.fixture
+def temp_db(tmp_path):
+    """An initialized cache database in pytest's per-test directory.
+
+    tmp_path also removes the WAL and shared-memory files SQLite leaves
+    next to the database. Durability is irrelevant here, so syncs are off.
+    """
+    db_path = tmp_path / "cache.sqlite"
+    init_cache_db(db_path)
+    _get_conn(db_path).execute("PRAGMA synchronous=OFF")
+    yield db_path
+    close_connections()
+
+
 class TestGetCacheKey:
     """Tests for get_cache_key() function."""
 
@@ -75,18 +103,50 @@ class TestGetCacheKey:
         assert get_cache_key(item) == ""
 
 
+class TestGetContentCacheKey:
+    """Tests for get_content_cache_key() function."""
+
+    def single(self, num, body="Body"):
+        return {"is_thread": False, "messages": [
+            {"message_num": num, "from_email": "a@x.com", "subject": "Hi", "body_preview": body}
+        ]}
+
+    def test_same_content_same_key(self):
+        """Identical emails with different message_nums share a key."""
+        key = get_content_cache_key(self.single(1))
+        assert key.startswith("content:")
+        assert key == get_content_cache_key(self.single(2))
+
+    def test_different_body_different_key(self):
+        """A different body gives a different key."""
+        assert get_content_cache_key(self.single(1)) != get_content_cache_key(self.single(1, "Other"))
+
+    def test_thread_has_no_content_key(self):
+        """Threads are keyed by membership only."""
+        thread = {"is_thread": True, "messages": [{"message_num": 1}, {"message_num": 2}]}
+        assert get_content_cache_key(thread) == ""
+
+
+class TestHashCacheKey:
+    """Tests for hash_cache_key() function."""
+
+    def test_deterministic(self):
+        """Same key always hashes to the same value."""
+        assert hash_cache_key("thread:100-200") == hash_cache_key("thread:100-200")
+
+    def test_distinct_keys(self):
+        """Different keys hash differently."""
+        assert hash_cache_key("msg:1") != hash_cache_key("msg:2")
+
+    def test_fits_sqlite_integer(self):
+        """Hash is a signed 64-bit integer."""
+        value = hash_cache_key("thread:1-2-3-4-5")
+        assert -(2 ** 63) <= value < 2 ** 63
+
+
 class TestCacheOperations:
     """Tests for cache database operations."""
 
-    @pytest.fixture
-    def temp_db(self):
-        """Create a temporary database for testing."""
-        with tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False) as f:
-            db_path = Path(f.name)
-        init_cache_db(db_path)
-        yield db_path
-        db_path.unlink(missing_ok=True)
-
     def test_lookup_nonexistent_returns_none(self, temp_db):
         """Looking up a non-existent key returns None."""
         result = lookup_cache("msg:99999", temp_db)
@@ -149,24 +209,161 @@ class TestCacheOperations:
         assert result["summary"] == "Updated"
         assert result["action_items"] == "Do now"
 
+    def test_init_enables_wal(self, temp_db):
+        """init_cache_db switches the database file to WAL journaling."""
+        conn = sqlite3.connect(temp_db)
+        try:
+            mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        finally:
+            conn.close()
+        assert mode == "wal"
+
+    def test_save_creates_schema_on_new_db(self, tmp_path):
+        """Saving to a fresh path creates the schema first."""
+        db_path = tmp_path / "fresh.sqlite"
+        try:
+            save_to_cache("msg:5", "FYI", "Fresh", None, 0.0, db_path=db_path)
+            save_to_cache("msg:6", "FYI", "Again", None, 0.0, db_path=db_path)
+            assert lookup_cache("msg:5", db_path)["summary"] == "Fresh"
+            assert get_cache_stats(db_path)["total_entries"] == 2
+        finally:
+            close_connections()
+
+    def test_save_many_and_lookup(self, temp_db):
+        """Bulk save writes every row."""
+        rows = [
+            ("msg:1", "FYI", "Sum1", None, 0.001, "claude-haiku-4-5", "2025-12-13T10:00:00"),
+            ("msg:2", "URGENT", "Sum2", "Act now", 0.002, "claude-haiku-4-5", "2025-12-13T10:00:00"),
+        ]
+        assert save_many_to_cache(rows, db_path=temp_db) == 2
+
+        assert lookup_cache("msg:1", temp_db)["summary"] == "Sum1"
+        assert lookup_cache("msg:2", temp_db)["action_items"] == "Act now"
+
+    def test_save_many_skips_empty_keys(self, temp_db):
+        """Rows without a cache key are ignored."""
+        rows = [("", "FYI", "Sum", None, 0.0, "claude-haiku-4-5", "2025-12-13T10:00:00")]
+        assert save_many_to_cache(rows, db_path=temp_db) == 0
+        assert get_cache_stats(temp_db)["total_entries"] == 0
+
+    def test_lookup_bulk(self, temp_db):
+        """Bulk lookup returns only the keys that are cached."""
+        save_to_cache("msg:1", "FYI", "Sum1", None, 0.001, db_path=temp_db)
+        save_to_cache("thread:2-3", "URGENT", "Sum2", None, 0.002, db_path=temp_db)
+
+        result = lookup_cache_bulk(["msg:1", "thread:2-3", "msg:404", ""], temp_db)
+        assert set(result) == {"msg:1", "thread:2-3"}
+        assert result["thread:2-3"]["category"] == "URGENT"
+        assert result["msg:1"]["from_cache"] is True
+
+    def test_lookup_bulk_chunks_large_key_sets(self, temp_db):
+        """More keys than one IN (...) query allows are still resolved."""
+        rows = [(f"msg:{n}", "FYI", f"Sum{n}", None, 0.0, "claude-haiku-4-5", "2025-12-13T10:00:00")
+                for n in range(2000)]
+        save_many_to_cache(rows, db_path=temp_db)
+
+        result = lookup_cache_bulk([f"msg:{n}" for n in range(2000)], temp_db)
+        assert len(result) == 2000
+
+    def test_save_waits_for_open_batch(self, temp_db, monkeypatch):
+        """A save from another thread waits out a batch instead of joining its transaction."""
+        in_batch = threading.Event()
+        saved = threading.Event()
+        real_hash_cache_key = cache_manager.hash_cache_key
+
+        def gated_hash_cache_key(cache_key):
+            if cache_key == "msg:gate":
+                in_batch.set()
+                saved.wait(timeout=0.2)
+            return real_hash_cache_key(cache_key)
+
+        def save_single():
+            in_batch.wait()
+            save_to_cache("msg:single", "FYI", "Sum", None, 0.0, db_path=temp_db)
+            saved.set()
+
+        monkeypatch.setattr(cache_manager, "hash_cache_key", gated_hash_cache_key)
+        thread = threading.Thread(target=save_single)
+        thread.start()
+        rows = [
+            ("msg:gate", "FYI", "Sum", None, 0.0, "claude-haiku-4-5", "2025-12-13T10:00:00"),
+            ("msg:bad", None, "Sum", None, 0.0, "claude-haiku-4-5", "2025-12-13T10:00:00"),
+        ]
+        with pytest.raises(sqlite3.IntegrityError):
+            save_many_to_cache(rows, temp_db)
+        thread.join()
+
+        # The failed batch rolled back, but not the other thread's row
+        assert lookup_cache("msg:gate", temp_db) is None
+        assert lookup_cache("msg:single", temp_db)["summary"] == "Sum"
+
+    def test_migrates_text_key_table(self, tmp_path):
+        """A cache created with the old TEXT primary key is migrated in place."""
+        db_path = tmp_path / "old.sqlite"
+        conn = sqlite3.connect(db_path)
+        conn.execute("""
+            CREATE TABLE classification_cache (
+                cache_key TEXT PRIMARY KEY,
+                category TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                action_items TEXT,
+                cost_usd REAL DEFAULT 0.0,
+                model_version TEXT,
+                classified_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        conn.execute(
+            "INSERT INTO classification_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+            ("msg:7", "FYI", "Old summary", None, 0.004, "claude-haiku-4-5", "2025-01-01T00:00:00")
+        )
+        conn.commit()
+        conn.close()
+
+        init_cache_db(db_path)
+        try:
+            result = lookup_cache("msg:7", db_path)
+            assert result["summary"] == "Old summary"
+            assert get_cache_stats(db_path)["total_entries"] == 1
+        finally:
+            close_connections()
+
     def test_lookup_nonexistent_db_returns_none(self):
         """Looking up in non-existent database returns None."""
         result = lookup_cache("msg:123", Path("/nonexistent/path.sqlite"))
         assert result is None
 
 
+class TestCacheWriter:
+    """Tests for the background CacheWriter."""
+
+    def test_close_flushes_rows(self, temp_db):
+        """Rows queued before close() are all written."""
+        writer = CacheWriter(temp_db, batch_size=4)
+        for n in range(10):
+            writer.put((f"msg:{n}", "FYI", f"Sum{n}", None, 0.001, "claude-haiku-4-5", "2025-12-13T10:00:00"))
+        writer.close()
+
+        assert writer.rows_written == 10
+        assert get_cache_stats(temp_db)["total_entries"] == 10
+        assert lookup_cache("msg:9", temp_db)["summary"] == "Sum9"
+
+    def test_context_manager(self, temp_db):
+        """Leaving the with-block closes the writer."""
+        with CacheWriter(temp_db) as writer:
+            writer.put(("msg:1", "URGENT", "Sum", "Act", 0.002, "claude-haiku-4-5", "2025-12-13T10:00:00"))
+        assert lookup_cache("msg:1", temp_db)["category"] == "URGENT"
+
+    def test_close_is_idempotent(self, temp_db):
+        """Closing twice is harmless."""
+        writer = CacheWriter(temp_db)
+        writer.close()
+        writer.close()
+        assert writer.rows_written == 0
+
+
 class TestCacheStats:
     """Tests for cache statistics."""
 
-    @pytest.fixture
-    def temp_db(self):
-        """Create a temporary database for testing."""
-        with tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False) as f:
-            db_path = Path(f.name)
-        init_cache_db(db_path)
-        yield db_path
-        db_path.unlink(missing_ok=True)
-
     def test_empty_cache_stats(self, temp_db):
         """Empty cache returns zero stats."""
         stats = get_cache_stats(temp_db)
@@ -175,14 +372,19 @@ class TestCacheStats:
 
     def test_stats_after_entries(self, temp_db):
         """Stats reflect saved entries."""
-        save_to_cache("msg:1", "FYI", "Sum1", None, 0.001, db_path=temp_db)
-        save_to_cache("msg:2", "URGENT", "Sum2", None, 0.002, db_path=temp_db)
-        save_to_cache("msg:3", "FYI", "Sum3", None, 0.003, db_path=temp_db)
+        save_many_to_cache(STATS_ROWS, db_path=temp_db)
 
         stats = get_cache_stats(temp_db)
         assert stats["total_entries"] == 3
         assert abs(stats["total_cost_usd"] - 0.006) < 0.0001
 
+    def test_stats_by_category(self, temp_db):
+        """Stats include per-category counts."""
+        save_many_to_cache(STATS_ROWS, db_path=temp_db)
+
+        stats = get_cache_stats(temp_db)
+        assert stats["by_category"] == {"FYI": 2, "URGENT": 1}
+
     def test_nonexistent_db_stats(self):
         """Non-existent database returns zero stats."""
         stats = get_cache_stats(Path("/nonexistent/path.sqlite"))
@@ -192,15 +394,6 @@ class TestCacheStats:
 class TestClearCache:
     """Tests for cache clearing."""
 
-    @pytest.fixture
-    def temp_db(self):
-        """Create a temporary database for testing."""
-        with tempfile.NamedTemporaryFile(suffix=".sqlite", delete=False) as f:
-            db_path = Path(f.name)
-        init_cache_db(db_path)
-        yield db_path
-        db_path.unlink(missing_ok=True)
-
     def test_clear_empty_cache(self, temp_db):
         """Clearing empty cache returns 0."""
         count = clear_cache(temp_db)
@@ -208,8 +401,7 @@ class TestClearCache:
 
     def test_clear_populated_cache(self, temp_db):
         """Clearing populated cache returns count and empties."""
-        save_to_cache("msg:1", "FYI", "Sum1", None, 0.001, db_path=temp_db)
-        save_to_cache("msg:2", "FYI", "Sum2", None, 0.001, db_path=temp_db)
+        save_many_to_cache(STATS_ROWS[:2], db_path=temp_db)
 
         count = clear_cache(temp_db)
         assert count == 2
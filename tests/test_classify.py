@@ -1,15 +1,30 @@
 # ABOUTME: Tests for classify_emails.py and classify_with_claude.py
 # ABOUTME: Tests classify_by_labels() and generate_template_summary()
 
+import asyncio
+import json
 import pytest
-import sys
-from pathlib import Path
-
-sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+import threading
+from types import SimpleNamespace
 
 from classify_emails import classify_by_labels as classify_by_labels_simple
-from classify_emails import generate_template_summary
+from classify_emails import generate_template_summary, iter_parsed_emails, classify_by_keywords, merge_email
+from classify_emails import summarize_with_llm
 from classify_with_claude import classify_by_labels as classify_by_labels_threaded
+import classify_with_claude
+from classify_with_claude import (
+    classify_by_rules,
+    truncate_text,
+    write_items,
+    group_prompts,
+    split_group_results,
+    parse_classification_response,
+    GROUP_CLASSIFY_SYSTEM_PROMPT,
+    build_classify_prompt,
+    build_summarize_prompt,
+    CLASSIFY_SYSTEM_PROMPT,
+    SUMMARY_SYSTEM_PROMPT,
+)
 
 
 class TestClassifyByLabelsSimple:
@@ -52,6 +67,40 @@ class TestClassifyByLabelsSimple:
         assert classify_by_labels_simple(email) == "NEWSLETTER"
 
 
+class TestClassifyByKeywords:
+    """Tests for classify_by_keywords() function."""
+
+    def test_urgent_in_subject(self):
+        """Urgent keyword in subject maps to URGENT."""
+        email = {"subject": "URGENT: server down", "body_preview": ""}
+        assert classify_by_keywords(email) == "URGENT"
+
+    def test_needs_response_in_body(self):
+        """Reply request in body maps to NEEDS_RESPONSE."""
+        email = {"subject": "Dinner", "body_preview": "Please let me know by Friday."}
+        assert classify_by_keywords(email) == "NEEDS_RESPONSE"
+
+    def test_multiword_phrase(self):
+        """Multi-word phrases match regardless of case."""
+        email = {"subject": "Action Required: confirm account", "body_preview": ""}
+        assert classify_by_keywords(email) == "URGENT"
+
+    def test_ambiguous_returns_none(self):
+        """Phrases from both categories leave the decision to the LLM."""
+        email = {"subject": "Deadline tomorrow", "body_preview": "What do you think?"}
+        assert classify_by_keywords(email) is None
+
+    def test_word_boundaries(self):
+        """Keywords only match whole words."""
+        email = {"subject": "Non-urgently yours", "body_preview": "wasapple"}
+        assert classify_by_keywords(email) is None
+
+    def test_no_keywords(self):
+        """Plain email returns None."""
+        assert classify_by_keywords({"subject": "Hello", "body_preview": "Hi there"}) is None
+        assert classify_by_keywords({}) is None
+
+
 class TestGenerateTemplateSummary:
     """Tests for generate_template_summary() function."""
 
@@ -71,6 +120,12 @@ class TestGenerateTemplateSummary:
         assert "GitHub" in result
         assert "New comment" in result
 
+    def test_keyword_category_summaries(self):
+        """URGENT and NEEDS_RESPONSE have their own templates."""
+        email = {"from_name": "Boss", "subject": "Budget"}
+        assert "Urgent" in generate_template_summary(email, "URGENT")
+        assert "reply" in generate_template_summary(email, "NEEDS_RESPONSE")
+
     def test_unknown_from_name(self):
         """Missing from_name uses 'Unknown'."""
         email = {"subject": "Test"}
@@ -84,6 +139,115 @@ class TestGenerateTemplateSummary:
         assert "Sender" in result
 
 
+class TestIterParsedEmails:
+    """Tests for iter_parsed_emails() function."""
+
+    def test_jsonl_input(self, tmp_path):
+        """JSONL files yield one email per non-blank line."""
+        path = tmp_path / "parsed.jsonl"
+        path.write_text('{"message_num": 1}\n\n{"message_num": 2}\n')
+        assert [e["message_num"] for e in iter_parsed_emails(str(path))] == [1, 2]
+
+    def test_json_list_input(self, tmp_path):
+        """Plain JSON list files are still supported."""
+        path = tmp_path / "parsed.json"
+        path.write_text(json.dumps([{"message_num": 1}, {"message_num": 2}]))
+        assert [e["message_num"] for e in iter_parsed_emails(str(path))] == [1, 2]
+
+
+class TestMergeEmail:
+    """Tests for merge_email() function."""
+
+    def test_raw_fields_override(self):
+        """Gmail link, labels, and date come from the raw record."""
+        parsed = {"message_num": 1, "subject": "Hi", "date": "parsed-date", "body_preview": "Body"}
+        raw = {"uid": "abc", "gmail_link": "http://x", "labels": "INBOX", "date": "raw-date"}
+        merged = merge_email(parsed, raw)
+        assert merged["gmail_link"] == "http://x"
+        assert merged["labels"] == "INBOX"
+        assert merged["date"] == "raw-date"
+        assert merged["subject"] == "Hi"
+
+    def test_missing_raw_record(self):
+        """Without a raw record, parsed date is kept and link fields are empty."""
+        merged = merge_email({"message_num": 2, "date": "parsed-date"}, {})
+        assert merged["date"] == "parsed-date"
+        assert merged["gmail_link"] == ""
+        assert merged["uid"] == ""
+
+    def test_date_always_string(self):
+        """Date is an empty string when neither record has one, so it can be sorted."""
+        assert merge_email({"message_num": 3}, {})["date"] == ""
+        assert merge_email({"message_num": 3}, {"date": None})["date"] == ""
+
+
+class FakeAnthropic:
+    """Stand-in for the Anthropic client that returns a canned response."""
+
+    def __init__(self, text):
+        self.requests = []
+        self.messages = SimpleNamespace(create=self._create)
+        self._text = text
+
+    def _create(self, **kwargs):
+        self.requests.append(kwargs)
+        return SimpleNamespace(content=[SimpleNamespace(text=self._text)])
+
+
+class TestSummarizeWithLlm:
+    """Tests for summarize_with_llm() with a fake client."""
+
+    def test_prompt_lists_each_email(self):
+        """Each email appears in the batch block with its 1-based index."""
+        client = FakeAnthropic("[]")
+        emails = [
+            {"from_name": "Alice", "from_email": "a@x.com", "subject": "One", "body_preview": "Body 1"},
+            {"from_name": "Bob", "from_email": "b@x.com", "subject": "Two", "body_preview": "Body 2"},
+        ]
+        summarize_with_llm(emails, client)
+
+        batch_text = client.requests[0]["messages"][0]["content"][1]["text"]
+        assert "---EMAIL 1---\nFrom: Alice <a@x.com>\nSubject: One\nBody:\nBody 1" in batch_text
+        assert "---EMAIL 2---\nFrom: Bob <b@x.com>" in batch_text
+
+    def test_results_merged_by_index(self):
+        """Results are matched back to emails by index."""
+        client = FakeAnthropic('[{"index": 2, "category": "URGENT", "summary": "Now", "action_items": "Reply"}]')
+        emails = [{"from_name": "A", "subject": "S1"}, {"from_name": "B", "subject": "S2"}]
+        summarize_with_llm(emails, client)
+
+        assert emails[0]["category"] == "FYI"
+        assert emails[1]["category"] == "URGENT"
+        assert emails[1]["action_items"] == "Reply"
+
+    def test_keyword_category_kept(self):
+        """A category set by keyword rules is kept; summary and action items come from the LLM."""
+        client = FakeAnthropic('[{"index": 1, "category": "FYI", "summary": "Asks for the report", "action_items": "Send it"}]')
+        emails = [{"from_name": "A", "subject": "Report by EOD", "category": "URGENT"}]
+        summarize_with_llm(emails, client)
+
+        assert emails[0]["category"] == "URGENT"
+        assert emails[0]["summary"] == "Asks for the report"
+        assert emails[0]["action_items"] == "Send it"
+
+    def test_fenced_response_parsed(self):
+        """A response wrapped in a ```json block is unwrapped before parsing."""
+        client = FakeAnthropic('```json\n[{"index": 1, "category": "NEEDS_RESPONSE", "summary": "Q"}]\n```')
+        emails = [{"from_name": "A", "subject": "S1"}]
+        summarize_with_llm(emails, client)
+
+        assert emails[0]["category"] == "NEEDS_RESPONSE"
+
+    def test_unparseable_response_falls_back(self):
+        """Invalid JSON falls back to template summaries."""
+        client = FakeAnthropic("not json")
+        emails = [{"from_name": "A", "subject": "S1"}]
+        summarize_with_llm(emails, client)
+
+        assert emails[0]["category"] == "FYI"
+        assert emails[0]["summary"] == "A: S1"
+
+
 class TestClassifyByLabelsThreaded:
     """Tests for classify_by_labels() in classify_with_claude.py.
 
@@ -160,3 +324,490 @@ class TestClassifyByLabelsThreaded:
             ]
         }
         assert classify_by_labels_threaded(item) == "NEWSLETTER"
+
+
+def make_single(num, subject, body, labels=""):
+    """Build a single-email item as produced by group_threads.py."""
+    return {
+        "is_thread": False,
+        "messages": [{
+            "message_num": num,
+            "from_name": "Sender",
+            "from_email": "sender@example.com",
+            "subject": subject,
+            "body_preview": body,
+            "labels": labels,
+        }],
+    }
+
+
+class TestClassifyByRules:
+    """Tests for classify_by_rules() and classify_by_keywords() in classify_with_claude.py."""
+
+    def test_urgent_keyword_in_subject(self):
+        """Urgent keywords in the subject classify as URGENT."""
+        item = make_single(1, "ASAP: server down", "Details")
+        assert classify_with_claude.classify_by_keywords(item) == "URGENT"
+
+    def test_urgent_keyword_in_body(self):
+        """Urgent keywords in the body classify as URGENT."""
+        item = make_single(1, "Report", "Need this by EOD")
+        assert classify_with_claude.classify_by_keywords(item) == "URGENT"
+
+    def test_keyword_must_be_whole_word(self):
+        """Keywords inside other words, such as 'asap' in 'Wasapi', do not match."""
+        assert classify_with_claude.classify_by_keywords(make_single(1, "Wasapi notes", "Audio stuff")) is None
+
+    def test_sender_rules_ignore_keywords(self):
+        """Urgent keywords are left to classify_by_keywords()."""
+        assert classify_by_rules(make_single(1, "Urgent: renew now", "")) is None
+
+    def test_financial_sender_subdomain(self):
+        """Known bank domains and their subdomains classify as FINANCIAL."""
+        item = make_single(1, "Your statement", "Ready")
+        item["messages"][0]["from_email"] = "no-reply@alerts.Chase.com"
+        assert classify_by_rules(item) == "FINANCIAL"
+
+    def test_lookalike_domain_not_financial(self):
+        """Domains that merely end in a bank name are not FINANCIAL."""
+        item = make_single(1, "Hello", "Hi")
+        item["messages"][0]["from_email"] = "someone@notchase.com"
+        assert classify_by_rules(item) is None
+
+    def test_calendar_sender(self):
+        """Google Calendar notifications classify as CALENDAR."""
+        item = make_single(1, "Reminder", "Standup at 10")
+        item["messages"][0]["from_email"] = "calendar-notification@google.com"
+        assert classify_by_rules(item) == "CALENDAR"
+
+    def test_invitation_subject(self):
+        """Calendar invitation subjects classify as CALENDAR."""
+        assert classify_by_rules(make_single(1, "Invitation: Lunch @ Fri", "")) == "CALENDAR"
+
+    def test_no_rule_matches(self):
+        """Ordinary emails are left for Claude."""
+        assert classify_by_rules(make_single(1, "Hello", "How are you?")) is None
+
+    def test_labels_take_precedence_over_keywords(self, monkeypatch):
+        """Gmail labels decide before urgent keywords, so promotions stay newsletters."""
+        async def fake_query_claude_stream(prompts, **kwargs):
+            for _, metadata in prompts:
+                yield ("Summary", 0.0, metadata, None)
+
+        monkeypatch.setattr(classify_with_claude, "query_claude_stream", fake_query_claude_stream)
+        items = [make_single(1, "Urgent: renew now", "", labels="CATEGORY_PROMOTIONS")]
+        classified, stats = asyncio.run(
+            classify_with_claude.classify_items_parallel(items, use_cache=False)
+        )
+
+        assert classified[0]["category"] == "NEWSLETTER"
+        assert stats["rule_classified"] == 0
+        assert stats["pre_classified"] == 1
+
+    def test_keywords_apply_without_labels(self, monkeypatch):
+        """Urgent keywords set the pre-category when labels give none."""
+        async def fake_query_claude_stream(prompts, **kwargs):
+            for _, metadata in prompts:
+                yield ("Summary", 0.0, metadata, None)
+
+        monkeypatch.setattr(classify_with_claude, "query_claude_stream", fake_query_claude_stream)
+        items = [make_single(1, "Urgent: server down", "")]
+        classified, stats = asyncio.run(
+            classify_with_claude.classify_items_parallel(items, use_cache=False)
+        )
+
+        assert classified[0]["category"] == "URGENT"
+        assert stats["rule_classified"] == 1
+        assert stats["pre_classified"] == 0
+
+
+class TestRuleMatchesWithoutClaude:
+    """Tests for classify_items_parallel(summarize_rule_matches=False)."""
+
+    def test_rule_matches_use_template_summary(self, monkeypatch):
+        """Rule-matched items skip Claude; the rest are still sent."""
+        calls = []
+
+        async def fake_query_claude_stream(prompts, **kwargs):
+            calls.append(prompts)
+            for _, m in prompts:
+                yield ('{"category": "FYI", "summary": "Claude"}', 0.0, m, None)
+
+        monkeypatch.setattr(classify_with_claude, "query_claude_stream", fake_query_claude_stream)
+        bank = make_single(1, "Statement ready", "View online")
+        bank["messages"][0].update(from_name="Chase", from_email="alerts@chase.com")
+        items = [bank, make_single(2, "Hello", "Lunch?")]
+        classified, stats = asyncio.run(classify_with_claude.classify_items_parallel(
+            items, use_cache=False, summarize_rule_matches=False,
+        ))
+
+        assert classified[0]["category"] == "FINANCIAL"
+        assert classified[0]["summary"] == "Account notice from Chase: Statement ready"
+        assert classified[1]["summary"] == "Claude"
+        assert len(calls[0]) == 1
+        assert stats["rule_classified"] == 1
+        assert stats["cache_misses"] == 2
+
+
+class TestTruncateText:
+    """Tests for truncate_text() in classify_with_claude.py."""
+
+    def test_short_text_unchanged(self):
+        """Text within the limit is returned as-is."""
+        assert truncate_text("Hello.", 100) == "Hello."
+
+    def test_prefers_paragraph_break(self):
+        """A paragraph break near the limit is used as the cut point."""
+        text = "a" * 90 + "\n\n" + "b" * 50
+        assert truncate_text(text, 100) == "a" * 90
+
+    def test_sentence_end_keeps_period(self):
+        """Cutting at a sentence end keeps the full stop."""
+        text = "x" * 85 + ". " + "y" * 50
+        assert truncate_text(text, 100) == "x" * 85 + "."
+
+    def test_hard_cut_when_boundary_too_early(self):
+        """A boundary in the first three quarters is ignored in favour of a hard cut."""
+        text = "Hi. " + "z" * 200
+        assert truncate_text(text, 100) == text[:100]
+
+
+class TestBuildPrompts:
+    """Tests for the static-prefix prompt builders in classify_with_claude.py."""
+
+    def test_classify_prompt_splits_rules_from_email(self):
+        """Rules go in the system prompt; only the email is in the user content."""
+        system, content = build_classify_prompt(make_single(1, "Invoice", "Please pay"))
+        assert system is CLASSIFY_SYSTEM_PROMPT
+        assert "CLASSIFICATION RULES" not in content
+        assert "Subject: Invoice" in content
+        assert "Please pay" in content
+
+    def test_summarize_prompt_for_thread(self):
+        """Thread summaries use the summary system prompt and recent messages."""
+        item = {
+            "is_thread": True,
+            "subject": "Plans",
+            "participants": ["Alice", "Bob"],
+            "messages": [{"from_name": "Alice", "body_preview": "Lunch?"}],
+        }
+        system, content = build_summarize_prompt(item)
+        assert system is SUMMARY_SYSTEM_PROMPT
+        assert 'EMAIL THREAD: "Plans"' in content
+        assert "[Alice]: Lunch?" in content
+
+
+class TestClassifyItemsParallel:
+    """Tests for classify_items_parallel() with a fake batch query."""
+
+    @pytest.fixture
+    def fake_batch(self, monkeypatch):
+        """Replace query_claude_stream and record the prompts it receives."""
+        calls = []
+
+        async def fake_query_claude_stream(prompts, **kwargs):
+            calls.append(prompts)
+            response = '{"category": "FYI", "summary": "Same notice", "action_items": null}'
+            for _, metadata in prompts:
+                yield (response, 0.01, metadata, None)
+
+        monkeypatch.setattr(classify_with_claude, "query_claude_stream", fake_query_claude_stream)
+        return calls
+
+    def test_identical_prompts_share_one_call(self, fake_batch):
+        """Items with identical content are sent once and all get the result."""
+        items = [
+            make_single(1, "Your receipt", "Thanks for your order"),
+            make_single(2, "Your receipt", "Thanks for your order"),
+            make_single(3, "Different", "Other body"),
+        ]
+        classified, stats = asyncio.run(
+            classify_with_claude.classify_items_parallel(items, use_cache=False)
+        )
+
+        assert len(fake_batch[0]) == 2
+        assert stats["claude_calls"] == 2
+        assert stats["dedup_saved"] == 1
+        assert stats["total_cost"] == pytest.approx(0.02)
+        assert [item["summary"] for item in classified] == ["Same notice"] * 3
+
+    def test_metadata_index_is_item_position(self, fake_batch):
+        """Each prompt's metadata records the item's position in the input."""
+        items = [{"messages": []}, make_single(1, "A", "a"), make_single(2, "B", "b")]
+        asyncio.run(classify_with_claude.classify_items_parallel(items, use_cache=False))
+
+        assert [metadata["index"] for _, metadata in fake_batch[0]] == [1, 2]
+
+    def test_cache_uses_one_lookup_and_one_writer(self, fake_batch, monkeypatch):
+        """The cache is read with one bulk lookup off the loop thread and written through one writer."""
+        lookups = []
+        writers = []
+
+        class FakeWriter:
+            def __init__(self):
+                self.rows = []
+                writers.append(self)
+
+            def put(self, row):
+                self.rows.append(row)
+
+            def close(self):
+                pass
+
+        lookup_threads = []
+
+        def fake_lookup(keys):
+            lookups.append(keys)
+            lookup_threads.append(threading.get_ident())
+            return {"msg:1": {"category": "FYI", "summary": "Cached", "action_items": None}}
+
+        monkeypatch.setattr(classify_with_claude, "init_cache_db", lambda: None)
+        monkeypatch.setattr(classify_with_claude, "lookup_cache_bulk", fake_lookup)
+        monkeypatch.setattr(classify_with_claude, "CacheWriter", FakeWriter)
+        items = [make_single(1, "A", "a"), make_single(2, "B", "b"), make_single(3, "C", "c")]
+        classified, stats = asyncio.run(classify_with_claude.classify_items_parallel(items))
+
+        assert len(lookups) == 1
+        assert lookups[0][:3] == ["msg:1", "msg:2", "msg:3"]
+        assert all(key.startswith("content:") for key in lookups[0][3:])
+        assert lookup_threads[0] != threading.get_ident()
+        assert stats["cache_hits"] == 1
+        assert len(writers) == 1
+        message_rows = [row for row in writers[0].rows if row[0].startswith("msg:")]
+        content_rows = [row for row in writers[0].rows if row[0].startswith("content:")]
+        assert [row[0] for row in message_rows] == ["msg:2", "msg:3"]
+        assert [row[4] for row in content_rows] == [0.0, 0.0]
+
+    def test_content_key_hit_reuses_result(self, fake_batch, monkeypatch):
+        """An identical email under a new message_num is served from the content key."""
+        item = make_single(7, "Security alert", "New sign-in")
+        content_key = classify_with_claude.get_content_cache_key(item)
+        monkeypatch.setattr(
+            classify_with_claude, "prefetch_cache",
+            lambda keys: {content_key: {"category": "FYI", "summary": "Seen before", "action_items": None}},
+        )
+        classified, stats = asyncio.run(classify_with_claude.classify_items_parallel([item]))
+
+        assert fake_batch == []
+        assert stats["cache_hits"] == 1
+        assert classified[0]["summary"] == "Seen before"
+
+    def test_output_drops_working_fields(self, fake_batch):
+        """Body previews, labels and other working fields are removed from output."""
+        item = make_single(1, "A", "a", labels="INBOX")
+        item["messages"][0].update(references=[], filepath="x.eml", body_length=1, to="me@example.com",
+                                   message_id="<a@b>", in_reply_to="", uid="42")
+        classified, _ = asyncio.run(
+            classify_with_claude.classify_items_parallel([item], use_cache=False)
+        )
+
+        assert set(classified[0]["messages"][0]) == {
+            "message_num", "from_name", "from_email", "subject",
+        }
+
+    def test_output_keeps_rendered_fields(self, fake_batch):
+        """Fields render_brief shows, and fields not known to be working ones, survive."""
+        item = make_single(1, "A", "a")
+        item["messages"][0].update(date="2025-01-02 10:00:00", gmail_link="https://mail.google.com/x",
+                                   new_field="kept")
+        classified, _ = asyncio.run(
+            classify_with_claude.classify_items_parallel([item], use_cache=False)
+        )
+
+        message = classified[0]["messages"][0]
+        assert message["date"] == "2025-01-02 10:00:00"
+        assert message["gmail_link"] == "https://mail.google.com/x"
+        assert message["new_field"] == "kept"
+
+    def test_cache_hits_are_cleaned_too(self, fake_batch, monkeypatch):
+        """Cache hits come from a fresh grouped file, so their working fields are dropped too."""
+        monkeypatch.setattr(
+            classify_with_claude, "prefetch_cache",
+            lambda keys: {"msg:1": {"category": "FYI", "summary": "Cached", "action_items": None}},
+        )
+        item = make_single(1, "A", "a", labels="INBOX")
+        classified, stats = asyncio.run(classify_with_claude.classify_items_parallel([item]))
+
+        assert stats["cache_hits"] == 1
+        assert "body_preview" not in classified[0]["messages"][0]
+        assert "labels" not in classified[0]["messages"][0]
+
+    def test_progress_lines_throttled(self, monkeypatch, capsys):
+        """Progress is printed at most once per interval, plus the final count."""
+        async def fake_query_claude_stream(prompts, progress_callback=None, **kwargs):
+            for n, (_, metadata) in enumerate(prompts, 1):
+                progress_callback(n, len(prompts), metadata)
+                yield ("{}", 0.0, metadata, None)
+
+        monkeypatch.setattr(classify_with_claude, "query_claude_stream", fake_query_claude_stream)
+        monkeypatch.setattr(classify_with_claude, "PROGRESS_INTERVAL", 3600)
+        items = [make_single(n, f"Subject {n}", f"body {n}") for n in range(5)]
+        asyncio.run(classify_with_claude.classify_items_parallel(items, use_cache=False))
+
+        progress = [line for line in capsys.readouterr().err.splitlines() if line.startswith("  [")]
+        assert [line.split("]")[0] for line in progress] == ["  [1/5", "  [5/5"]
+
+    def test_batch_api_falls_back_to_direct_requests(self, fake_batch, monkeypatch):
+        """If the Message Batches API fails, prompts are sent directly instead."""
+        async def failing_message_batch(prompts):
+            raise classify_with_claude.ClaudeQueryError("no key")
+
+        monkeypatch.setattr(classify_with_claude, "query_claude_message_batch", failing_message_batch)
+        classified, stats = asyncio.run(classify_with_claude.classify_items_parallel(
+            [make_single(1, "A", "a")], use_cache=False, use_batch_api=True,
+        ))
+
+        assert len(fake_batch) == 1
+        assert classified[0]["summary"] == "Same notice"
+
+    def test_prompts_grouped_by_system_prompt(self, fake_batch):
+        """Full classifications are dispatched together, ahead of summary-only prompts."""
+        items = [
+            make_single(1, "Sale", "x", labels="CATEGORY_PROMOTIONS"),
+            make_single(2, "Hello", "y"),
+            make_single(3, "Update", "z", labels="CATEGORY_UPDATES"),
+            make_single(4, "Question", "w"),
+        ]
+        asyncio.run(classify_with_claude.classify_items_parallel(items, use_cache=False))
+
+        systems = [prompt[0] for prompt, _ in fake_batch[0]]
+        assert systems == [CLASSIFY_SYSTEM_PROMPT] * 2 + [SUMMARY_SYSTEM_PROMPT] * 2
+        assert [metadata["index"] for _, metadata in fake_batch[0]] == [1, 3, 0, 2]
+
+    def test_only_full_classifications_carry_schema(self, fake_batch):
+        """Classify prompts ask for CLASSIFICATION_SCHEMA; summary-only prompts stay free text."""
+        items = [
+            make_single(1, "Hello", "Lunch?"),
+            make_single(2, "Sale", "50% off", labels="CATEGORY_PROMOTIONS"),
+        ]
+        asyncio.run(classify_with_claude.classify_items_parallel(items, use_cache=False))
+
+        by_index = {metadata["index"]: prompt for prompt, metadata in fake_batch[0]}
+        assert by_index[0][2] is classify_with_claude.CLASSIFICATION_SCHEMA
+        assert len(by_index[1]) == 2
+
+    def test_same_prompt_different_label_category_not_merged(self, fake_batch):
+        """Summary-only prompts are not shared across different label categories."""
+        items = [
+            make_single(1, "Sale", "Body", labels="CATEGORY_PROMOTIONS"),
+            make_single(2, "Sale", "Body", labels="CATEGORY_UPDATES"),
+        ]
+        classified, stats = asyncio.run(
+            classify_with_claude.classify_items_parallel(items, use_cache=False)
+        )
+
+        assert stats["dedup_saved"] == 0
+        assert [item["category"] for item in classified] == ["NEWSLETTER", "AUTOMATED"]
+
+
+class TestGroupedClassification:
+    """Tests for packing several single emails into one classification request."""
+
+    def build_prompts(self, items):
+        """Individual (prompt, metadata) pairs as Phase 2 builds them."""
+        prompts = []
+        for index, item in enumerate(items):
+            if classify_by_labels_threaded(item):
+                prompt, kind = build_summarize_prompt(item), "summary"
+            else:
+                prompt, kind = build_classify_prompt(item), "classify"
+            metadata = {"kind": kind, "index": index, "pre_category": None, "item": item, "entries": []}
+            prompts.append((prompt, metadata))
+        return prompts
+
+    def test_only_single_email_classifications_grouped(self):
+        """Threads and summary-only prompts stay on their own."""
+        thread = {"is_thread": True, "subject": "T", "participants": [], "messages": [{"body_preview": "x"}]}
+        items = [
+            make_single(1, "A", "a"),
+            make_single(2, "B", "b"),
+            make_single(3, "C", "c", labels="CATEGORY_PROMOTIONS"),
+            thread,
+            make_single(4, "D", "d"),
+        ]
+        grouped = group_prompts(self.build_prompts(items), group_size=5)
+
+        systems = [prompt[0] for prompt, _ in grouped]
+        assert systems.count(GROUP_CLASSIFY_SYSTEM_PROMPT) == 1
+        group_prompt, group_metadata = grouped[-1]
+        assert [m["index"] for _, m in group_metadata["members"]] == [0, 1, 4]
+        assert "--- EMAIL 3 ---\nFrom: Sender <sender@example.com>\nSubject: D" in group_prompt[1]
+
+    def test_lone_email_not_wrapped(self):
+        """A group of one keeps its individual prompt."""
+        prompts = self.build_prompts([make_single(1, "A", "a")])
+        assert group_prompts(prompts, group_size=5) == prompts
+
+    def test_group_answers_split_by_id(self):
+        """Each member gets its own entry, matched by id, and a share of the cost."""
+        prompts = self.build_prompts([make_single(1, "A", "a"), make_single(2, "B", "b")])
+        [(_, metadata)] = group_prompts(prompts, group_size=5)
+        response = '[{"id": 2, "category": "URGENT", "summary": "Two"}, {"id": 1, "category": "FYI", "summary": "One"}]'
+
+        flat, retry, retry_cost = split_group_results([(response, 0.02, metadata, None)])
+
+        assert retry == [] and retry_cost == 0.0
+        assert [m["index"] for _, _, m, _ in flat] == [0, 1]
+        assert [cost for _, cost, _, _ in flat] == [0.01, 0.01]
+        first = parse_classification_response(flat[0][0], "A", "A")
+        assert first["summary"] == "One"
+
+    def test_mismatched_group_retried_per_item(self):
+        """A response missing an entry sends every member back individually."""
+        prompts = self.build_prompts([make_single(1, "A", "a"), make_single(2, "B", "b")])
+        [(_, metadata)] = group_prompts(prompts, group_size=5)
+
+        flat, retry, retry_cost = split_group_results([('[{"id": 1, "category": "FYI"}]', 0.02, metadata, None)])
+
+        assert flat == []
+        assert retry == prompts
+        assert retry_cost == 0.02
+
+    def test_grouped_run_end_to_end(self, monkeypatch):
+        """classify_items_parallel sends one grouped request and applies each answer."""
+        calls = []
+
+        async def fake_query_claude_stream(prompts, **kwargs):
+            calls.append(prompts)
+            response = '[{"id": 1, "category": "FYI", "summary": "One"}, {"id": 2, "category": "URGENT", "summary": "Two"}]'
+            for _, metadata in prompts:
+                yield (response, 0.0, metadata, None)
+
+        monkeypatch.setattr(classify_with_claude, "query_claude_stream", fake_query_claude_stream)
+        items = [make_single(1, "A", "a"), make_single(2, "B", "b")]
+        classified, stats = asyncio.run(
+            classify_with_claude.classify_items_parallel(items, use_cache=False, group_size=5)
+        )
+
+        assert len(calls) == 1 and len(calls[0]) == 1
+        assert stats["claude_calls"] == 1
+        assert [item["summary"] for item in classified] == ["One", "Two"]
+        assert classified[1]["category"] == "URGENT"
+
+
+class TestParseClassificationResponse:
+    """Tests for parse_classification_response() in classify_with_claude.py."""
+
+    def test_array_response_falls_back(self):
+        """A JSON array where an object was expected uses the fallback summary."""
+        result = parse_classification_response('[{"category": "URGENT"}]', "Alice", "Hi")
+        assert result == {"category": "FYI", "summary": "Alice: Hi", "action_items": None}
+
+
+class TestWriteItems:
+    """Tests for write_items() in classify_with_claude.py."""
+
+    def test_round_trip(self, tmp_path):
+        """The streamed file parses back to the same items, one per line."""
+        items = [{"category": "FYI", "summary": "Café ☕"}, {"category": "URGENT", "messages": []}]
+        path = tmp_path / "classified.json"
+        write_items(path, items)
+
+        assert json.loads(path.read_text()) == {"items": items}
+        assert len(path.read_text().splitlines()) == 4
+
+    def test_empty(self, tmp_path):
+        """No items still produces valid JSON."""
+        path = tmp_path / "classified.json"
+        write_items(path, [])
+        assert json.loads(path.read_text()) == {"items": []}
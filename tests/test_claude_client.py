@@ -1,13 +1,23 @@
 # ABOUTME: Tests for claude_client.py - shared Claude Agent SDK client
 # ABOUTME: Tests parse_json_response() and error handling patterns
 
+import asyncio
 import pytest
-import sys
-from pathlib import Path
+from types import SimpleNamespace
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+from anthropic import RateLimitError
 
-from claude_client import parse_json_response, ClaudeQueryError
+import claude_client
+from claude_client import parse_json_response, ClaudeQueryError, compute_cost, get_api_client
+from claude_client import AdaptiveLimiter, is_rate_limit_error
+
+
+def run_stream(prompts, **kwargs) -> list:
+    """Collect every result of query_claude_stream(), in completion order."""
+    async def collect():
+        return [r async for r in claude_client.query_claude_stream(prompts, **kwargs)]
+
+    return asyncio.run(collect())
 
 
 class TestParseJsonResponse:
@@ -94,6 +104,26 @@ Some trailing text."""
         result = parse_json_response(response)
         assert result["first"] is True
 
+    def test_top_level_array(self):
+        """A JSON array response (multi-email prompts) is returned as a list."""
+        result = parse_json_response('```json\n[{"id": 1}, {"id": 2}]\n```')
+        assert result == [{"id": 1}, {"id": 2}]
+
+    def test_json_wrapped_in_prose(self):
+        """Text before and after the JSON value is ignored."""
+        result = parse_json_response('Here is the result: {"category": "FYI"} Hope that helps!')
+        assert result == {"category": "FYI"}
+
+    def test_prose_without_json_raises(self):
+        """Prose with a brace but no valid JSON still fails to parse."""
+        with pytest.raises(ValueError, match="Failed to parse JSON"):
+            parse_json_response("Sorry {I can't do that")
+
+    def test_unclosed_code_block(self):
+        """A code block missing its closing fence uses the rest of the text."""
+        result = parse_json_response('```json\n{"key": "value"}')
+        assert result == {"key": "value"}
+
     def test_unicode_content(self):
         """JSON with unicode content is parsed."""
         response = '{"summary": "Meeting about café budget"}'
@@ -117,3 +147,444 @@ class TestClaudeQueryError:
         """ClaudeQueryError can be raised and caught."""
         with pytest.raises(ClaudeQueryError):
             raise ClaudeQueryError("Test error")
+
+
+class TestComputeCost:
+    """Tests for compute_cost() function."""
+
+    def test_input_and_output_tokens(self):
+        """Input and output tokens are priced separately."""
+        usage = SimpleNamespace(input_tokens=1_000_000, output_tokens=1_000_000)
+        assert compute_cost(usage, "claude-haiku-4-5") == pytest.approx(6.0)
+
+    def test_cache_tokens(self):
+        """Cache writes and reads use their own rates."""
+        usage = SimpleNamespace(
+            input_tokens=0,
+            output_tokens=0,
+            cache_creation_input_tokens=1_000_000,
+            cache_read_input_tokens=1_000_000,
+        )
+        assert compute_cost(usage, "claude-haiku-4-5") == pytest.approx(1.35)
+
+    def test_none_counts_treated_as_zero(self):
+        """Missing or None token counts don't break the calculation."""
+        usage = SimpleNamespace(input_tokens=100, output_tokens=None)
+        assert compute_cost(usage, "claude-haiku-4-5") == pytest.approx(0.0001)
+
+    def test_unknown_model_is_free(self):
+        """Unknown models report zero cost rather than guessing."""
+        usage = SimpleNamespace(input_tokens=1000, output_tokens=1000)
+        assert compute_cost(usage, "some-other-model") == 0.0
+
+
+class TestDirectApiBackend:
+    """Tests for the in-process Messages API path of query_claude()."""
+
+    def test_no_api_key_returns_no_client(self, monkeypatch):
+        """Without ANTHROPIC_API_KEY the Agent SDK path is used."""
+        monkeypatch.delenv("ANTHROPIC_API_KEY", raising=False)
+        assert get_api_client() is None
+
+    def test_api_client_does_not_retry(self, monkeypatch):
+        """The API client leaves rate-limit retries to the limiter."""
+        monkeypatch.setenv("ANTHROPIC_API_KEY", "test-key")
+        monkeypatch.setattr(claude_client, "_api_client", None)
+
+        async def build():
+            return get_api_client()
+
+        assert asyncio.run(build()).max_retries == 0
+
+    def test_query_uses_api_client(self, monkeypatch):
+        """query_claude() returns text and cost from the API client."""
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs)
+            return SimpleNamespace(
+                content=[SimpleNamespace(type="text", text='{"category": "FYI"}')],
+                usage=SimpleNamespace(input_tokens=1000, output_tokens=100),
+            )
+
+        fake = SimpleNamespace(messages=SimpleNamespace(create=create))
+        monkeypatch.setattr(claude_client, "get_api_client", lambda: fake)
+
+        text, cost = asyncio.run(claude_client.query_claude("hello"))
+        assert text == '{"category": "FYI"}'
+        assert cost == pytest.approx(0.0015)
+        assert calls[0]["messages"] == [{"role": "user", "content": "hello"}]
+
+    def test_system_prompt_marked_for_caching(self, monkeypatch):
+        """A system prompt is sent as a cache_control block ahead of the message."""
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs)
+            return SimpleNamespace(content=[], usage=None)
+
+        fake = SimpleNamespace(messages=SimpleNamespace(create=create))
+        monkeypatch.setattr(claude_client, "get_api_client", lambda: fake)
+
+        asyncio.run(claude_client.query_claude("email body", system="rules"))
+        assert calls[0]["system"] == [
+            {"type": "text", "text": "rules", "cache_control": {"type": "ephemeral"}}
+        ]
+        assert calls[0]["messages"] == [{"role": "user", "content": "email body"}]
+
+    def test_schema_forces_tool_call(self, monkeypatch):
+        """With a schema, the reply comes from a forced tool call, returned as JSON text."""
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs)
+            return SimpleNamespace(
+                content=[SimpleNamespace(type="tool_use", input={"category": "FYI", "summary": "Hi"})],
+                usage=None,
+            )
+
+        fake = SimpleNamespace(messages=SimpleNamespace(create=create))
+        monkeypatch.setattr(claude_client, "get_api_client", lambda: fake)
+
+        schema = {"type": "object", "properties": {"category": {"type": "string"}}}
+        text, _ = asyncio.run(claude_client.query_claude("email", system="rules", schema=schema))
+        assert parse_json_response(text) == {"category": "FYI", "summary": "Hi"}
+        assert calls[0]["tools"][0]["input_schema"] is schema
+        assert calls[0]["tool_choice"] == {"type": "tool", "name": claude_client.RESPONSE_TOOL_NAME}
+
+    def test_no_schema_sends_no_tools(self):
+        """Plain requests carry no tool definitions."""
+        params = claude_client._message_params("hello", "claude-haiku-4-5", "rules")
+        assert "tools" not in params and "tool_choice" not in params
+
+    def test_stream_accepts_system_prompt_tuples(self, monkeypatch):
+        """query_claude_stream() splits (system, prompt) tuples for each query."""
+        calls = []
+
+        async def fake_query_claude(prompt, model, timeout_seconds, system=None, schema=None):
+            calls.append((system, prompt))
+            return "ok", 0.0
+
+        monkeypatch.setattr(claude_client, "query_claude", fake_query_claude)
+        results = run_stream([(("rules", "first"), {"n": 1}), ("plain", {"n": 2})])
+        assert calls == [("rules", "first"), (None, "plain")]
+        assert sorted(r[2]["n"] for r in results) == [1, 2]
+
+    def test_sdk_text_blocks_joined(self, monkeypatch):
+        """Without an API key, text blocks from every SDK message are joined in order."""
+        async def fake_query(prompt, options):
+            yield claude_client.AssistantMessage(
+                content=[claude_client.TextBlock(text='{"a": '), claude_client.TextBlock(text="1")],
+                model="claude-haiku-4-5",
+            )
+            yield claude_client.AssistantMessage(content=[claude_client.TextBlock(text="}")], model="claude-haiku-4-5")
+            yield SimpleNamespace()
+
+        monkeypatch.setattr(claude_client, "get_api_client", lambda: None)
+        monkeypatch.setattr(claude_client, "query", fake_query)
+        text, cost = asyncio.run(claude_client.query_claude("hello"))
+        assert text == '{"a": 1}'
+        assert cost == 0.0
+
+    def test_sync_calls_share_one_event_loop(self, monkeypatch):
+        """Consecutive query_claude_sync() calls run on the same event loop."""
+        loops = []
+
+        async def fake_query_claude(prompt, model, timeout_seconds, system=None, schema=None):
+            loops.append(asyncio.get_running_loop())
+            return prompt, 0.0
+
+        monkeypatch.setattr(claude_client, "query_claude", fake_query_claude)
+        assert claude_client.query_claude_sync("one") == ("one", 0.0)
+        assert claude_client.query_claude_sync("two") == ("two", 0.0)
+        assert loops[0] is loops[1]
+
+    def test_api_errors_wrapped(self, monkeypatch):
+        """API failures surface as ClaudeQueryError."""
+        async def create(**kwargs):
+            raise RuntimeError("boom")
+
+        fake = SimpleNamespace(messages=SimpleNamespace(create=create))
+        monkeypatch.setattr(claude_client, "get_api_client", lambda: fake)
+
+        with pytest.raises(ClaudeQueryError):
+            asyncio.run(claude_client.query_claude("hello"))
+
+
+class TestAdaptiveConcurrency:
+    """Tests for AdaptiveLimiter and rate-limit detection."""
+
+    def test_rate_limit_detected_through_cause(self):
+        """A wrapped 429 is recognized via the exception's cause chain."""
+        try:
+            try:
+                raise RuntimeError("Error code: 429 - rate_limit_error")
+            except RuntimeError as e:
+                raise ClaudeQueryError("Claude query failed") from e
+        except ClaudeQueryError as wrapped:
+            assert is_rate_limit_error(wrapped)
+
+    def test_other_errors_not_rate_limits(self):
+        """Timeouts and other failures do not trigger backoff."""
+        assert not is_rate_limit_error(TimeoutError("Claude query timed out after 90s"))
+
+    def test_status_code_429_detected(self):
+        """An error carrying status_code 429 is a rate limit whatever its message."""
+        error = RuntimeError("Too many requests")
+        error.status_code = 429
+        assert is_rate_limit_error(error)
+
+    @pytest.mark.parametrize("message", [
+        "Claude query timed out after 90s (request req_0429abc)",
+        "Connection reset after 4290 bytes",
+        "Could not connect to localhost:429",
+    ])
+    def test_incidental_429_ignored(self, message):
+        """A "429" elsewhere in an error message does not count as a rate limit."""
+        try:
+            try:
+                raise RuntimeError(message)
+            except RuntimeError as e:
+                raise ClaudeQueryError("Claude query failed") from e
+        except ClaudeQueryError as wrapped:
+            assert not is_rate_limit_error(wrapped)
+
+    def test_limit_grows_after_successes(self):
+        """The limit rises by one per run of successes, capped at the ceiling."""
+        async def run():
+            limiter = AdaptiveLimiter(2, 3, increase_every=2)
+            for _ in range(6):
+                await limiter.acquire()
+                await limiter.release()
+            return limiter.limit
+
+        assert asyncio.run(run()) == 3
+
+    def test_limit_halves_on_rate_limit(self):
+        """A rate-limit error halves the limit, never below one."""
+        async def run():
+            limiter = AdaptiveLimiter(4, 8)
+            limits = []
+            for _ in range(3):
+                await limiter.acquire()
+                await limiter.release(rate_limited=True)
+                limits.append(limiter.limit)
+            return limits
+
+        assert asyncio.run(run()) == [2, 1, 1]
+
+    def test_retry_after_read_through_cause(self):
+        """Retry-After is read from the wrapped error's HTTP response."""
+        inner = RuntimeError("429")
+        inner.response = SimpleNamespace(headers={"retry-after": "7"})
+        try:
+            raise ClaudeQueryError("Claude query failed") from inner
+        except ClaudeQueryError as wrapped:
+            assert claude_client.retry_after_seconds(wrapped) == 7.0
+        assert claude_client.retry_after_seconds(RuntimeError("429")) is None
+
+    def test_pause_delays_next_acquire(self):
+        """A rate limit with a pause holds back the next request."""
+        async def run():
+            loop = asyncio.get_running_loop()
+            limiter = AdaptiveLimiter(2, 2)
+            await limiter.acquire()
+            await limiter.release(rate_limited=True, pause=0.05)
+            start = loop.time()
+            await limiter.acquire()
+            return loop.time() - start
+
+        assert asyncio.run(run()) >= 0.04
+
+    def test_rate_limited_request_retried(self, monkeypatch):
+        """A 429 is retried after the pause instead of failing the item."""
+        attempts = []
+
+        async def fake_query_claude(prompt, model, timeout_seconds, system=None, schema=None):
+            attempts.append(prompt)
+            if len(attempts) == 1:
+                raise ClaudeQueryError("Error code: 429 - rate_limit_error")
+            return "ok", 0.0
+
+        monkeypatch.setattr(claude_client, "query_claude", fake_query_claude)
+        monkeypatch.setattr(claude_client, "RATE_LIMIT_DEFAULT_PAUSE", 0.0)
+        assert run_stream([("p", {})]) == [("ok", 0.0, {}, None)]
+        assert attempts == ["p", "p"]
+
+    def test_api_rate_limit_reaches_limiter(self, monkeypatch):
+        """A single 429 from the API client is reported to the limiter as a rate limit."""
+        response = SimpleNamespace(status_code=429, headers={}, request=None)
+        attempts = []
+
+        async def create(**kwargs):
+            attempts.append(kwargs)
+            if len(attempts) == 1:
+                raise RateLimitError("rate limited", response=response, body=None)
+            return SimpleNamespace(content=[SimpleNamespace(type="text", text="ok")], usage=None)
+
+        class RecordingLimiter(AdaptiveLimiter):
+            def __init__(self):
+                super().__init__(2, 2)
+                self.released = []
+
+            async def release(self, rate_limited=False, pause=0.0):
+                self.released.append(rate_limited)
+                await super().release(rate_limited, pause)
+
+        fake = SimpleNamespace(messages=SimpleNamespace(create=create))
+        monkeypatch.setattr(claude_client, "get_api_client", lambda: fake)
+        monkeypatch.setattr(claude_client, "RATE_LIMIT_DEFAULT_PAUSE", 0.0)
+        limiter = RecordingLimiter()
+        result = asyncio.run(claude_client._query_limited("p", {}, limiter, "claude-haiku-4-5", 90))
+
+        assert result == ("ok", 0.0, {}, None)
+        assert limiter.released == [True, False]
+
+    def test_other_errors_not_retried(self, monkeypatch):
+        """Non rate-limit failures are returned after a single attempt."""
+        attempts = []
+
+        async def fake_query_claude(prompt, model, timeout_seconds, system=None, schema=None):
+            attempts.append(prompt)
+            raise ClaudeQueryError("boom")
+
+        monkeypatch.setattr(claude_client, "query_claude", fake_query_claude)
+        (_, _, _, error), = run_stream([("p", {})])
+        assert isinstance(error, ClaudeQueryError)
+        assert attempts == ["p"]
+
+    def test_stream_respects_limit(self, monkeypatch):
+        """No more than max_concurrent queries run at once without a ceiling."""
+        in_flight = 0
+        peak = 0
+
+        async def fake_query_claude(prompt, model, timeout_seconds, system=None, schema=None):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0)
+            in_flight -= 1
+            return "ok", 0.0
+
+        monkeypatch.setattr(claude_client, "query_claude", fake_query_claude)
+        prompts = [(str(i), {}) for i in range(10)]
+        run_stream(prompts, max_concurrent=3)
+        assert peak == 3
+
+
+class TestQueryClaudeStream:
+    """Tests for query_claude_stream()."""
+
+    def test_yields_in_completion_order(self, monkeypatch):
+        """Faster requests are yielded before slower ones submitted earlier."""
+        async def fake_query_claude(prompt, model, timeout_seconds, system=None, schema=None):
+            await asyncio.sleep(0.05 if prompt == "slow" else 0)
+            return prompt, 0.0
+
+        monkeypatch.setattr(claude_client, "query_claude", fake_query_claude)
+        results = run_stream([("slow", {"n": 1}), ("fast", {"n": 2})])
+        assert [r[0] for r in results] == ["fast", "slow"]
+        assert [r[2]["n"] for r in results] == [2, 1]
+
+    def test_errors_yielded_not_raised(self, monkeypatch):
+        """A failed request is yielded with its exception instead of raised."""
+        async def fake_query_claude(prompt, model, timeout_seconds, system=None, schema=None):
+            raise ClaudeQueryError("boom")
+
+        monkeypatch.setattr(claude_client, "query_claude", fake_query_claude)
+        (text, cost, _, error), = run_stream([("p", {})])
+        assert text == "" and cost == 0.0
+        assert isinstance(error, ClaudeQueryError)
+
+    def test_early_exit_cancels_pending(self, monkeypatch):
+        """Requests still running when the consumer stops are cancelled and finished."""
+        cancelled = []
+        tasks = []
+
+        async def fake_query_claude(prompt, model, timeout_seconds, system=None, schema=None):
+            tasks.append(asyncio.current_task())
+            try:
+                await asyncio.sleep(0 if prompt == "fast" else 10)
+            except asyncio.CancelledError:
+                cancelled.append(prompt)
+                raise
+            return prompt, 0.0
+
+        async def first():
+            stream = claude_client.query_claude_stream([("slow", {}), ("fast", {})])
+            result = await anext(stream)
+            await stream.aclose()
+            return result, [task.done() for task in tasks]
+
+        monkeypatch.setattr(claude_client, "query_claude", fake_query_claude)
+        result, done = asyncio.run(first())
+        assert result[0] == "fast"
+        assert cancelled == ["slow"]
+        assert done == [True, True]
+
+
+class FakeBatches:
+    """Stand-in for client.messages.batches that ends after one poll."""
+
+    def __init__(self, entries):
+        self.entries = entries
+        self.submitted = None
+        self.polls = 0
+
+    async def create(self, requests):
+        self.submitted = requests
+        return SimpleNamespace(id="batch_1", processing_status="in_progress")
+
+    async def retrieve(self, batch_id):
+        self.polls += 1
+        return SimpleNamespace(id=batch_id, processing_status="ended")
+
+    async def results(self, batch_id):
+        async def stream():
+            for entry in self.entries:
+                yield entry
+        return stream()
+
+
+def batch_entry(custom_id, text=None, result_type="succeeded"):
+    """Build one Message Batches result line."""
+    message = None
+    if text is not None:
+        message = SimpleNamespace(
+            content=[SimpleNamespace(type="text", text=text)],
+            usage=SimpleNamespace(input_tokens=1000, output_tokens=100),
+        )
+    return SimpleNamespace(custom_id=custom_id, result=SimpleNamespace(type=result_type, message=message))
+
+
+class TestMessageBatch:
+    """Tests for query_claude_message_batch()."""
+
+    def test_requires_api_key(self, monkeypatch):
+        """Without an API client the batch path refuses, so callers can fall back."""
+        monkeypatch.setattr(claude_client, "get_api_client", lambda: None)
+        with pytest.raises(ClaudeQueryError):
+            asyncio.run(claude_client.query_claude_message_batch([("hi", {})]))
+
+    def test_results_mapped_back_by_custom_id(self, monkeypatch):
+        """Out-of-order results land in input order with half-price cost."""
+        batches = FakeBatches([
+            batch_entry("1", "second"),
+            batch_entry("2", result_type="errored"),
+            batch_entry("0", "first"),
+        ])
+        fake = SimpleNamespace(messages=SimpleNamespace(batches=batches))
+        monkeypatch.setattr(claude_client, "get_api_client", lambda: fake)
+
+        prompts = [(("rules", "a"), {"n": 0}), ("b", {"n": 1}), ("c", {"n": 2}), ("d", {"n": 3})]
+        results = asyncio.run(claude_client.query_claude_message_batch(prompts, poll_seconds=0))
+
+        assert batches.polls == 1
+        assert batches.submitted[0]["custom_id"] == "0"
+        assert batches.submitted[0]["params"]["system"][0]["text"] == "rules"
+        assert [r[0] for r in results] == ["first", "second", "", ""]
+        assert results[0][1] == pytest.approx(0.00075)
+        assert [r[2]["n"] for r in results] == [0, 1, 2, 3]
+        assert results[1][3] is None
+        assert isinstance(results[2][3], ClaudeQueryError)
+        assert isinstance(results[3][3], ClaudeQueryError)
@@ -1,13 +1,12 @@
 # ABOUTME: Tests for email_search.py - search functionality
-# ABOUTME: Tests parse_duration(), date_hint_to_range(), format_date(), strip_html_tags(), format_answer_html()
+# ABOUTME: Tests parse_duration(), date_hint_to_range(), format_date(), strip_html_tags(), format_answer_html(), render_html_results()
 
 import pytest
 from datetime import datetime, timedelta
-import sys
 from pathlib import Path
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
-
+import email_search
+from claude_client import ClaudeQueryError
 from email_search import (
     parse_duration,
     date_hint_to_range,
@@ -18,47 +17,238 @@ from email_search import (
 
 
 class TestParseDuration:
-    """Tests for parse_duration() in email_search.py (includes year support)."""
-
-    def test_hours(self):
-        """Parse hour durations."""
-        assert parse_duration("1h") == timedelta(hours=1)
-        assert parse_duration("24h") == timedelta(hours=24)
-
-    def test_days(self):
-        """Parse day durations."""
-        assert parse_duration("1d") == timedelta(days=1)
-        assert parse_duration("30d") == timedelta(days=30)
-
-    def test_weeks(self):
-        """Parse week durations."""
-        assert parse_duration("1w") == timedelta(weeks=1)
-        assert parse_duration("4w") == timedelta(weeks=4)
-
-    def test_months(self):
-        """Parse month durations."""
-        assert parse_duration("1mo") == timedelta(days=30)
-        assert parse_duration("6mo") == timedelta(days=180)
-
-    def test_years(self):
-        """Parse year durations (unique to email_search)."""
-        assert parse_duration("1y") == timedelta(days=365)
-        assert parse_duration("2y") == timedelta(days=730)
+    """Tests for parse_duration() as used by email_search.py (includes year support)."""
+
+    @pytest.mark.parametrize("duration, expected", [
+        ("1h", timedelta(hours=1)),
+        ("24h", timedelta(hours=24)),
+        ("1d", timedelta(days=1)),
+        ("30d", timedelta(days=30)),
+        ("1w", timedelta(weeks=1)),
+        ("4w", timedelta(weeks=4)),
+        ("1mo", timedelta(days=30)),
+        ("6mo", timedelta(days=180)),
+        ("1y", timedelta(days=365)),
+        ("2y", timedelta(days=730)),
+        # Case-insensitive
+        ("1Y", timedelta(days=365)),
+        ("1MO", timedelta(days=30)),
+    ])
+    def test_valid(self, duration, expected):
+        """Durations in each unit, including years, parse to the matching timedelta."""
+        assert parse_duration(duration) == expected
+
+    @pytest.mark.parametrize("duration", ["invalid", "123"])
+    def test_invalid_format(self, duration):
+        """Invalid formats and missing units raise ValueError."""
+        with pytest.raises(ValueError, match="Invalid duration format"):
+            parse_duration(duration)
+
+
+class TestClaudePrompts:
+    """Tests for the prompts parse_query() and generate_answer() send."""
+
+    @pytest.fixture
+    def calls(self, monkeypatch):
+        """Replace call_claude and record (prompt, system) pairs."""
+        calls = []
+
+        def fake_call_claude(prompt, timeout=90, system=None, use_cache=True):
+            calls.append((prompt, system))
+            return '{"people": ["Sarah"], "keywords": ["budget"], "date_hint": null}'
+
+        monkeypatch.setattr(email_search, "call_claude", fake_call_claude)
+        return calls
+
+    def test_parse_query_uses_static_system_prompt(self, calls):
+        """Only the query goes in the user message; instructions are the system prompt."""
+        parsed = email_search.parse_query("what did Sarah say about the budget")
+        assert parsed["people"] == ["Sarah"]
+        assert calls == [('Query: "what did Sarah say about the budget"', email_search.PARSE_QUERY_SYSTEM_PROMPT)]
+
+    @pytest.mark.parametrize("response", [
+        '```json\n{"people": [], "keywords": ["budget"], "date_hint": null}\n```',
+        'Here you go: {"people": [], "keywords": ["budget"], "date_hint": null}',
+    ])
+    def test_parse_query_unwraps_response(self, monkeypatch, response):
+        """Fenced or prose-wrapped replies are parsed like the classifier's."""
+        monkeypatch.setattr(email_search, "call_claude", lambda *args, **kwargs: response)
+        assert email_search.parse_query("budget")["keywords"] == ["budget"]
+
+    def test_parse_query_falls_back_to_words(self, monkeypatch):
+        """An unparseable reply uses the query's longer words as keywords."""
+        monkeypatch.setattr(email_search, "call_claude", lambda *args, **kwargs: "no idea")
+        assert email_search.parse_query("the budget memo") == {
+            "people": [], "keywords": ["the", "budget", "memo"], "date_hint": None,
+        }
+
+    def test_answer_numbers_emails(self, calls):
+        """generate_answer() numbers each email in the user message."""
+        result = {"from_name": "Sarah", "from_email": "s@example.com", "date": "2025-01-02",
+                  "subject": "Budget", "body_preview": "Numbers attached"}
+        email_search.generate_answer("budget?", [result, dict(result, subject="Re: Budget")])
+        prompt, system = calls[0]
+        assert system == email_search.ANSWER_SYSTEM_PROMPT
+        assert prompt.startswith("QUESTION: budget?\n\nEMAILS:\n")
+        assert "--- Email 1 ---\nFrom: Sarah <s@example.com>" in prompt
+        assert "--- Email 2 ---" in prompt and "Subject: Re: Budget" in prompt
+
+
+class TestCallClaudeCache:
+    """Tests for the on-disk response cache in call_claude()."""
+
+    @pytest.fixture
+    def queries(self, monkeypatch, tmp_path):
+        """Point the cache at a temp file and count real Claude queries."""
+        queries = []
+
+        def fake_query_claude_sync(prompt, timeout_seconds=90, system=None):
+            queries.append(prompt)
+            return f"answer {len(queries)}", 0.0
+
+        monkeypatch.setattr(email_search, "LLM_CACHE_PATH", tmp_path / "llm.sqlite")
+        monkeypatch.setattr(email_search, "query_claude_sync", fake_query_claude_sync)
+        return queries
+
+    def test_repeat_prompt_served_from_cache(self, queries):
+        """An identical prompt and system prompt is only sent once."""
+        assert email_search.call_claude("q", system="s") == "answer 1"
+        assert email_search.call_claude("q", system="s") == "answer 1"
+        assert queries == ["q"]
+
+    def test_system_prompt_part_of_key(self, queries):
+        """A different system prompt is a different cache entry."""
+        email_search.call_claude("q", system="a")
+        assert email_search.call_claude("q", system="b") == "answer 2"
+
+    def test_no_cache_always_queries(self, queries):
+        """use_cache=False neither reads nor writes the cache."""
+        email_search.call_claude("q", use_cache=False)
+        email_search.call_claude("q")
+        assert queries == ["q", "q"]
+
+    def test_failures_not_cached(self, queries, monkeypatch):
+        """Empty responses from failed calls are retried next time."""
+        working = email_search.query_claude_sync
+
+        def failing(prompt, timeout_seconds=90, system=None):
+            raise ClaudeQueryError("boom")
+
+        monkeypatch.setattr(email_search, "query_claude_sync", failing)
+        assert email_search.call_claude("q") == ""
+        monkeypatch.setattr(email_search, "query_claude_sync", working)
+        assert email_search.call_claude("q") == "answer 1"
+
+
+class TestParseEmlFile:
+    """Tests for parse_eml_file() and parse_eml_headers()."""
+
+    def test_parse_fields(self, tmp_path, write_eml):
+        """Sender, subject and body preview are extracted."""
+        parsed = email_search.parse_eml_file(write_eml(tmp_path / "a.eml", "Budget"))
+        assert parsed["from_name"] == "Sarah Lee"
+        assert parsed["from_email"] == "sarah@example.com"
+        assert parsed["subject"] == "Budget"
+        assert parsed["body_preview"] == "Body of Budget"
+
+    def test_missing_file_reports_error(self, tmp_path):
+        """Unreadable files give an error entry instead of raising."""
+        assert "error" in email_search.parse_eml_file(tmp_path / "missing.eml")
+
+    def test_headers_only(self, tmp_path, write_eml):
+        """parse_eml_headers() returns sender, subject and date without a body preview."""
+        parsed = email_search.parse_eml_headers(write_eml(tmp_path / "a.eml", "Budget"))
+        assert parsed["from_email"] == "sarah@example.com"
+        assert parsed["subject"] == "Budget"
+        assert "body_preview" not in parsed
+
+
+class TestFetchCandidates:
+    """Tests for fetch_candidates() against a GYB-style database."""
+
+    def test_promotions_and_updates_excluded(self, gyb_db, tmp_path, monkeypatch):
+        """Messages labelled CATEGORY_PROMOTIONS/UPDATES are filtered in SQL."""
+        monkeypatch.setattr(email_search, "DB_PATH", tmp_path / "msg-db.sqlite")
+        candidates = email_search.fetch_candidates(None, None)
+        assert [c["message_num"] for c in candidates] == [2, 1]
+
+    def test_date_range(self, gyb_db, tmp_path, monkeypatch):
+        """since and until bound the message date inclusively."""
+        monkeypatch.setattr(email_search, "DB_PATH", tmp_path / "msg-db.sqlite")
+        candidates = email_search.fetch_candidates(datetime(2025, 1, 2), datetime(2025, 1, 2, 23))
+        assert [c["message_num"] for c in candidates] == [2]
+
+
+class TestFilterCandidates:
+    """Tests for filter_candidates() against a temporary index."""
+
+    @pytest.fixture
+    def archive(self, monkeypatch, tmp_path, write_eml):
+        """A GMAIL_DIR with three messages and an index in tmp_path."""
+        import search_index
+
+        monkeypatch.setattr(email_search, "GMAIL_DIR", tmp_path)
+        monkeypatch.setattr(email_search, "open_index", lambda: search_index.open_index(tmp_path / "index.sqlite"))
+        write_eml(tmp_path / "1.eml", "Budget draft")
+        write_eml(tmp_path / "2.eml", "Budget final", sender="Bob <bob@example.com>")
+        write_eml(tmp_path / "3.eml", "Lunch", sender="Bob <bob@example.com>")
+        return [
+            {"message_num": n, "filename": f"{n}.eml", "date": f"2025-01-0{n} 09:00:00", "gmail_link": ""}
+            for n in (1, 2, 3)
+        ]
+
+    def test_ranked_by_terms_then_date(self, archive):
+        """Candidates matching more terms come first; ties go to the newest."""
+        matched = email_search.filter_candidates(archive, ["budget"], ["sarah"])
+        assert [c["message_num"] for c in matched] == [1, 2]
+        assert [c["match_score"] for c in matched] == [2, 1]
+
+    def test_ranking_reads_indexed_text(self, archive, monkeypatch):
+        """Indexed candidates are ranked from the index without re-parsing their files."""
+        parsed_paths = []
+
+        parse_eml_file = email_search.parse_eml_file
+
+        def fake_parse_eml_file(path):
+            parsed_paths.append(path)
+            return parse_eml_file(path)
+
+        monkeypatch.setattr(email_search, "parse_eml_file", fake_parse_eml_file)
+        matched = email_search.filter_candidates(archive[:2], ["budget"], [])
+        results = email_search.rank_and_parse_results(matched + archive[2:], ["budget"], [])
+
+        assert parsed_paths == [email_search.GMAIL_DIR / "3.eml"]
+        by_subject = {r["subject"]: r for r in results}
+        assert set(by_subject) == {"Budget draft", "Budget final", "Lunch"}
+        assert by_subject["Budget draft"]["from_name"] == "Sarah Lee"
+        assert by_subject["Budget draft"]["body_preview"] == "Body of Budget draft"
+
+    def test_only_winners_fully_parsed(self, archive, monkeypatch):
+        """Unindexed candidates outside the top `limit` never have their bodies parsed."""
+        parsed_paths = []
 
-    def test_case_insensitive(self):
-        """Duration parsing is case-insensitive."""
-        assert parse_duration("1Y") == timedelta(days=365)
-        assert parse_duration("1MO") == timedelta(days=30)
+        parse_eml_file = email_search.parse_eml_file
 
-    def test_invalid_format(self):
-        """Invalid format raises ValueError."""
-        with pytest.raises(ValueError, match="Invalid duration format"):
-            parse_duration("invalid")
+        def fake_parse_eml_file(path):
+            parsed_paths.append(path)
+            return parse_eml_file(path)
 
-    def test_missing_unit(self):
-        """Missing unit raises ValueError."""
-        with pytest.raises(ValueError, match="Invalid duration format"):
-            parse_duration("123")
+        monkeypatch.setattr(email_search, "parse_eml_file", fake_parse_eml_file)
+        results = email_search.rank_and_parse_results(archive, ["lunch"], [], limit=1)
+
+        assert [r["subject"] for r in results] == ["Lunch"]
+        assert results[0]["body_preview"] == "Body of Lunch"
+        assert parsed_paths == [email_search.GMAIL_DIR / "3.eml"]
+
+    def test_missing_files_skipped(self, archive):
+        """Unindexed candidates whose EML file is gone are dropped from the results."""
+        (email_search.GMAIL_DIR / "3.eml").unlink()
+        results = email_search.rank_and_parse_results(archive, ["budget"], [])
+        assert sorted(r["message_num"] for r in results) == [1, 2]
+
+    def test_no_terms_returns_candidates(self, archive):
+        """Without keywords or people every candidate is kept, unindexed."""
+        assert email_search.filter_candidates(archive, [], []) == archive
 
 
 class TestDateHintToRange:
@@ -264,3 +454,23 @@ class TestFormatAnswerHtml:
         """Email refs have correct CSS class."""
         result = format_answer_html("Email 1")
         assert 'class="email-ref"' in result
+
+
+class TestRenderHtmlResults:
+    """Tests for render_html_results() using the repo's template."""
+
+    def test_writes_results_page(self, tmp_path, monkeypatch):
+        """The rendered page is written to SEARCHES_DIR as UTF-8."""
+        monkeypatch.setattr(email_search, "TEMPLATES_DIR", Path(__file__).parent.parent / "templates")
+        monkeypatch.setattr(email_search, "SEARCHES_DIR", tmp_path)
+        monkeypatch.setattr(email_search, "TEMPLATE_CACHE_DIR", tmp_path / "template_cache")
+        results = [{
+            "from_name": "Zoë", "from_email": "zoe@example.com", "subject": "Café plans",
+            "date": "2025-01-02 09:00:00", "body_preview": "<p>See you</p>", "gmail_link": "",
+        }]
+        path = email_search.render_html_results("cafe plans", results, "See **Email 1**")
+        html = path.read_text(encoding="utf-8")
+        assert path.parent == tmp_path
+        assert list((tmp_path / "template_cache").iterdir())
+        assert "Café plans" in html
+        assert 'href="#source-1"' in html
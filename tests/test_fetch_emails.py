@@ -1,72 +1,85 @@
-# ABOUTME: Tests for fetch_emails.py - duration parsing functionality
-# ABOUTME: Tests parse_duration() with various time units
+# ABOUTME: Tests for fetch_emails.py - duration parsing and message queries
+# ABOUTME: Tests parse_duration() with various time units and query_messages() on a GYB-style database
 
 import pytest
-from datetime import timedelta
-import sys
-from pathlib import Path
+import sqlite3
+from datetime import datetime, timedelta
 
-# Add scripts directory to path for imports
-sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
-
-from fetch_emails import parse_duration
+import fetch_emails
+from fetch_emails import parse_duration, query_messages
 
 
 class TestParseDuration:
     """Tests for parse_duration() function."""
 
-    def test_hours(self):
-        """Parse hour durations."""
-        assert parse_duration("1h") == timedelta(hours=1)
-        assert parse_duration("12h") == timedelta(hours=12)
-        assert parse_duration("24h") == timedelta(hours=24)
+    @pytest.mark.parametrize("duration, expected", [
+        ("1h", timedelta(hours=1)),
+        ("12h", timedelta(hours=12)),
+        ("24h", timedelta(hours=24)),
+        ("1d", timedelta(days=1)),
+        ("7d", timedelta(days=7)),
+        ("30d", timedelta(days=30)),
+        ("1w", timedelta(weeks=1)),
+        ("2w", timedelta(weeks=2)),
+        ("4w", timedelta(weeks=4)),
+        # Months are approximated as 30 days
+        ("1mo", timedelta(days=30)),
+        ("2mo", timedelta(days=60)),
+        ("12mo", timedelta(days=360)),
+        # Case-insensitive
+        ("1D", timedelta(days=1)),
+        ("1H", timedelta(hours=1)),
+        ("1W", timedelta(weeks=1)),
+        ("1MO", timedelta(days=30)),
+        # Zero durations are valid
+        ("0d", timedelta(days=0)),
+        ("0h", timedelta(hours=0)),
+    ])
+    def test_valid(self, duration, expected):
+        """Durations in each unit parse to the matching timedelta."""
+        assert parse_duration(duration) == expected
 
-    def test_days(self):
-        """Parse day durations."""
-        assert parse_duration("1d") == timedelta(days=1)
-        assert parse_duration("7d") == timedelta(days=7)
-        assert parse_duration("30d") == timedelta(days=30)
+    @pytest.mark.parametrize("duration", ["123", "1x", "", "d1"])
+    def test_invalid_format(self, duration):
+        """Missing or unknown units, empty strings and letters first raise ValueError."""
+        with pytest.raises(ValueError, match="Invalid duration format"):
+            parse_duration(duration)
 
-    def test_weeks(self):
-        """Parse week durations."""
-        assert parse_duration("1w") == timedelta(weeks=1)
-        assert parse_duration("2w") == timedelta(weeks=2)
-        assert parse_duration("4w") == timedelta(weeks=4)
 
-    def test_months(self):
-        """Parse month durations (approximated as 30 days)."""
-        assert parse_duration("1mo") == timedelta(days=30)
-        assert parse_duration("2mo") == timedelta(days=60)
-        assert parse_duration("12mo") == timedelta(days=360)
+class TestQueryMessages:
+    """Tests for query_messages() and fetch_emails()."""
 
-    def test_case_insensitive(self):
-        """Duration parsing is case-insensitive."""
-        assert parse_duration("1D") == timedelta(days=1)
-        assert parse_duration("1H") == timedelta(hours=1)
-        assert parse_duration("1W") == timedelta(weeks=1)
-        assert parse_duration("1MO") == timedelta(days=30)
+    def test_labels_and_uids_attached(self, gyb_db):
+        """Each message gets its own labels and UID link; missing ones are empty."""
+        emails = {e["message_num"]: e for e in query_messages(gyb_db, "1=1", [])}
+        assert sorted(emails[1]["labels"]) == ["INBOX", "UNREAD"]
+        assert emails[1]["gmail_link"] == "https://mail.google.com/mail/u/0/#all/abc"
+        assert emails[2]["labels"] == [] and emails[2]["uid"] == "" and emails[2]["gmail_link"] == ""
 
-    def test_invalid_format_no_unit(self):
-        """Invalid format without unit raises ValueError."""
-        with pytest.raises(ValueError, match="Invalid duration format"):
-            parse_duration("123")
+    def test_newest_first_with_limit(self, gyb_db):
+        """Messages come back newest first and the limit applies before lookups."""
+        emails = query_messages(gyb_db, "1=1", [], limit=2)
+        assert [e["message_num"] for e in emails] == [3, 2]
 
-    def test_invalid_format_bad_unit(self):
-        """Invalid unit raises ValueError."""
-        with pytest.raises(ValueError, match="Invalid duration format"):
-            parse_duration("1x")
+    def test_lookups_chunked(self, gyb_db, monkeypatch):
+        """Label lookups are split into chunks without losing rows."""
+        monkeypatch.setattr(fetch_emails, "LOOKUP_CHUNK", 1)
+        emails = {e["message_num"]: e for e in query_messages(gyb_db, "1=1", [])}
+        assert sorted(emails[1]["labels"]) == ["INBOX", "UNREAD"]
+        assert emails[3]["labels"] == ["CATEGORY_UPDATES"]
 
-    def test_invalid_format_empty(self):
-        """Empty string raises ValueError."""
-        with pytest.raises(ValueError, match="Invalid duration format"):
-            parse_duration("")
-
-    def test_invalid_format_letters_first(self):
-        """Letters before numbers raises ValueError."""
-        with pytest.raises(ValueError, match="Invalid duration format"):
-            parse_duration("d1")
+    def test_fetch_since(self, gyb_db, tmp_path, monkeypatch):
+        """fetch_emails() returns messages on or after the given time."""
+        monkeypatch.setattr(fetch_emails, "DB_PATH", tmp_path / "msg-db.sqlite")
+        emails = fetch_emails.fetch_emails(datetime(2025, 1, 2))
+        assert [e["message_num"] for e in emails] == [3, 2]
 
-    def test_zero_duration(self):
-        """Zero duration is valid."""
-        assert parse_duration("0d") == timedelta(days=0)
-        assert parse_duration("0h") == timedelta(hours=0)
+    def test_archive_opened_read_only(self, gyb_db, tmp_path):
+        """open_archive() can read the GYB database but never write to it."""
+        conn = fetch_emails.open_archive(tmp_path / "msg-db.sqlite")
+        try:
+            assert len(query_messages(conn, "1=1", [])) == 3
+            with pytest.raises(sqlite3.OperationalError):
+                conn.execute("DELETE FROM messages")
+        finally:
+            conn.close()
@@ -1,14 +1,11 @@
 # ABOUTME: Tests for group_threads.py - email threading functionality
-# ABOUTME: Tests normalize_subject(), parse_date(), find_thread_root(), group_emails_by_thread()
+# ABOUTME: Tests normalize_subject(), parse_date(), thread_roots(), group_emails_by_thread()
 
 import pytest
 from datetime import datetime
-import sys
-from pathlib import Path
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
-
-from group_threads import normalize_subject, parse_date, find_thread_root, group_emails_by_thread
+from group_threads import normalize_subject, parse_date, thread_roots, group_emails_by_thread
+from group_threads import strip_grouping_fields
 
 
 class TestNormalizeSubject:
@@ -89,6 +86,10 @@ class TestParseDate:
         assert result.month == 12
         assert result.day == 13
 
+    def test_rfc_2822_without_weekday(self):
+        """RFC 2822 dates that start with the day number are not mistaken for ISO."""
+        assert parse_date("3 Dec 2025 10:30:00 +0000") == datetime(2025, 12, 3, 10, 30)
+
     def test_empty_date(self):
         """Empty date returns datetime.min."""
         assert parse_date("") == datetime.min
@@ -99,6 +100,12 @@ class TestParseDate:
         assert parse_date("not a date") == datetime.min
         assert parse_date("12345") == datetime.min
 
+    def test_offsets_normalized_to_utc(self):
+        """Dates with different offsets compare by instant, and against naive dates."""
+        pacific = parse_date("Sat, 13 Dec 2025 10:30:00 -0800")
+        assert pacific == datetime(2025, 12, 13, 18, 30)
+        assert sorted([pacific, datetime.min, parse_date("2025-12-13 12:00:00")])[0] == datetime.min
+
     def test_short_format_without_day_name(self):
         """Date without day name."""
         date_str = "13 Dec 2025 10:30:00 +0000"
@@ -106,55 +113,54 @@ class TestParseDate:
         assert result.year == 2025
 
 
-class TestFindThreadRoot:
-    """Tests for find_thread_root() function."""
+class TestThreadRoots:
+    """Tests for thread_roots() function."""
 
     def test_single_email_no_parent(self):
         """Email with no parent is its own root."""
-        email = {"message_id": "msg1", "in_reply_to": ""}
-        message_id_map = {"msg1": email}
-        assert find_thread_root(email, message_id_map) == "msg1"
+        message_id_map = {"msg1": {"message_id": "msg1", "in_reply_to": ""}}
+        assert thread_roots(message_id_map) == {"msg1": "msg1"}
 
     def test_reply_chain(self):
-        """Follow reply chain to find root."""
-        root = {"message_id": "root", "in_reply_to": ""}
-        reply1 = {"message_id": "reply1", "in_reply_to": "root"}
-        reply2 = {"message_id": "reply2", "in_reply_to": "reply1"}
-
+        """Every message in a reply chain maps to the chain's root."""
         message_id_map = {
-            "root": root,
-            "reply1": reply1,
-            "reply2": reply2
+            "reply2": {"message_id": "reply2", "in_reply_to": "reply1"},
+            "reply1": {"message_id": "reply1", "in_reply_to": "root"},
+            "root": {"message_id": "root", "in_reply_to": ""},
         }
-
-        assert find_thread_root(reply2, message_id_map) == "root"
-        assert find_thread_root(reply1, message_id_map) == "root"
-        assert find_thread_root(root, message_id_map) == "root"
+        assert thread_roots(message_id_map) == {"reply2": "root", "reply1": "root", "root": "root"}
 
     def test_external_parent(self):
-        """Parent not in our set - returns external ID."""
-        email = {"message_id": "msg1", "in_reply_to": "external_parent"}
-        message_id_map = {"msg1": email}
-        # external_parent is not in map, so it's returned as root
-        assert find_thread_root(email, message_id_map) == "external_parent"
-
-    def test_no_message_id(self):
-        """Email without message_id returns empty."""
-        email = {"in_reply_to": "parent"}
-        message_id_map = {}
-        assert find_thread_root(email, message_id_map) == ""
+        """A parent outside the set leaves the message as its own root."""
+        message_id_map = {"msg1": {"message_id": "msg1", "in_reply_to": "external_parent"}}
+        assert thread_roots(message_id_map) == {"msg1": "msg1"}
+
+    def test_references_fallback(self):
+        """With an unknown parent, the first known References ancestor is used."""
+        message_id_map = {
+            "root": {"message_id": "root", "in_reply_to": ""},
+            "msg2": {"message_id": "msg2", "in_reply_to": "missing", "references": "<external> <root> <missing>"},
+        }
+        assert thread_roots(message_id_map)["msg2"] == "root"
+
+    def test_long_chain(self):
+        """Deep reply chains resolve to one root."""
+        message_id_map = {
+            f"m{i}": {"message_id": f"m{i}", "in_reply_to": f"m{i - 1}" if i else ""}
+            for i in reversed(range(500))
+        }
+        assert set(thread_roots(message_id_map).values()) == {"m0"}
 
     def test_cycle_detection(self):
         """Cycle in reply chain doesn't cause infinite loop."""
         # Create a cycle: msg1 -> msg2 -> msg1
-        msg1 = {"message_id": "msg1", "in_reply_to": "msg2"}
-        msg2 = {"message_id": "msg2", "in_reply_to": "msg1"}
-
-        message_id_map = {"msg1": msg1, "msg2": msg2}
-
-        # Should not hang - returns one of the IDs in the cycle
-        result = find_thread_root(msg1, message_id_map)
-        assert result in ["msg1", "msg2"]
+        message_id_map = {
+            "msg1": {"message_id": "msg1", "in_reply_to": "msg2"},
+            "msg2": {"message_id": "msg2", "in_reply_to": "msg1"},
+        }
+        roots = thread_roots(message_id_map)
+        assert roots["msg1"] == roots["msg2"]
+        assert roots["msg1"] in ["msg1", "msg2"]
 
 
 class TestGroupEmailsByThread:
@@ -248,6 +254,20 @@ class TestGroupEmailsByThread:
         total_messages = sum(len(item["messages"]) for item in items)
         assert total_messages == 2
 
+    def test_orphan_joins_thread_with_same_subject(self):
+        """An email without message_id joins the existing thread with its subject."""
+        parsed = [
+            {"message_num": 1, "message_id": "msg1", "in_reply_to": "", "references": "", "subject": "Budget", "from_name": "Alice", "date": "2025-12-13 10:00:00"},
+            {"message_num": 2, "message_id": "msg2", "in_reply_to": "", "references": "", "subject": "Lunch", "from_name": "Carol", "date": "2025-12-13 10:30:00"},
+            {"message_num": 3, "message_id": "", "in_reply_to": "", "references": "", "subject": "Fwd: Budget", "from_name": "Bob", "date": "2025-12-13 11:00:00"}
+        ]
+
+        items = group_emails_by_thread(parsed, [])
+
+        threads = [item for item in items if item["is_thread"]]
+        assert len(items) == 2
+        assert [m["message_num"] for m in threads[0]["messages"]] == [1, 3]
+
     def test_thread_uses_base_subject(self):
         """Thread subject is the base subject without Re:/Fwd:."""
         parsed = [
@@ -277,3 +297,16 @@ class TestGroupEmailsByThread:
         items = group_emails_by_thread(parsed, raw)
 
         assert items[0]["gmail_link"] == "http://new"
+
+
+class TestStripGroupingFields:
+    """Tests for strip_grouping_fields() function."""
+
+    def test_drops_grouping_only_fields(self):
+        """References, filepath and body_length are removed; classifier inputs stay."""
+        items = [{"is_thread": False, "messages": [{
+            "message_num": 1, "references": "a", "filepath": "x.eml", "body_length": 5,
+            "body_preview": "Hi", "labels": "INBOX",
+        }]}]
+        strip_grouping_fields(items)
+        assert items[0]["messages"][0] == {"message_num": 1, "body_preview": "Hi", "labels": "INBOX"}
@@ -0,0 +1,82 @@
+# ABOUTME: Tests for label_rules.py - shared Gmail label rules
+# ABOUTME: Tests label_set(), category_from_labels(), template_summary()
+
+import pytest
+
+import label_rules
+from label_rules import label_set, category_from_labels, template_summary
+
+
+class TestLabelSet:
+    """Tests for label_set() function."""
+
+    def test_pipe_joined_string(self):
+        """'|'-joined label strings are split."""
+        assert label_set("INBOX|UNREAD") == {"INBOX", "UNREAD"}
+
+    def test_list(self):
+        """Label lists are used as-is."""
+        assert label_set(["INBOX", "UNREAD"]) == {"INBOX", "UNREAD"}
+
+    def test_empty(self):
+        """Empty or missing labels give an empty set."""
+        assert label_set("") == frozenset()
+        assert label_set(None) == frozenset()
+        assert label_set([]) == frozenset()
+
+
+class TestCategoryFromLabels:
+    """Tests for category_from_labels() function."""
+
+    def test_promotions(self):
+        """CATEGORY_PROMOTIONS maps to NEWSLETTER."""
+        assert category_from_labels(["INBOX", "CATEGORY_PROMOTIONS"]) == "NEWSLETTER"
+
+    def test_updates(self):
+        """CATEGORY_UPDATES maps to AUTOMATED."""
+        assert category_from_labels("CATEGORY_UPDATES") == "AUTOMATED"
+
+    def test_precedence(self):
+        """PROMOTIONS wins over UPDATES."""
+        assert category_from_labels(["CATEGORY_UPDATES", "CATEGORY_PROMOTIONS"]) == "NEWSLETTER"
+
+    def test_whole_label_match(self):
+        """Labels must match exactly, not as substrings."""
+        assert category_from_labels(["MY_CATEGORY_PROMOTIONS_ARCHIVE"]) is None
+
+    def test_no_match(self):
+        """Unrelated labels return None."""
+        assert category_from_labels(["INBOX"]) is None
+
+    def test_repeated_label_string_memoized(self):
+        """Repeated label strings are answered from the memo, same as lists."""
+        label_rules._category_from_label_string.cache_clear()
+        for _ in range(3):
+            assert category_from_labels("INBOX|CATEGORY_UPDATES") == "AUTOMATED"
+        assert category_from_labels(["INBOX", "CATEGORY_UPDATES"]) == "AUTOMATED"
+        info = label_rules._category_from_label_string.cache_info()
+        assert (info.hits, info.misses) == (2, 1)
+
+
+class TestTemplateSummary:
+    """Tests for template_summary() function."""
+
+    def test_newsletter(self):
+        """Newsletter template names sender and subject."""
+        email = {"from_name": "Shop", "subject": "Sale"}
+        assert template_summary(email, "NEWSLETTER") == "Marketing email from Shop about Sale"
+
+    def test_rule_categories(self):
+        """FINANCIAL and CALENDAR have their own templates."""
+        email = {"from_name": "Bank", "subject": "Statement"}
+        assert template_summary(email, "FINANCIAL") == "Account notice from Bank: Statement"
+        assert template_summary(email, "CALENDAR") == "Calendar update from Bank: Statement"
+
+    def test_unknown_category_uses_notification(self):
+        """Categories without a template fall back to the notification one."""
+        email = {"from_name": "Bot", "subject": "Build"}
+        assert template_summary(email, "SOMETHING") == "Notification from Bot: Build"
+
+    def test_missing_fields(self):
+        """Missing sender falls back to Unknown."""
+        assert "Unknown" in template_summary({}, "AUTOMATED")
@@ -1,13 +1,11 @@
 # ABOUTME: Tests for parse_eml.py - email parsing functionality
-# ABOUTME: Tests decode_mime_header(), extract_name_and_email(), strip_html()
+# ABOUTME: Tests decode_mime_header(), extract_name_and_email(), strip_html(), get_body_text(), parse_batch()
 
+import email
+import email.policy
 import pytest
-import sys
-from pathlib import Path
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
-
-from parse_eml import decode_mime_header, extract_name_and_email, strip_html
+from parse_eml import decode_mime_header, extract_name_and_email, get_body_text, parse_batch, strip_html
 
 
 class TestDecodeMimeHeader:
@@ -41,6 +39,13 @@ class TestDecodeMimeHeader:
         # This tests the function's ability to handle multi-part headers
         assert decode_mime_header("Hello World") == "Hello World"
 
+    def test_parsed_header_returned_as_str(self):
+        """Header objects from the default policy come back as plain str."""
+        msg = email.message_from_string("Subject: Hello\n\n", policy=email.policy.default)
+        result = decode_mime_header(msg["Subject"])
+        assert result == "Hello"
+        assert type(result) is str
+
     def test_iso_8859_1_encoded(self):
         """ISO-8859-1 encoded header is decoded."""
         encoded = "=?iso-8859-1?Q?Caf=E9?="
@@ -63,16 +68,10 @@ class TestExtractNameAndEmail:
         assert email == "jane@example.com"
 
     def test_email_only(self):
-        """Just email address, no name.
-
-        Note: Current regex has edge case with bare emails - it captures
-        partial username due to backtracking. This documents actual behavior.
-        The function works correctly for standard "Name <email>" format.
-        """
+        """Just email address, no name: the username becomes the name."""
         name, email = extract_name_and_email("user@example.com")
-        # Current behavior - regex backtracking causes partial match
-        # For standard formats with <>, this works correctly
-        assert "@" in email  # Email is extracted (even if partial)
+        assert name == "user"
+        assert email == "user@example.com"
 
     def test_email_in_brackets_only(self):
         """Email in brackets with no name."""
@@ -92,6 +91,15 @@ class TestExtractNameAndEmail:
         assert name == "John Doe"
         assert email == "john@example.com"
 
+    def test_unparseable_header_returned_as_is(self):
+        """Headers without an address fall back to the raw value."""
+        assert extract_name_and_email("Undisclosed recipients") == ("Undisclosed recipients", "Undisclosed recipients")
+
+    def test_long_header_without_address(self):
+        """A long name with no closing bracket fails fast instead of backtracking."""
+        header = "a" * 5000 + " <" + "b" * 5000
+        assert extract_name_and_email(header) == (header, header)
+
     def test_empty_name_uses_username(self):
         """Empty name falls back to email username."""
         name, email = extract_name_and_email("<support@company.com>")
@@ -159,6 +167,10 @@ class TestStripHtml:
         # Should not have excessive whitespace
         assert "     " not in result
 
+    def test_blank_lines_collapsed(self):
+        """Runs of blank lines, including ones holding spaces, become one blank line."""
+        assert strip_html("a\n \n\n  \nb  c") == "a\n\nb c"
+
     def test_empty_html(self):
         """Empty string returns empty."""
         assert strip_html("") == ""
@@ -189,3 +201,49 @@ class TestStripHtml:
         assert "John" in result
         assert "<" not in result
         assert "font:arial" not in result
+
+
+def multipart_message(*bodies: str) -> email.message.Message:
+    """Build a multipart/mixed message with one text/plain part per body."""
+    parts = "".join(
+        f"--XX\nContent-Type: text/plain; charset=utf-8\n\n{body}\n" for body in bodies
+    )
+    raw = f"Subject: Parts\nMIME-Version: 1.0\nContent-Type: multipart/mixed; boundary=XX\n\n{parts}--XX--\n"
+    return email.message_from_string(raw, policy=email.policy.default)
+
+
+class TestGetBodyText:
+    """Tests for get_body_text() function."""
+
+    def test_all_plain_parts_joined(self):
+        """Every text/plain part is included by default."""
+        assert get_body_text(multipart_message("first", "second")) == "first\nsecond"
+
+    def test_max_chars_stops_early(self):
+        """Parts after the max_chars cut-off are not decoded."""
+        assert get_body_text(multipart_message("a" * 10, "second"), max_chars=5) == "a" * 10
+
+
+class TestParseBatch:
+    """Tests for parse_batch() function."""
+
+    @pytest.mark.parametrize("count", [3, 40])
+    def test_results_in_input_order(self, tmp_path, count):
+        """Serial and process-pool parsing both keep the input order and message_num."""
+        emails = []
+        for i in range(count):
+            path = tmp_path / f"{i}.eml"
+            path.write_text(f"From: a@example.com\nSubject: Subject {i}\n\nBody {i}\n")
+            emails.append({"filename": str(path), "message_num": i})
+
+        results = list(parse_batch(emails))
+        assert [r["subject"] for r in results] == [f"Subject {i}" for i in range(count)]
+        assert [r["message_num"] for r in results] == list(range(count))
+
+    def test_plain_filenames(self, tmp_path):
+        """Entries may be bare filenames without a message_num."""
+        path = tmp_path / "a.eml"
+        path.write_text("Subject: Hi\n\nBody\n")
+        [result] = parse_batch([str(path)])
+        assert result["subject"] == "Hi"
+        assert "message_num" not in result
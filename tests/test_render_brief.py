@@ -1,12 +1,10 @@
 # ABOUTME: Tests for render_brief.py - HTML rendering functionality
-# ABOUTME: Tests format_date_short() and organize_by_category()
+# ABOUTME: Tests format_date_short(), organize_by_category() and render_brief()
 
 import pytest
-import sys
 from pathlib import Path
 
-sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
-
+import render_brief
 from render_brief import format_date_short, organize_by_category
 
 
@@ -30,6 +28,10 @@ class TestFormatDateShort:
         result = format_date_short("Mon, 13 Dec 2025 10:30:00 -0800")
         assert "Dec" in result
 
+    def test_rfc_format_without_weekday(self):
+        """RFC 2822 dates starting with the day number are not parsed as ISO."""
+        assert format_date_short("3 Dec 2025 10:30:00 +0000") == "Dec 03, 10:30 AM"
+
     def test_am_pm_formatting(self):
         """Time includes AM/PM."""
         result = format_date_short("2025-12-13 10:30:00")
@@ -180,3 +182,18 @@ class TestOrganizeByCategory:
         assert section_names.index("Urgent") < section_names.index("FYI")
         assert section_names.index("Needs Response") < section_names.index("FYI")
         assert section_names.index("FYI") < section_names.index("Newsletters & Promotions")
+
+
+class TestRenderBrief:
+    """Tests for render_brief() with the repo's template."""
+
+    def test_writes_brief_and_caches_template(self, tmp_path, monkeypatch, classified_emails):
+        """The brief is written and the compiled template lands in the bytecode cache."""
+        monkeypatch.setattr(render_brief, "TEMPLATE_DIR", Path(__file__).parent.parent / "templates")
+        monkeypatch.setattr(render_brief, "TEMPLATE_CACHE_DIR", tmp_path / "template_cache")
+        output_path = tmp_path / "briefs" / "brief.html"
+
+        render_brief.render_brief(classified_emails, "1d", output_path)
+
+        assert "Production server is down" in output_path.read_text(encoding="utf-8")
+        assert list((tmp_path / "template_cache").iterdir())
@@ -0,0 +1,75 @@
+# ABOUTME: Tests for search_index.py - FTS5 keyword index over EML files
+# ABOUTME: Tests term_query(), index_messages(), match_counts()
+
+import pytest
+
+from search_index import HEADER_COLUMNS, open_index, index_messages, match_counts, term_query
+
+
+@pytest.fixture
+def index(tmp_path):
+    """An empty index in a temporary directory."""
+    conn = open_index(tmp_path / "index.sqlite")
+    yield conn
+    conn.close()
+
+
+class TestTermQuery:
+    """Tests for term_query() function."""
+
+    def test_prefix_phrase(self):
+        """Terms become quoted prefix phrases."""
+        assert term_query("google interview") == '"google interview"*'
+
+    def test_quotes_escaped(self):
+        """Embedded quotes are doubled so FTS5 syntax stays literal."""
+        assert term_query('say "hi"') == '"say ""hi"""*'
+
+    def test_column_filter(self):
+        """Columns restrict the query with an FTS5 column filter."""
+        assert term_query("sarah", ("sender", "recipients")) == '{sender recipients} : "sarah"*'
+
+
+class TestIndexMessages:
+    """Tests for index_messages() and match_counts()."""
+
+    def test_counts_matching_terms(self, index, tmp_path, write_eml):
+        """Each message scores one per distinct term it contains."""
+        one = write_eml(tmp_path / "1.eml", "Budget review", "Numbers for the interview loop")
+        two = write_eml(tmp_path / "2.eml", "Lunch", "Tacos?", sender="Bob <bob@example.com>")
+        assert index_messages(index, [(1, one), (2, two)]) == 2
+
+        counts = match_counts(index, ["budget", "interviews", "sarah"])
+        assert counts == {1: 2}
+
+    def test_prefix_and_case_insensitive(self, index, tmp_path, write_eml):
+        """Matching folds case and accepts word prefixes."""
+        index_messages(index, [(1, write_eml(tmp_path / "1.eml", "INTERVIEWS scheduled", ""))])
+        assert match_counts(index, ["interview"]) == {1: 1}
+
+    def test_already_indexed_skipped(self, index, tmp_path, write_eml):
+        """Messages are parsed and inserted only once."""
+        path = write_eml(tmp_path / "1.eml", "Hello", "World")
+        assert index_messages(index, [(1, path)]) == 1
+        assert index_messages(index, [(1, path)]) == 0
+        assert match_counts(index, ["hello"]) == {1: 1}
+
+    def test_missing_file_skipped(self, index, tmp_path, write_eml):
+        """Missing files are not indexed, so a later call can pick them up."""
+        path = tmp_path / "late.eml"
+        assert index_messages(index, [(1, path)]) == 0
+        write_eml(path, "Arrived", "")
+        assert index_messages(index, [(1, path)]) == 1
+
+    def test_syntax_characters_are_literal(self, index, tmp_path, write_eml):
+        """Search terms with FTS5 operators do not raise."""
+        index_messages(index, [(1, write_eml(tmp_path / "1.eml", "Q3 AND Q4", ""))])
+        assert match_counts(index, ["q3 AND", 'a"b', "-", ""]) == {1: 1}
+
+    def test_header_columns_only(self, index, tmp_path, write_eml):
+        """Restricting to HEADER_COLUMNS ignores names mentioned in the body."""
+        one = write_eml(tmp_path / "1.eml", "Hi", "Ask Bob about it")
+        two = write_eml(tmp_path / "2.eml", "Hi", "", sender="Bob <bob@example.com>")
+        index_messages(index, [(1, one), (2, two)])
+        assert match_counts(index, ["bob"]) == {1: 1, 2: 1}
+        assert match_counts(index, ["bob"], HEADER_COLUMNS) == {2: 1}